@@ -0,0 +1,337 @@
+import asyncio
+import bisect
+import datetime
+import operator
+from functools import reduce
+from dateutil.relativedelta import relativedelta, MO
+
+from django.db.models import Case, When, Value, IntegerField, F, Q
+from .models import MonthlyRollup, BalanceSnapshot, Income, Expense
+from .money import cents, from_cents, sum_cents
+
+KINDS = {
+  MonthlyRollup.INCOME: Income,
+  MonthlyRollup.EXPENSE: Expense,
+}
+
+"""
+Time buckets for the graph data
+"""
+
+SCALES = ('3y', '1y', '6m', '3m', '1m')
+
+# Bucket index given to rows older than the oldest bucket
+BEFORE_WINDOW = -1
+
+def get_label(scale, date:datetime.date):
+  label = ''
+  if (scale == '3y'):
+    label = f"{int((date.month-1)/3)}, {date.year}"
+  elif (scale == '1y'):
+    label = f"{date.month}, {date.year}"
+  elif (scale == '6m'):
+    label = f"{date.month}, {date.year}"
+  elif (scale == '3m'):
+    label = f"{date.day}, {date.month}, {date.year}"
+  elif (scale == '1m'):
+    label = f"{date.day}, {date.month}"
+  return label
+
+def get_buckets(scale, today:datetime.date):
+  """
+  Return the (start, end) date pairs of the graph buckets, newest first.
+  The first bucket ends today; every following bucket ends the day before
+  the previous one starts.
+  """
+  # Set interval and num iteration
+  interval = relativedelta(months=-1)
+  num_iteration = 5
+  start = today + relativedelta(day=1)
+  if (scale == '3y'):
+    interval = relativedelta(months=-3)
+    num_iteration = 11
+    quater = int((today.month-1) / 3)
+    start = today + relativedelta(month=(quater*3)+1, day=1)
+  elif (scale == '1y'):
+    interval = relativedelta(months=-2)
+    num_iteration = 5
+    start = today + relativedelta(months=-1, day=1)
+  elif (scale == '6m'):
+    pass
+  elif (scale == '3m'):
+    interval = relativedelta(weeks=-1)
+    num_iteration = 11
+    start = today + relativedelta(weekday=MO(-1))
+  elif (scale == '1m'):
+    interval = relativedelta(days=-1)
+    num_iteration = today.day - 1
+    start = today
+  else:
+    raise ValueError(f"Unknown scale: {scale}")
+
+  buckets = [(start, today)]
+  for i in range(num_iteration):
+    end = start + relativedelta(days=-1)
+    start = start + interval
+    buckets.append((start, end))
+  return buckets
+
+def bucket_sums(user, buckets, today:datetime.date):
+  """
+  Sum the incomes and expenses of the user per bucket, in cents.
+  Returns {kind: (sums, total)} where sums[i] is the sum of the i-th bucket
+  and total is the sum of every row up to today.
+
+  Whole months that fall into month-aligned buckets are the differences of
+  the balance snapshots around them, and the total before the window is
+  one more snapshot; the rest is read raw with one grouped query per
+  table, so neither the query count nor the rows read depend on the scale
+  or the length of the history.
+  """
+  snapshots, months, until, raw = bucket_queries(user, buckets, today)
+  return collect_bucket_sums(buckets, months, until, list(snapshots), {kind: list(rows) for kind, rows in raw.items()})
+
+def bucket_queries(user, buckets, today:datetime.date):
+  """
+  The queries behind bucket_sums: the snapshots, the bucket of each month
+  read from them, the index of the first month read raw, and the grouped
+  raw rows of each kind.
+  """
+  # Raw rows are needed from the first day of the current month, and from
+  # the month of every bucket that does not line up with whole months.
+  raw_from = today + relativedelta(day=1)
+  bucket_by_month = {}
+  for i, (start, end) in enumerate(buckets):
+    aligned = start.day == 1 and (i == 0 or (end + datetime.timedelta(days=1)).day == 1)
+    if aligned:
+      for index in range(month_index(start), month_index(end) + 1):
+        bucket_by_month[index] = i
+    else:
+      raw_from = min(raw_from, start + relativedelta(day=1))
+
+  # The totals before every month read from the snapshots, and before raw_from
+  until = month_index(raw_from)
+  months = {index: i for index, i in bucket_by_month.items() if index < until}
+  snapshots = snapshots_before(user, until, until - min(months, default=until) + 1)
+
+  bucket = Case(
+    *[When(date__gte=start, date__lte=end, then=Value(i)) for i, (start, end) in enumerate(buckets) if end >= raw_from],
+    default=Value(BEFORE_WINDOW),
+    output_field=IntegerField(),
+  )
+  raw = {
+    kind: (
+      model.objects.filter(user=user, date__gte=raw_from, date__lte=today)
+      .annotate(bucket=bucket)
+      .values('bucket')
+      .annotate(total=sum_cents('amount'))
+      .order_by()
+    )
+    for kind, model in KINDS.items()
+  }
+  return snapshots, months, until, raw
+
+def collect_bucket_sums(buckets, months, until, snapshots, raw):
+  # snapshots and raw are the rows of the bucket_queries results
+  balances = snapshot_balances(snapshots)
+  result = {}
+  for kind in KINDS:
+    sums = [0] * len(buckets)
+    for index, i in months.items():
+      sums[i] += balance_before(balances, index + 1)[kind] - balance_before(balances, index)[kind]
+    total = balance_before(balances, until)[kind]
+    for row in raw[kind]:
+      if row['bucket'] != BEFORE_WINDOW:
+        sums[row['bucket']] += row['total']
+      total += row['total']
+    result[kind] = (sums, total)
+  return result
+
+def net_income_series(scale, income_sums, expense_sums, buckets):
+  """
+  Net income of each bucket, oldest first, keyed by label. Sums are in
+  cents, the series in Decimal.
+  """
+  net_income_list = {}
+  for (start, end), income_sum, expense_sum in zip(buckets, income_sums, expense_sums):
+    net_income_list[get_label(scale, end)] = from_cents(income_sum - expense_sum)
+  return dict(reversed(list(net_income_list.items())))
+
+def money_flow_series(scale, income_sums, expense_sums, buckets, net_income_so_far, today:datetime.date):
+  """
+  Accumulated net income at the end of each bucket, oldest first, keyed by
+  label. Sums are in cents, the series in Decimal.
+  """
+  net_income_flow = {get_label(scale, today): from_cents(net_income_so_far)}
+  # The oldest bucket only opens the window; its start has no earlier end to label
+  for (start, end), income_sum, expense_sum in zip(buckets[:-1], income_sums, expense_sums):
+    net_income_so_far = net_income_so_far - (income_sum - expense_sum)
+    net_income_flow[get_label(scale, start + relativedelta(days=-1))] = from_cents(net_income_so_far)
+  return dict(reversed(list(net_income_flow.items())))
+
+"""
+Totals from the monthly rollups
+"""
+
+def month_index(date:datetime.date):
+  return date.year * 12 + date.month - 1
+
+def month_start(index):
+  return datetime.date(index // 12, index % 12 + 1, 1)
+
+def month_range(year, month):
+  """
+  Half-open [start, end) date range of a month, so that date filters stay
+  index range scans instead of functions on the column.
+  """
+  start = datetime.date(year, month, 1)
+  return start, start + relativedelta(months=1)
+
+def snapshots_before(user, last, count=1):
+  """
+  The count newest balance snapshots of the user up to month index last,
+  as (month, income, expense) rows in cents: one index range read.
+  """
+  return (
+    BalanceSnapshot.objects.filter(user=user, month__lte=month_start(last))
+    .order_by('-month')
+    .values_list('month', cents('income'), cents('expense'))[:count]
+  )
+
+def snapshot_balances(rows):
+  # (month index, {kind: total}) of the snapshot rows, oldest first
+  return sorted(
+    (month_index(month), dict(zip(BalanceSnapshot.KIND_FIELDS, totals)))
+    for month, *totals in rows
+  )
+
+def balance_before(balances, index):
+  """
+  The totals of the rows dated before month index: those of the nearest
+  snapshot up to it. Snapshots run from the oldest row of the user to the
+  month after the newest, so there is none before the first row.
+  """
+  i = bisect.bisect_right(balances, index, key=operator.itemgetter(0))
+  return balances[i - 1][1] if i else dict.fromkeys(KINDS, 0)
+
+def rollup_months(user, first, last):
+  """
+  Rollups of the user from month index first to last, both included.
+  None for first means since the beginning.
+  """
+  rollups = MonthlyRollup.objects.filter(user=user).alias(index=F('year') * 12 + F('month') - 1)
+  if first is not None:
+    rollups = rollups.filter(index__gte=first)
+  return rollups.filter(index__lte=last)
+
+def range_totals(user, start, end, kinds=KINDS):
+  """
+  Income and expense totals of the user from start to end, both included,
+  in cents as {kind: total}. None for start means since the beginning.
+
+  The whole months of the range are read from the rollups, or from one
+  balance snapshot when the range starts at the beginning, and only the
+  partial months at its edges are summed from the raw rows.
+  """
+  rollups, snapshot, raw = range_queries(user, start, end, kinds)
+  return collect_range_totals(
+    kinds,
+    [] if rollups is None else list(rollups),
+    [] if snapshot is None else list(snapshot),
+    {kind: rows.aggregate(total=sum_cents('amount'))['total'] for kind, rows in raw.items()},
+  )
+
+def range_queries(user, start, end, kinds=KINDS):
+  """
+  The queries behind range_totals: the rollups grouped by kind or the
+  snapshot before the range's last whole month (None when not needed),
+  and the raw rows of each kind to sum.
+  """
+  first = None if start is None else month_index(start) + (start.day != 1)
+  last = month_index(end + datetime.timedelta(days=1)) - 1
+  rollups = snapshot = None
+  if first is None:
+    snapshot = snapshots_before(user, last + 1)
+    edges = []
+    if end >= month_start(last + 1):
+      edges.append(Q(date__gte=month_start(last + 1), date__lte=end))
+  elif first > last:
+    edges = [Q(date__gte=start, date__lte=end)]
+  else:
+    rollups = rollup_months(user, first, last).filter(kind__in=kinds).values('kind').annotate(total=sum_cents('total')).order_by()
+    edges = []
+    if start < month_start(first):
+      edges.append(Q(date__gte=start, date__lt=month_start(first)))
+    if end >= month_start(last + 1):
+      edges.append(Q(date__gte=month_start(last + 1), date__lte=end))
+
+  raw = {}
+  if edges:
+    condition = reduce(operator.or_, edges)
+    raw = {kind: KINDS[kind].objects.filter(condition, user=user) for kind in kinds}
+  return rollups, snapshot, raw
+
+def collect_range_totals(kinds, rollups, snapshot, sums):
+  # rollups and snapshot are the rows of their queries, sums the raw sum of each kind
+  totals = {kind: 0 for kind in kinds}
+  for row in rollups:
+    totals[row['kind']] += row['total']
+  for month, balance in snapshot_balances(snapshot):
+    for kind in kinds:
+      totals[kind] += balance[kind]
+  for kind, total in sums.items():
+    if total:
+      totals[kind] += total
+  return totals
+
+"""
+Async counterparts, for the views served under ASGI: the same queries,
+the independent ones awaited together
+"""
+
+async def alist(queryset):
+  # None for a query that is not needed
+  if queryset is None:
+    return []
+  return [row async for row in queryset]
+
+async def asum(queryset):
+  return (await queryset.aaggregate(total=sum_cents('amount')))['total']
+
+async def abucket_sums(user, buckets, today:datetime.date):
+  snapshots, months, until, raw = bucket_queries(user, buckets, today)
+  kinds = list(raw)
+  snapshot_rows, *raw_rows = await asyncio.gather(alist(snapshots), *(alist(raw[kind]) for kind in kinds))
+  return collect_bucket_sums(buckets, months, until, snapshot_rows, dict(zip(kinds, raw_rows)))
+
+async def arange_totals(user, start, end, kinds=KINDS):
+  rollups, snapshot, raw = range_queries(user, start, end, kinds)
+  rollup_rows, snapshot_rows, *sums = await asyncio.gather(alist(rollups), alist(snapshot), *(asum(rows) for rows in raw.values()))
+  return collect_range_totals(kinds, rollup_rows, snapshot_rows, dict(zip(raw, sums)))
+
+"""
+Category statistics for the income and expense lists
+"""
+
+def category_stat(rollups, choices):
+  """
+  Share of each category in the rollups, in percent, from one grouped query.
+  """
+  partial_sums = {
+    row['category']: row['sum']
+    for row in rollups.values('category').annotate(sum=sum_cents('total')).order_by()
+  }
+  return category_shares(partial_sums, choices)
+
+def category_shares(partial_sums, choices):
+  # partial_sums maps each category to its total in cents, so the share is
+  # one division of ints
+  total_amount = sum(partial_sums.values())
+  stat = {}
+  for choice in choices:
+    partial_sum = partial_sums.get(choice[0])
+    if partial_sum:
+      stat[choice[0]] = round(partial_sum / total_amount, 3) * 100.0
+    else:
+      stat[choice[0]] = 0.0
+  return stat
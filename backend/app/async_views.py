@@ -0,0 +1,115 @@
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+from .models import User, MonthlyRollup
+from . import analytics, authentication, caching, metrics, views
+from .money import from_cents
+
+"""
+Async analytics views
+
+They replace the APIViews of the same name when the project is served
+under ASGI (see backend/asgi.py), with the same JSON, ETags and cache
+entries, but await the ORM instead of holding a worker thread, and run
+the independent income and expense queries together.
+"""
+
+def render(data, status_code=status.HTTP_200_OK):
+  # The same JSON as DRF's JSONRenderer
+  with metrics.serializing():
+    response = JsonResponse(
+      data,
+      status=status_code,
+      encoder=JSONEncoder,
+      safe=False,
+      json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+  # What caching.cached_response keeps, like DRF's Response.data
+  response.data = data
+  return response
+
+class AsyncAnalyticsView(View):
+  # The ETags and cache entries come from the decorators of the APIViews
+  # (caching.conditional and caching.cached_response), which await an
+  # async get()
+
+  @classmethod
+  def as_view(cls, **initkwargs):
+    view = super().as_view(**initkwargs)
+    # Like the APIViews: only session authentication needs CSRF checks
+    view.csrf_exempt = True
+    return view
+
+  async def dispatch(self, request, *args, **kwargs):
+    # Bearer tokens, as for the APIViews
+    try:
+      await authentication.aauthenticate(request)
+    except AuthenticationFailed as e:
+      response = render({'detail': e.detail}, e.status_code)
+      response['WWW-Authenticate'] = authentication.JWTAuthentication.keyword
+      return response
+    return await super().dispatch(request, *args, **kwargs)
+
+class NetIncome(AsyncAnalyticsView):
+  @caching.conditional(caching.auser_marker())
+  @caching.cached_response('netIncome', {'year': None, 'month': None, 'day': None}, response_class=render)
+  async def get(self, request, pk, format=None):
+    today = datetime.date(int(request.GET.get('year')), int(request.GET.get('month')), int(request.GET.get('day')))
+    totals = await analytics.arange_totals(pk, None, today)
+    return render({'net_income': from_cents(totals[MonthlyRollup.INCOME] - totals[MonthlyRollup.EXPENSE])})
+
+class GraphDataDetail(AsyncAnalyticsView):
+  @caching.conditional(caching.auser_marker(daily=True))
+  @caching.cached_response('graphData', {'scale': '6m'}, daily=True, response_class=render)
+  async def get(self, request, pk, format=None):
+    scale = request.GET.get('scale', None) or '6m'
+    if scale not in analytics.SCALES:
+      return render({'scale': f"Unknown scale: {scale}"}, status.HTTP_400_BAD_REQUEST)
+
+    today = datetime.date.today()
+    buckets = analytics.get_buckets(scale, today)
+    sums = await analytics.abucket_sums(pk, buckets, today)
+    income_sums, income_total = sums[MonthlyRollup.INCOME]
+    expense_sums, expense_total = sums[MonthlyRollup.EXPENSE]
+
+    net_income_flow = analytics.money_flow_series(scale, income_sums, expense_sums, buckets, income_total - expense_total, today)
+    net_income_list = analytics.net_income_series(scale, income_sums, expense_sums, buckets)
+    return render({'net_income_flow': net_income_flow, 'net_income_list': net_income_list})
+
+class UserBudgetDetail(AsyncAnalyticsView):
+  @caching.conditional(caching.auser_marker(daily=True))
+  @caching.cached_response('budget', {'incomeGoal': None, 'expenseBudget': None}, daily=True, response_class=render)
+  async def get(self, request, pk, format=None):
+    user = await User.objects.filter(pk=pk).only('income_goal', 'expense_budget').afirst()
+    if user is None:
+      return render({'detail': "Not found."}, status.HTTP_404_NOT_FOUND)
+    income_goal = request.GET.get('incomeGoal', None)
+    expense_budget = request.GET.get('expenseBudget', None)
+
+    # Both totals of this month at once
+    kinds = []
+    if income_goal:
+      kinds.append(MonthlyRollup.INCOME)
+    if expense_budget:
+      kinds.append(MonthlyRollup.EXPENSE)
+    today = datetime.date.today()
+    this_month = datetime.date(year=today.year, month=today.month, day=1)
+    totals = await analytics.arange_totals(pk, this_month, today, kinds) if kinds else {}
+
+    ret = {}
+    if income_goal:
+      ret['income_goal'] = user.income_goal
+      ret['monthly_total_income'] = from_cents(totals[MonthlyRollup.INCOME])
+    if expense_budget:
+      ret['expense_budget'] = user.expense_budget
+      ret['monthly_total_expense'] = from_cents(totals[MonthlyRollup.EXPENSE])
+    return render(ret)
+
+  # Updates go through the APIView
+  async def put(self, request, *args, **kwargs):
+    return await sync_to_async(views.UserBudgetDetail.as_view())(request, *args, **kwargs)
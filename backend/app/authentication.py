@@ -0,0 +1,222 @@
+import hashlib
+import json
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from .models import User
+
+"""
+Bearer token authentication
+
+JWTAuthentication checks the JWT of an "Authorization: Bearer" header
+locally: its signature against the keys published at JWT_JWKS_URL, its
+issuer, audience and expiry. Tokens are refused unless the three
+JWT_JWKS_URL, JWT_ISSUER and JWT_AUDIENCE settings are set. The user is
+the one whose email is the token's JWT_USER_CLAIM.
+
+The keys are fetched once per process, and again only when a token names
+a key id they don't have, as after the provider rotates its keys (at most
+once per JWT_JWKS_REFRESH_INTERVAL, so that made-up key ids don't hammer
+it). The claims of the last JWT_CACHE_SIZE tokens are kept, keyed by the
+SHA-256 of the token, so a token seen before is checked without any
+cryptography: an authenticated request reads the user, and neither the
+session table nor the network.
+
+PyJWT is imported on first use (see benchmarks/startup.py).
+"""
+
+class KeySet:
+  """
+  The signing keys of JWT_JWKS_URL by key id.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    self.url = None
+    self.keys = {}
+    # time.monotonic() of the last fetch
+    self.fetched = None
+
+  def fetch(self, url):
+    import jwt
+    with urllib.request.urlopen(url, timeout=5) as response:
+      data = json.load(response)
+    keys = {}
+    for jwk in data.get('keys', []):
+      try:
+        key = jwt.PyJWK(jwk)
+      except jwt.PyJWTError:
+        # e.g. encryption keys, or an algorithm PyJWT lacks
+        continue
+      keys[key.key_id] = key.key
+    return keys
+
+  def get(self, kid):
+    url = settings.JWT_JWKS_URL
+    if url == self.url and kid in self.keys:
+      return self.keys[kid]
+    with self.lock:
+      if url != self.url:
+        self.clear()
+        self.url = url
+      # Fetched by another thread meanwhile, or too recently to try again
+      if kid in self.keys:
+        return self.keys[kid]
+      now = time.monotonic()
+      if self.fetched is not None and now - self.fetched < settings.JWT_JWKS_REFRESH_INTERVAL:
+        return None
+      self.fetched = now
+      try:
+        self.keys = self.fetch(url)
+      except (OSError, ValueError):
+        # Keep the keys we have, and try again after the interval
+        raise AuthenticationFailed("The signing keys are unavailable.")
+      return self.keys.get(kid)
+
+class ClaimsCache:
+  """
+  A bounded LRU of decoded claims by token digest.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.entries = OrderedDict()
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+  def get(self, digest):
+    with self.lock:
+      claims = self.entries.get(digest)
+      if claims is not None:
+        self.entries.move_to_end(digest)
+      return claims
+
+  def set(self, digest, claims):
+    with self.lock:
+      self.entries[digest] = claims
+      self.entries.move_to_end(digest)
+      while len(self.entries) > settings.JWT_CACHE_SIZE:
+        self.entries.popitem(last=False)
+
+  def pop(self, digest):
+    with self.lock:
+      self.entries.pop(digest, None)
+
+key_set = KeySet()
+claims_cache = ClaimsCache()
+
+def decode(token):
+  """
+  The claims of a token, checked against the key set. Raises
+  AuthenticationFailed.
+  """
+  import jwt
+  # Without them any token of the tenant, for any API, would do
+  missing = [name for name in ('JWT_JWKS_URL', 'JWT_ISSUER', 'JWT_AUDIENCE') if not getattr(settings, name)]
+  if missing:
+    raise AuthenticationFailed(f"Bearer tokens are not accepted: {', '.join(missing)} not configured.")
+  try:
+    header = jwt.get_unverified_header(token)
+  except jwt.PyJWTError:
+    raise AuthenticationFailed("Invalid token.")
+  key = key_set.get(header.get('kid'))
+  if key is None:
+    raise AuthenticationFailed("Unknown signing key.")
+  try:
+    return jwt.decode(
+      token,
+      key,
+      algorithms=settings.JWT_ALGORITHMS,
+      issuer=settings.JWT_ISSUER,
+      audience=settings.JWT_AUDIENCE,
+      options={'require': ['exp', 'iss', 'aud']},
+    )
+  except jwt.ExpiredSignatureError:
+    raise AuthenticationFailed("Token has expired.")
+  except jwt.PyJWTError as e:
+    raise AuthenticationFailed(f"Invalid token: {e}")
+
+def token_digest(token):
+  return hashlib.sha256(token.encode()).digest()
+
+def cached_claims(digest):
+  # The claims of a token decoded before, unless it has expired since
+  claims = claims_cache.get(digest)
+  if claims is not None and claims['exp'] <= time.time():
+    claims_cache.pop(digest)
+    raise AuthenticationFailed("Token has expired.")
+  return claims
+
+def claims(token):
+  digest = token_digest(token)
+  cached = cached_claims(digest)
+  if cached is not None:
+    return cached
+  decoded = decode(token)
+  claims_cache.set(digest, decoded)
+  return decoded
+
+def bearer_token(request):
+  """
+  The token of the request's Authorization header, or None when it has
+  none or another scheme.
+  """
+  header = get_authorization_header(request).split()
+  if not header or header[0].lower() != b'bearer':
+    return None
+  if len(header) != 2:
+    raise AuthenticationFailed("Invalid Authorization header.")
+  try:
+    return header[1].decode('ascii')
+  except UnicodeError:
+    raise AuthenticationFailed("Invalid Authorization header.")
+
+def users(claims):
+  # The user of the claims, as a queryset
+  value = claims.get(settings.JWT_USER_CLAIM)
+  if not value:
+    raise AuthenticationFailed(f"The token has no {settings.JWT_USER_CLAIM} claim.")
+  return User.objects.filter(email=value)
+
+def check_user(user):
+  if user is None or not user.is_active:
+    raise AuthenticationFailed("User inactive or deleted.")
+  return user
+
+class JWTAuthentication(BaseAuthentication):
+  keyword = 'Bearer'
+
+  def authenticate(self, request):
+    token = bearer_token(request)
+    if token is None:
+      return None
+    decoded = claims(token)
+    return check_user(users(decoded).first()), decoded
+
+  def authenticate_header(self, request):
+    # Failures are 401 with this challenge, rather than 403
+    return self.keyword
+
+async def aauthenticate(request):
+  """
+  JWTAuthentication for the async views: sets request.user and
+  request.auth when the request has a bearer token.
+  """
+  token = bearer_token(request)
+  if token is None:
+    return
+  decoded = cached_claims(token_digest(token))
+  if decoded is None:
+    # May fetch the keys
+    decoded = await sync_to_async(claims)(token)
+  request.user = check_user(await users(decoded).afirst())
+  request.auth = decoded
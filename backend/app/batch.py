@@ -0,0 +1,132 @@
+import datetime
+
+from django.db import transaction
+from .models import User, MonthlyRollup
+from .importers import RowValidator
+from .signals import bulk_delete
+from .serializers import income_values, expense_values
+
+"""
+Batch writes of incomes and expenses
+
+A batch is a list of operations:
+  {"op": "create", "data": {...}}
+  {"op": "patch", "id": 1, "data": {...}}
+  {"op": "delete", "id": 1}
+The whole batch is validated first, with the row validator of the
+importer, and is then applied in one transaction with one bulk_create,
+one bulk_update and one delete, or not at all when any operation is
+invalid. The result of each operation is reported in order.
+"""
+
+MAX_OPERATIONS = 1000
+
+OPERATIONS = ('create', 'patch', 'delete')
+
+def is_id(value):
+  # JSON ids are ints, and True is not one
+  return isinstance(value, int) and not isinstance(value, bool)
+
+class Batch:
+  def __init__(self, model, user_id, today=None):
+    self.model = model
+    self.user_id = user_id
+    self.validator = RowValidator(model, user_id, today or datetime.date.today())
+    self.values = income_values if model.rollup_kind == MonthlyRollup.INCOME else expense_values
+    self.fields = [name for name in self.values.fields if name not in ('id', 'user')]
+
+  def validate(self, operations):
+    """
+    Check every operation. Returns the planned writes (creates, updates
+    as (previous, new) pairs, and deletes) and the result of each
+    operation; the plan is None when any operation is invalid.
+    """
+    ids = [op.get('id') for op in operations if isinstance(op, dict) and op.get('op') in ('patch', 'delete')]
+    ids = [pk for pk in ids if is_id(pk)]
+    # Locked until the batch is applied
+    existing = {obj.pk: obj for obj in self.model.objects.select_for_update().filter(user=self.user_id, pk__in=ids)}
+
+    creates, updates, deletes = [], [], []
+    results = []
+    seen = set()
+    valid = True
+    for index, op in enumerate(operations):
+      result, errors = {'index': index}, None
+      name = op.get('op') if isinstance(op, dict) else None
+      data = op.get('data', {}) if isinstance(op, dict) else None
+      result['op'] = name
+      if name not in OPERATIONS:
+        errors = {'op': f'"{name}" is not a valid choice.'}
+      elif name != 'delete' and not isinstance(data, dict):
+        errors = {'data': "Expected an object of fields."}
+      elif name == 'create':
+        obj, errors = self.validator.validate(data)
+        if obj is not None:
+          creates.append((result, obj))
+      else:
+        pk = op.get('id')
+        result['id'] = pk
+        if not is_id(pk):
+          errors = {'id': "A valid integer is required."}
+        elif pk not in existing:
+          errors = {'id': "Not found."}
+        elif pk in seen:
+          errors = {'id': "Already changed by this batch."}
+        elif name == 'delete':
+          deletes.append((result, existing[pk]))
+        else:
+          obj, errors = self.validator.validate(data, instance=existing[pk])
+          if obj is not None:
+            obj.pk = pk
+            updates.append((result, existing[pk], obj))
+        if is_id(pk):
+          seen.add(pk)
+
+      if errors:
+        valid = False
+        result['status'] = 400
+        result['errors'] = errors
+      results.append(result)
+    return ((creates, updates, deletes) if valid else None), results
+
+  def apply(self, operations):
+    """
+    Validate and apply the batch. Returns whether it was applied, and the
+    result of each operation.
+    """
+    with transaction.atomic():
+      plan, results = self.validate(operations)
+      if plan is None:
+        return False, results
+      creates, updates, deletes = plan
+
+      if creates:
+        objs = self.model.objects.bulk_create([obj for result, obj in creates])
+        MonthlyRollup.objects.apply_all(objs)
+        for (result, ignored), obj in zip(creates, objs):
+          result.update(status=201, id=obj.pk, data=self.values.to_representation(self.values.row(obj)))
+
+      if updates:
+        # Only the columns some operation changes
+        fields = [
+          name for name in self.fields + self.model.schedule_fields
+          if any(getattr(obj, name) != getattr(previous, name) for result, previous, obj in updates)
+        ]
+        if fields:
+          self.model.objects.bulk_update([obj for result, previous, obj in updates], fields)
+        MonthlyRollup.objects.apply_all([previous for result, previous, obj in updates], -1)
+        MonthlyRollup.objects.apply_all([obj for result, previous, obj in updates])
+        for result, previous, obj in updates:
+          result.update(status=200, data=self.values.to_representation(self.values.row(obj)))
+
+      if deletes:
+        # One rollup update per month and category instead of one per row
+        with bulk_delete():
+          self.model.objects.filter(pk__in=[obj.pk for result, obj in deletes]).delete()
+        MonthlyRollup.objects.apply_all([obj for result, obj in deletes], -1)
+        for result, obj in deletes:
+          result['status'] = 204
+
+      User.bump_data_version([self.user_id])
+    return True, results
+
@@ -0,0 +1,249 @@
+import datetime
+import hashlib
+import threading
+from collections import Counter
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+from .models import User
+
+"""
+Per-user cache of the analytics results
+
+Entries are keyed by (endpoint, user, normalized params, data version).
+Every write to a user or their incomes and expenses bumps
+User.data_version, so the entries of older versions are never read again
+and age out of the cache by its TIMEOUT and MAX_ENTRIES settings instead
+of being invalidated.
+"""
+
+CACHE_ALIAS = getattr(settings, 'ANALYTICS_CACHE', 'analytics')
+
+MISSING = object()
+
+_lock = threading.Lock()
+_counters = Counter()
+
+def get_cache():
+  return caches[CACHE_ALIAS]
+
+def data_version(user_id, request=None):
+  # None when the user does not exist. With a request, it is read once for
+  # the ETag and the cache key.
+  versions = getattr(request, '_data_versions', None)
+  if versions is not None and user_id in versions:
+    return versions[user_id]
+  version = User.objects.filter(pk=user_id).values_list('data_version', flat=True).first()
+  if request is not None:
+    if versions is None:
+      versions = request._data_versions = {}
+    versions[user_id] = version
+  return version
+
+async def adata_version(user_id, request=None):
+  versions = getattr(request, '_data_versions', None)
+  if versions is not None and user_id in versions:
+    return versions[user_id]
+  version = await User.objects.filter(pk=user_id).values_list('data_version', flat=True).afirst()
+  if request is not None:
+    if versions is None:
+      versions = request._data_versions = {}
+    versions[user_id] = version
+  return version
+
+def make_key(endpoint, user_id, version, params):
+  query = urlencode(sorted((name, str(value)) for name, value in params.items() if value is not None))
+  # Hashed so that any parameter value makes a short key that is valid
+  # for every cache backend
+  digest = hashlib.md5(query.encode('utf-8')).hexdigest()
+  return f"{endpoint}:{user_id}:{version}:{digest}"
+
+def count(endpoint, hit):
+  with _lock:
+    _counters[endpoint, 'hits' if hit else 'misses'] += 1
+
+def stats():
+  # Hits and misses of this process per endpoint
+  with _lock:
+    result = {}
+    for (endpoint, outcome), value in _counters.items():
+      result.setdefault(endpoint, {'hits': 0, 'misses': 0})[outcome] = value
+    return result
+
+def reset_stats():
+  with _lock:
+    _counters.clear()
+
+def get_or_set(endpoint, user_id, params, compute, request=None):
+  """
+  Result of compute() for the current data of the user, from the cache
+  when it was already computed for the same params.
+  """
+  version = data_version(user_id, request)
+  if version is None:
+    return compute()
+  cache = get_cache()
+  key = make_key(endpoint, user_id, version, params)
+  value = cache.get(key, MISSING)
+  count(endpoint, value is not MISSING)
+  if value is MISSING:
+    value = compute()
+    cache.set(key, value)
+  return value
+
+def key_params(query, params, daily=False):
+  # The normalized values of the params (name: default) in a QueryDict
+  values = {}
+  for name, default in params.items():
+    value = query.get(name, '').strip()
+    values[name] = value or default
+  if daily:
+    values['today'] = datetime.date.today().isoformat()
+  return values
+
+def cached_response(endpoint, params=None, daily=False, response_class=Response):
+  """
+  Cache the data of the successful responses of an APIView get(self,
+  request, pk) method. params maps the query parameters the response
+  depends on to their default value. daily views depend on today's date
+  as well.
+
+  The get() of an async view is awaited, and the cache with it. Its
+  responses need a .data attribute, and response_class(data) builds them
+  from cached data.
+  """
+  params = params or {}
+
+  def decorator(get):
+    def key(request, pk, version):
+      return make_key(endpoint, pk, version, key_params(request.GET, params, daily))
+
+    def hit(data):
+      response = response_class(data)
+      response['X-Cache'] = 'HIT'
+      return response
+
+    if iscoroutinefunction(get):
+      @wraps(get)
+      async def async_wrapper(self, request, pk, format=None):
+        version = await adata_version(pk, request)
+        if version is None:
+          return await get(self, request, pk, format)
+        cache = get_cache()
+        name = key(request, pk, version)
+        data = await cache.aget(name, MISSING)
+        count(endpoint, data is not MISSING)
+        if data is not MISSING:
+          return hit(data)
+
+        response = await get(self, request, pk, format)
+        if response.status_code == 200:
+          await cache.aset(name, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+      return async_wrapper
+
+    @wraps(get)
+    def wrapper(self, request, pk, format=None):
+      version = data_version(pk, request)
+      if version is None:
+        return get(self, request, pk, format)
+      cache = get_cache()
+      name = key(request, pk, version)
+      data = cache.get(name, MISSING)
+      count(endpoint, data is not MISSING)
+      if data is not MISSING:
+        return hit(data)
+
+      response = get(self, request, pk, format)
+      if response.status_code == 200:
+        cache.set(name, response.data)
+      response['X-Cache'] = 'MISS'
+      return response
+    return wrapper
+  return decorator
+
+"""
+Conditional GET
+
+The ETag of a response is a hash of the request and of a cheap marker of
+the data behind it, mostly the user's data version. It is computed before
+the view runs, so an unchanged refetch costs that one lookup and gets an
+empty 304 response.
+"""
+
+def make_etag(request, *markers):
+  parts = [request.path, request.META.get('QUERY_STRING', ''), request.META.get('HTTP_ACCEPT', '')]
+  parts += [str(marker) for marker in markers]
+  return quote_etag(hashlib.md5('\n'.join(parts).encode('utf-8')).hexdigest())
+
+def conditional(marker):
+  """
+  Answer If-None-Match on a view's get method. marker(request, *args,
+  **kwargs) returns what the response depends on besides the request, or
+  None when it can't tell (e.g. a missing object). The marker of an async
+  get() is awaited (see auser_marker).
+  """
+  def decorator(get):
+    def check(request, value):
+      # The ETag, and the 304 response when it matches
+      etag = None if value is None else make_etag(request, value)
+      return etag, (None if etag is None else get_conditional_response(request, etag=etag))
+
+    def finish(response, etag):
+      if etag is not None and response.status_code == 200:
+        response['ETag'] = etag
+        # Per-user data: revalidate every time, never share
+        patch_cache_control(response, private=True, no_cache=True)
+      return response
+
+    if iscoroutinefunction(get):
+      @wraps(get)
+      async def async_wrapper(self, request, *args, **kwargs):
+        etag, response = check(request, await marker(request, *args, **kwargs))
+        if response is not None:
+          return response
+        return finish(await get(self, request, *args, **kwargs), etag)
+      return async_wrapper
+
+    @wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+      etag, response = check(request, marker(request, *args, **kwargs))
+      if response is not None:
+        return response
+      return finish(get(self, request, *args, **kwargs), etag)
+    return wrapper
+  return decorator
+
+def version_marker(version, daily=False):
+  if version is None:
+    return None
+  return f"{version}:{datetime.date.today().isoformat()}" if daily else version
+
+def user_marker(daily=False):
+  # Views of one user's data, the ones relative to today's date included
+  def marker(request, pk, *args, **kwargs):
+    return version_marker(data_version(pk, request), daily)
+  return marker
+
+def auser_marker(daily=False):
+  async def marker(request, pk, *args, **kwargs):
+    return version_marker(await adata_version(pk, request), daily)
+  return marker
+
+def owner_marker(model):
+  # Views of one income or expense: the data version of its owner
+  def marker(request, pk, *args, **kwargs):
+    return model.objects.filter(pk=pk).values_list('user__data_version', flat=True).first()
+  return marker
+
+def users_marker(request, *args, **kwargs):
+  # Any write to any user moves the newest version on, read from the index
+  return User.objects.aggregate(newest=Max('data_version'))['newest']
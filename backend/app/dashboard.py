@@ -0,0 +1,182 @@
+import bisect
+import datetime
+import operator
+from functools import reduce
+
+from django.db.models import Q
+from .models import Income, Expense, MonthlyRollup
+from .serializers import income_values, expense_values
+from .money import cents, from_cents
+from . import analytics, recurrence
+
+"""
+Dashboard
+
+Every section is derived from one snapshot of the user's data, read with
+a fixed number of queries: the monthly rollups, and the incomes and
+expenses dated from the first month of the window on, plus the recurring
+expenses that may fall due soon. Amounts are summed in cents.
+"""
+
+SECTIONS = ['netIncome', 'graphData', 'budget', 'upcomingExpenses', 'incomes', 'expenses']
+
+# Days covered by the upcoming expenses, as in UpcomingExpenses
+UPCOMING_DAYS = 30
+
+LEDGERS = {
+  'incomes': (MonthlyRollup.INCOME, Income, income_values),
+  'expenses': (MonthlyRollup.EXPENSE, Expense, expense_values),
+}
+
+KIND_VALUES = {kind: values for kind, model, values in LEDGERS.values()}
+
+SCHEDULE_FIELDS = ['interval_years', 'interval_months', 'interval_days']
+
+class Snapshot:
+  """
+  The data of one user the dashboard sections read. Raw rows are
+  values_list() tuples: the fields of the list serializer, then the
+  parsed interval.
+  """
+  def __init__(self, user, sections, scale, page_size, today:datetime.date):
+    self.user = user
+    self.today = today
+    self.until = today + datetime.timedelta(days=UPCOMING_DAYS)
+    self.buckets = analytics.get_buckets(scale, today) if 'graphData' in sections else None
+
+    # The window starts on the first day of the oldest month read raw
+    self.window_start = today.replace(day=1)
+    if self.buckets:
+      self.window_start = min(self.window_start, self.buckets[-1][0].replace(day=1))
+    self.first_month = analytics.month_index(self.window_start)
+
+    self.rollups = []
+    if set(sections) & {'netIncome', 'graphData', 'incomes', 'expenses'}:
+      self.rollups = list(
+        MonthlyRollup.objects.filter(user=user).values_list('kind', 'year', 'month', 'category', cents('total'), 'count')
+      )
+
+    totals = bool(set(sections) & {'netIncome', 'graphData', 'budget'})
+    self.rows = {}
+    for name, (kind, model, values) in LEDGERS.items():
+      conditions = []
+      if totals:
+        conditions.append(Q(date__gte=self.window_start))
+      if name in sections:
+        # The first page of the list, however old its rows are
+        newest = model.objects.filter(user=user).order_by('-date', '-id').values('pk')[:page_size]
+        conditions.append(Q(pk__in=newest))
+      if name == 'expenses' and 'upcomingExpenses' in sections:
+        # The range the UpcomingExpenses view reads
+        conditions.append(Q(type=True, next_due__lte=self.until))
+      rows = []
+      if conditions:
+        condition = reduce(operator.or_, conditions)
+        rows = list(values.values_list(model.objects.filter(condition, user=user).order_by('-date', '-id'), *SCHEDULE_FIELDS))
+      self.rows[kind] = rows
+
+  def window_rows(self, kind, start=None, end=None):
+    # Raw rows of the window dated from start to end, both included
+    date = KIND_VALUES[kind].index('date')
+    start = start or self.window_start
+    end = end or datetime.date.max
+    return [row for row in self.rows[kind] if start <= row[date] <= end]
+
+  def rollups_before_window(self, kind):
+    return [row for row in self.rollups if row[0] == kind and row[1] * 12 + row[2] - 1 < self.first_month]
+
+  def totals(self, start=None, end=None):
+    # Sum of the rows of each kind from start to end within the window, and
+    # of every month before the window when start is None
+    result = {}
+    for kind, values in KIND_VALUES.items():
+      amount = values.index('amount')
+      result[kind] = sum(row[amount] for row in self.window_rows(kind, start, end))
+      if start is None:
+        result[kind] += sum(row[4] for row in self.rollups_before_window(kind))
+    return result
+
+  """
+  Sections, each with the response data of its own endpoint
+  """
+
+  def net_income(self):
+    totals = self.totals(end=self.today)
+    return {'net_income': from_cents(totals[MonthlyRollup.INCOME] - totals[MonthlyRollup.EXPENSE])}
+
+  def graph_data(self, scale):
+    buckets = self.buckets
+    # Bucket starts, oldest first, to find the bucket of each date
+    starts = [start for start, end in reversed(buckets)]
+    sums = {}
+    for kind, values in KIND_VALUES.items():
+      date, amount = values.index('date'), values.index('amount')
+      kind_sums = [0] * len(buckets)
+      for row in self.window_rows(kind, buckets[-1][0], self.today):
+        kind_sums[len(buckets) - bisect.bisect_right(starts, row[date])] += row[amount]
+      sums[kind] = kind_sums
+
+    totals = self.totals(end=self.today)
+    income_sums, expense_sums = sums[MonthlyRollup.INCOME], sums[MonthlyRollup.EXPENSE]
+    net_income_so_far = totals[MonthlyRollup.INCOME] - totals[MonthlyRollup.EXPENSE]
+    return {
+      'net_income_flow': analytics.money_flow_series(scale, income_sums, expense_sums, buckets, net_income_so_far, self.today),
+      'net_income_list': analytics.net_income_series(scale, income_sums, expense_sums, buckets),
+    }
+
+  def budget(self):
+    totals = self.totals(self.today.replace(day=1), self.today)
+    return {
+      'income_goal': self.user.income_goal,
+      'monthly_total_income': from_cents(totals[MonthlyRollup.INCOME]),
+      'expense_budget': self.user.expense_budget,
+      'monthly_total_expense': from_cents(totals[MonthlyRollup.EXPENSE]),
+    }
+
+  def upcoming_expenses(self):
+    date = expense_values.index('date')
+    type = expense_values.index('type')
+    count = len(expense_values.fields)
+    upcoming = []
+    for row in self.rows[MonthlyRollup.EXPENSE]:
+      if not row[type]:
+        continue
+      due = recurrence.next_occurrence(row[date], row[count:], self.today)
+      if due is not None and due <= self.until:
+        row = list(row[:count])
+        row[date] = due
+        upcoming.append(row)
+    upcoming.sort(key=lambda row: row[date])
+    return expense_values.data(upcoming)
+
+  def ledger(self, name, page_size, next_link):
+    """
+    First page of the list, newest first, with the category shares of
+    every row. next_link(cursor) gives the URL of the following page.
+    """
+    kind, model, values = LEDGERS[name]
+    count = len(values.fields)
+    # Rows are ordered newest first and hold the newest page_size rows
+    page = [row[:count] for row in self.rows[kind][:page_size]]
+    total = sum(row[5] for row in self.rollups if row[0] == kind)
+    next = next_link(values.getter('date', 'id')(page[-1])) if total > page_size else None
+
+    partial_sums = {}
+    for row_kind, year, month, category, amount, row_count in self.rollups:
+      if row_kind == kind:
+        partial_sums[category] = partial_sums.get(category, 0) + amount
+    stat = analytics.category_shares(partial_sums, model._meta.get_field(model.rollup_category).choices)
+    return {'list': values.data(page), 'stat': stat, 'next': next}
+
+def parse_sections(value):
+  """
+  The sections asked for by a sections= parameter, in SECTIONS order.
+  Raises ValueError on an unknown section.
+  """
+  if not value:
+    return list(SECTIONS)
+  names = [name for name in value.split(',') if name]
+  unknown = [name for name in names if name not in SECTIONS]
+  if unknown:
+    raise ValueError(f"Unknown section(s): {', '.join(unknown)}")
+  return [name for name in SECTIONS if name in names]
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+"""
+Database connections
+
+The SQLite profile tunes every new connection with PRAGMAs (see
+DATABASE_PROFILE in settings.py). journal_mode is stored in the database
+file, the others only last as long as the connection, which is why they
+pair with CONN_MAX_AGE.
+"""
+
+def pragma_statements(pragmas):
+  return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+  if connection.vendor != 'sqlite':
+    return
+  pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+  if not pragmas:
+    return
+  with connection.cursor() as cursor:
+    for statement in pragma_statements(pragmas):
+      cursor.execute(statement)
@@ -0,0 +1,91 @@
+import csv
+import heapq
+import json
+
+from .models import Income, Expense
+
+"""
+Streaming export of a user's ledger
+
+Rows are read with QuerySet.iterator() as values_list tuples and encoded
+as they come, so an export starts sending bytes at once and never holds
+the whole result set in memory.
+"""
+
+CHUNK_SIZE = 2000
+# Number of encoded rows joined into each chunk of the response
+ROWS_PER_WRITE = 500
+
+COLUMNS = ['kind', 'id', 'date', 'amount', 'category', 'description', 'type', 'interval']
+
+KINDS = {
+  'income': Income,
+  'expense': Expense,
+}
+
+def ledger_rows(user_id, start=None, end=None, category=None, kind=None, chunk_size=CHUNK_SIZE):
+  """
+  Rows of the ledger ordered by date, incomes and expenses merged, as
+  tuples in COLUMNS order.
+  """
+  streams = []
+  for name, model in KINDS.items():
+    if kind is not None and kind != name:
+      continue
+    rows = model.objects.filter(user=user_id)
+    if start is not None:
+      rows = rows.filter(date__gte=start)
+    if end is not None:
+      rows = rows.filter(date__lte=end)
+    if category is not None:
+      rows = rows.filter(**{model.rollup_category: category})
+    rows = rows.order_by('date', 'id').values_list(
+      'id', 'date', 'amount', model.rollup_category, 'description', 'type', 'interval'
+    )
+    streams.append(tagged(name, rows.iterator(chunk_size=chunk_size)))
+  return heapq.merge(*streams, key=lambda row: row[2])
+
+def tagged(kind, rows):
+  for row in rows:
+    yield (kind,) + row
+
+class Echo:
+  # File-like object that hands back what is written, for csv.writer
+  def write(self, value):
+    return value
+
+def csv_stream(rows):
+  writer = csv.writer(Echo())
+  yield writer.writerow(COLUMNS)
+  lines = []
+  for row in rows:
+    lines.append(writer.writerow(row))
+    if len(lines) == ROWS_PER_WRITE:
+      yield ''.join(lines)
+      lines = []
+  if lines:
+    yield ''.join(lines)
+
+def ndjson_stream(rows):
+  lines = []
+  for kind, id, date, amount, category, description, type, interval in rows:
+    lines.append(json.dumps({
+      'kind': kind,
+      'id': id,
+      'date': date.isoformat(),
+      'amount': str(amount),
+      'category': category,
+      'description': description,
+      'type': type,
+      'interval': interval,
+    }) + '\n')
+    if len(lines) == ROWS_PER_WRITE:
+      yield ''.join(lines)
+      lines = []
+  if lines:
+    yield ''.join(lines)
+
+FORMATS = {
+  'csv': (csv_stream, 'text/csv'),
+  'ndjson': (ndjson_stream, 'application/x-ndjson'),
+}
@@ -0,0 +1,104 @@
+import datetime
+import re
+import numpy as np
+
+from .recurrence import DAYS_PER_MONTH, add_months
+
+"""
+Cash-flow forecast
+
+Recurring items are expanded for the whole window at once with NumPy
+date arithmetic: the k-th occurrence of an item is its date plus k times
+its interval (see recurrence.occurrence), so every (item, k) pair of the
+window can be computed as one array operation.
+"""
+
+HORIZON_PATTERN = re.compile(r"^([1-9][0-9]*)([dwmy])$")
+
+# Longest horizon that can be requested, in days
+MAX_HORIZON = 366 * 10
+
+def horizon_end(horizon, today:datetime.date):
+  """
+  Last day of a horizon such as "90d", "12w", "6m" or "5y" from today.
+  Raises ValueError if it is malformed or longer than ten years.
+  """
+  match = HORIZON_PATTERN.match(horizon)
+  if match is None:
+    raise ValueError(f"The horizon format is wrong: {horizon!r}")
+  count, unit = int(match.group(1)), match.group(2)
+  if unit == 'd':
+    end = today + datetime.timedelta(days=count)
+  elif unit == 'w':
+    end = today + datetime.timedelta(weeks=count)
+  elif unit == 'm':
+    end = add_months(today, count)
+  else:
+    end = add_months(today, count * 12)
+  if (end - today).days > MAX_HORIZON:
+    raise ValueError(f"The horizon can't exceed 10 years: {horizon!r}")
+  return end
+
+def expand(dates, intervals, start:datetime.date, end:datetime.date):
+  """
+  Every occurrence of the items that falls in [start, end].
+  dates is a datetime64[D] array of n item dates and intervals an (n, 3)
+  array of (years, months, days). Items without interval occur once.
+  Returns the item index and the date of each occurrence.
+  """
+  dates = np.asarray(dates, dtype='datetime64[D]')
+  intervals = np.asarray(intervals, dtype=np.int64).reshape(-1, 3)
+  start = np.datetime64(start, 'D')
+  end = np.datetime64(end, 'D')
+  month_steps = intervals[:, 0] * 12 + intervals[:, 1]
+  day_steps = intervals[:, 2]
+
+  # Range of k that may fall in the window: the estimate from the average
+  # step length is off by less than one step on each side.
+  step = month_steps * DAYS_PER_MONTH + day_steps
+  recurring = step > 0
+  safe_step = np.where(recurring, step, 1.0)
+  first = np.where(recurring, np.floor((start - dates).astype(np.int64) / safe_step) - 1, 0)
+  last = np.where(recurring, np.ceil((end - dates).astype(np.int64) / safe_step) + 1, 0)
+  first = np.maximum(first, 0).astype(np.int64)
+  counts = np.maximum(last.astype(np.int64) - first + 1, 0)
+
+  # One row per (item, k) pair
+  item = np.repeat(np.arange(len(dates)), counts)
+  offsets = np.cumsum(counts) - counts
+  k = np.arange(len(item)) - np.repeat(offsets, counts) + first[item]
+
+  # Add the months first, keeping the day of the month within the month
+  months = dates.astype('datetime64[M]')
+  day = (dates - months.astype('datetime64[D]')).astype(np.int64)
+  target = months[item] + month_steps[item] * k
+  month_length = ((target + 1).astype('datetime64[D]') - target.astype('datetime64[D]')).astype(np.int64)
+  occurrences = target.astype('datetime64[D]') + np.minimum(day[item], month_length - 1) + day_steps[item] * k
+
+  in_window = (occurrences >= start) & (occurrences <= end)
+  return item[in_window], occurrences[in_window]
+
+def daily_balances(start_balance, dates, intervals, amounts, start:datetime.date, end:datetime.date):
+  """
+  Balance at the end of each day from start to end, both included, as an
+  int64 array. start_balance and amounts are in cents, amounts signed.
+  """
+  item, occurrences = expand(dates, intervals, start, end)
+  days = (np.datetime64(end, 'D') - np.datetime64(start, 'D')).astype(np.int64) + 1
+  flows = np.zeros(days, dtype=np.int64)
+  np.add.at(flows, (occurrences - np.datetime64(start, 'D')).astype(np.int64), np.asarray(amounts, dtype=np.int64)[item])
+  return start_balance + np.cumsum(flows)
+
+def monthly_balances(balances, start:datetime.date):
+  """
+  Balance at the end of each month (or of the window, for the last one).
+  Returns the month labels ("YYYY-MM") and the balances.
+  """
+  days = np.datetime64(start, 'D') + np.arange(len(balances))
+  months = days.astype('datetime64[M]')
+  # Last day of each month is where the month changes, plus the final day
+  ends = np.flatnonzero(np.append(months[1:] != months[:-1], True))
+  return [str(month) for month in months[ends]], balances[ends]
+
+def day_labels(start:datetime.date, count):
+  return [str(day) for day in np.datetime64(start, 'D') + np.arange(count)]
@@ -0,0 +1,205 @@
+import csv
+import datetime
+import io
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import SkipField, empty
+from .models import User, Income, Expense, MonthlyRollup
+from .serializers import IncomeSerializer, ExpenseSerializer
+
+"""
+Bulk import of incomes and expenses
+
+Files are read as a stream of rows, each row is checked with the fields
+of the model's serializer, and the valid rows are written
+with bulk_create, one transaction per chunk. Only one chunk is held in
+memory at a time, whatever the size of the file.
+"""
+
+CHUNK_SIZE = 1000
+# Number of rejected rows reported back in detail
+MAX_REPORTED_ERRORS = 100
+
+KINDS = {
+  'income': Income,
+  'expense': Expense,
+}
+
+SERIALIZERS = {
+  Income: IncomeSerializer,
+  Expense: ExpenseSerializer,
+}
+
+class RowValidator:
+  """
+  Builds an unsaved Income or Expense from a row with the fields of its
+  serializer, so a row is taken exactly when the API would take the same
+  values. The fields are built once, not a serializer per row. Fields
+  missing from the row are left out, as in a request; with an instance,
+  they keep its values, as in a partial update.
+  """
+  def __init__(self, model, user_id, today=None):
+    self.model = model
+    self.user_id = user_id
+    self.today = today or datetime.date.today()
+    self.category_field = model.rollup_category
+    fields = SERIALIZERS[model]().fields
+    self.fields = {name: field for name, field in fields.items() if name not in ('id', 'user')}
+
+  def validate(self, row, amount=None, instance=None):
+    errors = {}
+    obj = self.model(user_id=self.user_id)
+    if instance is not None:
+      for name in self.fields:
+        setattr(obj, name, getattr(instance, name))
+
+    for name, field in self.fields.items():
+      if name == 'amount' and amount is not None:
+        value = amount
+      elif name == self.category_field:
+        # Either column name, whatever the kind of the row
+        value = row.get(name, row.get('category', row.get('source', empty)))
+      else:
+        value = row.get(name, empty)
+      if value is empty and instance is not None:
+        continue
+      try:
+        value = field.run_validation(value)
+      except SkipField:
+        continue
+      except ValidationError as e:
+        errors[name] = ' '.join(str(message) for message in e.detail)
+        continue
+      setattr(obj, name, value)
+
+    if errors:
+      return None, errors
+    obj.set_schedule(self.today)
+    return obj, None
+
+"""
+Readers: both yield (number, kind, row) where number locates the row in
+the file, kind is None when the row does not say it, and row is a dict of
+strings.
+"""
+
+def read_csv(stream):
+  text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+  reader = csv.DictReader(text)
+  for row in reader:
+    kind = (row.get('kind') or '').strip().lower() or None
+    yield reader.line_num, kind, row
+
+OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+def read_ofx(stream, block_size=64 * 1024):
+  """
+  Yield the <STMTTRN> transactions of an OFX file (SGML or XML). The file
+  is read in blocks, so it does not need line breaks between tags.
+  """
+  text = io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+  buffer = ''
+  current = None
+  count = 0
+  while True:
+    block = text.read(block_size)
+    buffer += block
+    # Keep the last, maybe incomplete, tag for the next block
+    cut = max(buffer.rfind('<'), 0) if block else len(buffer)
+    for closing, tag, value in OFX_TAG.findall(buffer, 0, cut):
+      tag = tag.upper()
+      if tag == 'STMTTRN':
+        if closing and current is not None:
+          count += 1
+          yield count, None, ofx_row(current)
+        current = None if closing else {}
+      elif current is not None and not closing:
+        current[tag] = value.strip()
+    buffer = buffer[cut:]
+    if not block:
+      break
+
+def ofx_row(current):
+  posted = current.get('DTPOSTED', '')[:8]
+  try:
+    date = datetime.datetime.strptime(posted, '%Y%m%d').date().isoformat()
+  except ValueError:
+    date = posted
+  return {
+    'date': date,
+    'amount': current.get('TRNAMT', ''),
+    'description': (current.get('NAME') or current.get('MEMO') or '')[:150],
+  }
+
+READERS = {
+  'csv': read_csv,
+  'ofx': read_ofx,
+}
+
+def file_format(name):
+  return 'ofx' if name.lower().endswith(('.ofx', '.qfx')) else 'csv'
+
+"""
+Import
+"""
+
+def import_rows(user_id, rows, kind=None, chunk_size=CHUNK_SIZE):
+  """
+  Validate and write the rows given by a reader. The kind of each row is
+  the kind argument, else the row's own kind, else the sign of its amount
+  (negative amounts are expenses). Returns the import report.
+  """
+  validators = {name: RowValidator(model, user_id) for name, model in KINDS.items()}
+  batches = {name: [] for name in KINDS}
+  report = {'accepted': 0, 'rejected': 0, 'errors': []}
+
+  def reject(number, errors):
+    report['rejected'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+      report['errors'].append({'row': number, 'errors': errors})
+
+  for number, row_kind, row in rows:
+    # A file leaves a field out with an empty cell
+    row = {key: value for key, value in row.items() if value not in (None, '')}
+    name = kind or row_kind
+    amount = None
+    if name is None:
+      try:
+        amount = Decimal((row.get('amount') or '').strip())
+      except InvalidOperation:
+        amount = None
+      if amount is None or not amount.is_finite():
+        reject(number, {'amount': "A valid number is required."})
+        continue
+      name = 'expense' if amount < 0 else 'income'
+      amount = abs(amount)
+    if name not in validators:
+      reject(number, {'kind': f'"{name}" is not a valid choice.'})
+      continue
+
+    obj, errors = validators[name].validate(row, amount)
+    if errors:
+      reject(number, errors)
+      continue
+    batches[name].append(obj)
+    if len(batches[name]) >= chunk_size:
+      report['accepted'] += write_batch(KINDS[name], batches[name])
+      batches[name] = []
+
+  for name, batch in batches.items():
+    if batch:
+      report['accepted'] += write_batch(KINDS[name], batch)
+  return report
+
+def write_batch(model, batch):
+  with transaction.atomic():
+    model.objects.bulk_create(batch)
+    MonthlyRollup.objects.apply_all(batch)
+    User.bump_data_version(obj.user_id for obj in batch)
+  return len(batch)
+
+def import_file(user_id, stream, format='csv', kind=None, chunk_size=CHUNK_SIZE):
+  return import_rows(user_id, READERS[format](stream), kind=kind, chunk_size=chunk_size)
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from app import recurrence
+from app.models import Income, Expense
+
+
+class Command(BaseCommand):
+    help = "Move the past next_due dates of recurring incomes and expenses to their next occurrence."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        batch_size = options['batch_size']
+        for model in (Income, Expense):
+            stale = (
+                model.objects.filter(type=True, next_due__lt=today)
+                .only('id', 'date', 'interval_years', 'interval_months', 'interval_days', 'next_due')
+            )
+            batch = []
+            updated = 0
+            for item in stale.iterator(chunk_size=batch_size):
+                item.next_due = recurrence.next_occurrence(item.date, item.schedule, today)
+                batch.append(item)
+                if len(batch) == batch_size:
+                    updated += model.objects.bulk_update(batch, ['next_due'])
+                    batch = []
+            updated += model.objects.bulk_update(batch, ['next_due'])
+            self.stdout.write(f"{model.__name__}: advanced {updated} next_due dates.")
@@ -0,0 +1,42 @@
+import argparse
+
+from django.core.management.base import BaseCommand
+from app import synthetic
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number.")
+    return number
+
+
+class Command(BaseCommand):
+    help = "Create users with synthetic incomes and expenses, for benchmarks and demos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=positive_int, default=10)
+        parser.add_argument('--years', type=int, default=3, help="Years of history per user.")
+        parser.add_argument('--expenses-per-month', type=int, default=30,
+                            help="Average everyday expenses per month, besides the rent.")
+        parser.add_argument('--recurring', type=float, default=0.05,
+                            help="Share of the everyday rows that are recurring (0 to 1).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        user_ids = synthetic.generate(
+            users=options['users'],
+            years=options['years'],
+            expenses_per_month=options['expenses_per_month'],
+            recurring=options['recurring'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        if not user_ids:
+            # From call_command(), which doesn't check the types
+            self.stdout.write("No users created.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(user_ids)} users with synthetic ledgers (ids {user_ids[0]} to {user_ids[-1]})."
+        ))
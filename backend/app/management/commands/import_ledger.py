@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from app import importers
+from app.models import User
+
+
+class Command(BaseCommand):
+    help = "Import a CSV or OFX file of incomes and/or expenses for a user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', type=int, help="Id of the user the rows belong to.")
+        parser.add_argument('path', help="CSV or OFX file to import.")
+        parser.add_argument('--kind', choices=list(importers.KINDS),
+                            help="Import every row as this kind instead of reading it from the row.")
+        parser.add_argument('--file-format', choices=list(importers.READERS),
+                            help="Defaults to the file extension (.ofx/.qfx are OFX, anything else CSV).")
+        parser.add_argument('--chunk-size', type=int, default=importers.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if not User.objects.filter(pk=options['user']).exists():
+            raise CommandError(f"User {options['user']} does not exist.")
+        file_format = options['file_format'] or importers.file_format(options['path'])
+        with open(options['path'], 'rb') as stream:
+            report = importers.import_file(options['user'], stream, file_format, options['kind'], options['chunk_size'])
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,80 @@
+import fnmatch
+import io
+import json
+import os
+import pstats
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from app import profiling
+
+
+class Command(BaseCommand):
+    help = "Add up the request profiles written by the profiling middleware and list the top functions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help="Profiles directory (defaults to PROFILING_DIR).")
+        parser.add_argument('--route', help="Only the profiles of the routes matching this shell pattern.")
+        parser.add_argument('--user', type=int, help="Only the profiles of this user id.")
+        parser.add_argument('--sort', choices=['cumulative', 'tottime', 'calls'], default='cumulative',
+                            help="Order of the cProfile functions (sampled ones are listed by total samples).")
+        parser.add_argument('--limit', type=int, default=25)
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or profiling.profile_dir()
+        if not os.path.isdir(directory):
+            raise CommandError(f"No profiles in {directory}.")
+
+        profiles = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(directory, name)) as file:
+                metadata = json.load(file)
+            if options['route'] and not fnmatch.fnmatchcase(metadata['route'], options['route']):
+                continue
+            if options['user'] is not None and metadata['user'] != options['user']:
+                continue
+            profiles.append((os.path.join(directory, name[:-len('.json')]), metadata))
+        if not profiles:
+            raise CommandError("No profiles match.")
+
+        self.stdout.write(f"{len(profiles)} profiles in {directory}\n")
+        routes = {}
+        for base, metadata in profiles:
+            routes.setdefault(metadata['route'], []).append(metadata['wall_ms'])
+        for route, times in sorted(routes.items(), key=lambda item: -sum(item[1])):
+            self.stdout.write(f"{len(times):6}  {sum(times) / len(times):9.1f} ms mean  {max(times):9.1f} ms max  {route}")
+
+        prof_files = [base + '.prof' for base, metadata in profiles if metadata['mode'] == 'cprofile']
+        if prof_files:
+            self.stdout.write(f"\ncProfile, {len(prof_files)} profiles, top functions by {options['sort']}")
+            stream = io.StringIO()
+            stats = pstats.Stats(*prof_files, stream=stream)
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+            self.stdout.write(stream.getvalue())
+
+        sampled = [base + '.stacks' for base, metadata in profiles if metadata['mode'] == 'sampler']
+        if sampled:
+            own, total, samples = self.add_stacks(sampled)
+            self.stdout.write(f"\nSampler, {len(sampled)} profiles, {samples} samples, top functions by total samples")
+            self.stdout.write(f"{'total':>8} {'own':>8}  function")
+            for function, count in total.most_common(options['limit']):
+                # Like pstats' strip_dirs()
+                self.stdout.write(f"{count / samples:8.1%} {own[function] / samples:8.1%}  {os.path.basename(function)}")
+
+    def add_stacks(self, paths):
+        # Samples with each function on top of the stack (own) and anywhere in it (total)
+        own, total = Counter(), Counter()
+        samples = 0
+        for path in paths:
+            with open(path) as file:
+                for line in file:
+                    stack, count = line.rsplit(' ', 1)
+                    functions = stack.split(';')
+                    count = int(count)
+                    samples += count
+                    own[functions[-1]] += count
+                    for function in set(functions):
+                        total[function] += count
+        return own, total, samples
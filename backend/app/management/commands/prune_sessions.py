@@ -0,0 +1,36 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the expired sessions in batches, each in its own short transaction, "
+        "unlike clearsessions' single DELETE. Meant to be run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to wait between batches.")
+
+    def handle(self, *args, **options):
+        engine = import_module(settings.SESSION_ENGINE)
+        if not hasattr(engine.SessionStore, 'get_model_class'):
+            raise CommandError(f"{settings.SESSION_ENGINE} doesn't store sessions in the database.")
+        model = engine.SessionStore.get_model_class()
+
+        # Sessions extended after now are kept even if they were picked for a batch
+        expired = model.objects.filter(expire_date__lt=timezone.now())
+        deleted = 0
+        while True:
+            keys = list(expired.values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            deleted += expired.filter(session_key__in=keys).delete()[0]
+            if options['pause']:
+                time.sleep(options['pause'])
+        # The sessions cache drops its copies when they expire
+        self.stdout.write(f"Deleted {deleted} expired sessions.")
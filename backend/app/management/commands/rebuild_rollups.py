@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from app.models import MonthlyRollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly income/expense rollups from the raw rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help="Only rebuild the rollups of this user id (repeatable).")
+
+    def handle(self, *args, **options):
+        MonthlyRollup.objects.rebuild(options['users'])
+        rollups = MonthlyRollup.objects.all()
+        if options['users']:
+            rollups = rollups.filter(user_id__in=options['users'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rollups.count()} monthly rollups."))
@@ -0,0 +1,292 @@
+import bisect
+import hmac
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from . import caching
+
+"""
+Request metrics
+
+MetricsMiddleware times every request: its SQL queries and their total
+time, the view, the serialization of the response, and the whole
+request. They are sent back in a Server-Timing header and added to the
+histograms of this process for the route of the request, which the
+metrics view serves in the Prometheus text format.
+
+Queries are timed by an execute wrapper installed once on every
+connection, which only reads a context variable when no request is being
+measured. The SQL of each query is kept for a sample of the requests
+only (METRICS_QUERY_SAMPLE_RATE), and logged.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the buckets, in seconds and in queries
+DURATION_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89]
+
+HISTOGRAMS = {
+  'http_request_duration_seconds': ("Time to answer the request.", DURATION_BUCKETS),
+  'http_request_view_seconds': ("Time in the view, database included.", DURATION_BUCKETS),
+  'http_request_serialize_seconds': ("Time to render the response data.", DURATION_BUCKETS),
+  'http_request_db_seconds': ("Time in SQL queries.", DURATION_BUCKETS),
+  'http_request_db_queries': ("SQL queries per request.", QUERY_BUCKETS),
+  'db_query_duration_seconds': ("Time of each SQL query, in the sampled requests.", DURATION_BUCKETS),
+}
+
+UNRESOLVED = '<unresolved>'
+
+_lock = threading.Lock()
+# (name, route): [bucket counts (the last is +Inf), sum]
+_histograms = {}
+# (route, method, status): requests
+_requests = {}
+
+# The measure of the request being answered in this context
+current = ContextVar('current_request_metrics', default=None)
+
+class RequestMetrics:
+  def __init__(self, sample):
+    self.start = time.perf_counter()
+    self.db_time = 0.0
+    self.db_queries = 0
+    self.view_start = None
+    self.view_end = None
+    self.serialize_time = 0.0
+    # (sql, seconds) of each query, when the request is sampled
+    self.queries = [] if sample else None
+
+def observe(name, route, value):
+  buckets = HISTOGRAMS[name][1]
+  with _lock:
+    histogram = _histograms.get((name, route))
+    if histogram is None:
+      histogram = _histograms[name, route] = [[0] * (len(buckets) + 1), 0]
+    histogram[0][bisect.bisect_left(buckets, value)] += 1
+    histogram[1] += value
+
+def stats():
+  # Copies of the histograms and request counters of this process
+  with _lock:
+    return (
+      {key: [list(counts), total] for key, (counts, total) in _histograms.items()},
+      dict(_requests),
+    )
+
+def reset_stats():
+  with _lock:
+    _histograms.clear()
+    _requests.clear()
+
+"""
+Queries
+"""
+
+def time_query(execute, sql, params, many, context):
+  metrics = current.get()
+  if metrics is None:
+    return execute(sql, params, many, context)
+  start = time.perf_counter()
+  try:
+    return execute(sql, params, many, context)
+  finally:
+    duration = time.perf_counter() - start
+    metrics.db_time += duration
+    metrics.db_queries += 1
+    if metrics.queries is not None:
+      metrics.queries.append((sql, duration))
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+  # Sent on every (re)connection of the same DatabaseWrapper
+  if time_query not in connection.execute_wrappers:
+    connection.execute_wrappers.append(time_query)
+
+@contextmanager
+def serializing():
+  # Time the serialization of response data done in a view
+  metrics = current.get()
+  if metrics is None:
+    yield
+    return
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    metrics.serialize_time += time.perf_counter() - start
+
+"""
+Middleware
+"""
+
+def route_of(request):
+  match = getattr(request, 'resolver_match', None)
+  if match is None:
+    return UNRESOLVED
+  return match.url_name or match.route
+
+class MetricsMiddleware:
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+    self.enabled = getattr(settings, 'METRICS_ENABLED', False)
+    self.sample_rate = getattr(settings, 'METRICS_QUERY_SAMPLE_RATE', 0.01)
+    self.is_async = iscoroutinefunction(get_response)
+    if self.is_async:
+      markcoroutinefunction(self)
+      # Hooks of the mode of the handler run without a thread switch
+      self.process_view = self.aprocess_view
+      self.process_template_response = self.aprocess_template_response
+
+  def __call__(self, request):
+    if self.is_async:
+      return self.__acall__(request)
+    if not self.enabled:
+      return self.get_response(request)
+    metrics, token = self.begin()
+    try:
+      response = self.get_response(request)
+    finally:
+      current.reset(token)
+    return self.finish(request, response, metrics)
+
+  async def __acall__(self, request):
+    if not self.enabled:
+      return await self.get_response(request)
+    metrics, token = self.begin()
+    try:
+      response = await self.get_response(request)
+    finally:
+      current.reset(token)
+    return self.finish(request, response, metrics)
+
+  def begin(self):
+    metrics = RequestMetrics(random.random() < self.sample_rate)
+    return metrics, current.set(metrics)
+
+  def view_started(self):
+    metrics = current.get()
+    if metrics is not None:
+      metrics.view_start = time.perf_counter()
+
+  def view_returned(self, response):
+    # Between the view and the rendering of its response
+    metrics = current.get()
+    if metrics is not None:
+      start = metrics.view_end = time.perf_counter()
+
+      def rendered(response):
+        metrics.serialize_time += time.perf_counter() - start
+
+      response.add_post_render_callback(rendered)
+    return response
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    self.view_started()
+
+  def process_template_response(self, request, response):
+    return self.view_returned(response)
+
+  async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+    self.view_started()
+
+  async def aprocess_template_response(self, request, response):
+    return self.view_returned(response)
+
+  def finish(self, request, response, metrics):
+    end = time.perf_counter()
+    total = end - metrics.start
+    route = route_of(request)
+    view = 0.0
+    if metrics.view_start is not None:
+      if metrics.view_end is not None:
+        view = metrics.view_end - metrics.view_start
+      else:
+        # The view serialized its response itself
+        view = end - metrics.view_start - metrics.serialize_time
+
+    observe('http_request_duration_seconds', route, total)
+    observe('http_request_view_seconds', route, view)
+    observe('http_request_serialize_seconds', route, metrics.serialize_time)
+    observe('http_request_db_seconds', route, metrics.db_time)
+    observe('http_request_db_queries', route, metrics.db_queries)
+    key = (route, request.method, response.status_code)
+    with _lock:
+      _requests[key] = _requests.get(key, 0) + 1
+
+    if metrics.queries:
+      for sql, duration in metrics.queries:
+        observe('db_query_duration_seconds', route, duration)
+      logger.info(
+        "%s %s: %d queries in %.1f ms\n%s", request.method, route, len(metrics.queries), metrics.db_time * 1000,
+        '\n'.join(f"{duration * 1000:8.2f} ms  {sql}" for sql, duration in metrics.queries),
+      )
+
+    response['Server-Timing'] = ', '.join([
+      f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.db_queries} queries"',
+      f'view;dur={view * 1000:.2f}',
+      f'serialize;dur={metrics.serialize_time * 1000:.2f}',
+      f'total;dur={total * 1000:.2f}',
+    ])
+    return response
+
+"""
+Prometheus text format
+"""
+
+def escape(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def labels(**values):
+  return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in values.items()) + '}'
+
+def render():
+  histograms, requests = stats()
+  lines = [
+    '# HELP http_requests_total Requests answered.',
+    '# TYPE http_requests_total counter',
+  ]
+  for (route, method, status), value in sorted(requests.items()):
+    lines.append(f'http_requests_total{labels(route=route, method=method, status=status)} {value}')
+
+  for name, (help, buckets) in HISTOGRAMS.items():
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} histogram')
+    for (metric, route), (counts, total) in sorted(histograms.items()):
+      if metric != name:
+        continue
+      cumulative = 0
+      for bound, count in zip(buckets + ['+Inf'], counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{labels(route=route, le=bound)} {cumulative}')
+      lines.append(f'{name}_sum{labels(route=route)} {total}')
+      lines.append(f'{name}_count{labels(route=route)} {cumulative}')
+
+  lines.append('# HELP analytics_cache_requests_total Analytics cache lookups.')
+  lines.append('# TYPE analytics_cache_requests_total counter')
+  for endpoint, outcomes in sorted(caching.stats().items()):
+    for outcome, value in sorted(outcomes.items()):
+      lines.append(f'analytics_cache_requests_total{labels(endpoint=endpoint, result=outcome)} {value}')
+  return '\n'.join(lines) + '\n'
+
+def metrics_view(request):
+  if not getattr(settings, 'METRICS_ENABLED', False):
+    raise Http404
+  token = getattr(settings, 'METRICS_TOKEN', '')
+  if token and not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+    response = HttpResponse("A valid bearer token is required.\n", status=401, content_type='text/plain')
+    response['WWW-Authenticate'] = 'Bearer'
+    return response
+  return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
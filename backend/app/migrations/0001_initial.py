@@ -0,0 +1,75 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:05
+
+from django.conf import settings
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('first_name', models.CharField(default='', max_length=100)),
+                ('last_name', models.CharField(default='', max_length=100)),
+                ('email', models.EmailField(max_length=254, unique=True, verbose_name='email address')),
+                ('income_goal', models.DecimalField(blank=True, decimal_places=2, default=0.0, max_digits=15)),
+                ('expense_budget', models.DecimalField(blank=True, decimal_places=2, default=0.0, max_digits=15)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'verbose_name': 'user',
+                'verbose_name_plural': 'users',
+                'abstract': False,
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Income',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('source', models.CharField(choices=[('SALARY', 'Salary'), ('INVESTMENT', 'Investment'), ('INTEREST', 'Interest'), ('GOVERNMENT', 'Government'), ('BUSINESS', 'Business'), ('DIVIDEND', 'Dividend'), ('PENSION', 'Pension'), ('OTHER', 'Other')], default='OTHER', max_length=100)),
+                ('description', models.CharField(default='', max_length=150)),
+                ('type', models.BooleanField(choices=[(True, 'Fixed'), (False, 'Non-fixed')], default=False)),
+                ('interval', models.CharField(blank=True, max_length=10, validators=[django.core.validators.RegexValidator('\\b([0-9]|10)\\-\\b([0-9]|1[0-1])\\-\\b([0-9]|[12][0-9]|30)', 'The interval format is wrong.')])),
+                ('date', models.DateField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incomes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Expense',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('category', models.CharField(choices=[('FOOD', 'Food'), ('HOUSING', 'Housing'), ('TRANSPORTATION', 'Transportation'), ('MEDICAL', 'Medical'), ('INSURANCE', 'Insurance'), ('EDUCATION', 'Education'), ('HOUSEHOLD', 'Household'), ('SHOPPING', 'Shopping'), ('ENTERTAINMENT', 'Entertainment'), ('INVESTMENT', 'Investment'), ('SUBSCRIPTION', 'Subscription'), ('SAVING', 'Saving'), ('DEBT', 'Debt'), ('OTHER', 'Other')], default='OTHER', max_length=50)),
+                ('description', models.CharField(default='', max_length=150)),
+                ('type', models.BooleanField(choices=[(True, 'Recurring'), (False, 'Non-recurring')], default=False)),
+                ('interval', models.CharField(blank=True, max_length=10, validators=[django.core.validators.RegexValidator('\\b([0-9]|10)\\-\\b([0-9]|1[0-1])\\-\\b([0-9]|[12][0-9]|30)', 'The interval format is wrong.')])),
+                ('date', models.DateField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expenses', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.functions
+import django.db.models.deletion
+
+
+def build_rollups(apps, schema_editor):
+    MonthlyRollup = apps.get_model('app', 'MonthlyRollup')
+    for model_name, kind, category in (('Income', 'INCOME', 'source'), ('Expense', 'EXPENSE', 'category')):
+        model = apps.get_model('app', model_name)
+        rows = (
+            model.objects.annotate(year=models.functions.ExtractYear('date'), month=models.functions.ExtractMonth('date'))
+            .values('user_id', 'year', 'month', category)
+            .annotate(total=models.Sum('amount'), count=models.Count('id'))
+            .order_by()
+        )
+        MonthlyRollup.objects.bulk_create([
+            MonthlyRollup(user_id=row['user_id'], year=row['year'], month=row['month'], kind=kind,
+                          category=row[category], total=row['total'], count=row['count'])
+            for row in rows.iterator()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('kind', models.CharField(choices=[('INCOME', 'Income'), ('EXPENSE', 'Expense')], max_length=10)),
+                ('category', models.CharField(max_length=100)),
+                ('total', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'year', 'month', 'kind', 'category'), name='unique_monthly_rollup'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
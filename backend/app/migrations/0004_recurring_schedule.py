@@ -0,0 +1,163 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:06
+
+import calendar
+import django.core.validators
+import datetime
+import math
+import re
+
+from django.db import migrations, models
+
+
+# A copy of app.recurrence as of this migration, which must keep doing
+# what it did whatever becomes of that module.
+INTERVAL_PATTERN = re.compile(r"^([0-9]|10)-([0-9]|1[0-1])-([0-9]|[12][0-9]|30)$")
+DAYS_PER_MONTH = 365.2425 / 12
+
+
+def parse_interval(interval):
+    if not interval:
+        return (0, 0, 0)
+    match = INTERVAL_PATTERN.match(interval)
+    if match is None:
+        raise ValueError(f"The interval format is wrong: {interval!r}")
+    return tuple(int(n) for n in match.groups())
+
+
+def add_months(date, months):
+    index = date.year * 12 + date.month - 1 + months
+    year, month = divmod(index, 12)
+    day = min(date.day, calendar.monthrange(year, month + 1)[1])
+    return datetime.date(year, month + 1, day)
+
+
+def occurrence(date, interval, k):
+    years, months, days = interval
+    return add_months(date, (years * 12 + months) * k) + datetime.timedelta(days=days * k)
+
+
+def next_occurrence(date, interval, on_or_after):
+    if date >= on_or_after:
+        return date
+    years, months, days = interval
+    step = (years * 12 + months) * DAYS_PER_MONTH + days
+    if step == 0:
+        return None
+    k = max(1, math.ceil((on_or_after - date).days / step))
+    while k > 1 and occurrence(date, interval, k - 1) >= on_or_after:
+        k -= 1
+    while occurrence(date, interval, k) < on_or_after:
+        k += 1
+    return occurrence(date, interval, k)
+
+
+# The old validator only searched for the pattern, and left out padding
+# and surrounding spaces, e.g. " 1-02-0 "
+LEGACY_INTERVAL = re.compile(r"^\s*(\d+)-(\d+)-(\d+)\s*$")
+
+
+def legacy_interval(interval):
+    """
+    The "yy-mm-dd" form of an interval saved under the old validator.
+    Raises ValueError when it has none.
+    """
+    match = LEGACY_INTERVAL.match(interval)
+    if match is None:
+        raise ValueError(f"The interval format is wrong: {interval!r}")
+    interval = '-'.join(str(int(n)) for n in match.groups())
+    parse_interval(interval)
+    return interval
+
+
+def fill_schedule(apps, schema_editor):
+    today = datetime.date.today()
+    invalid = []
+    for model_name in ('Income', 'Expense'):
+        model = apps.get_model('app', model_name)
+        batch = []
+        for item in model.objects.exclude(interval='').only('id', 'type', 'interval', 'date').iterator():
+            try:
+                item.interval = legacy_interval(item.interval)
+            except ValueError:
+                invalid.append(f"{model_name} {item.id}: {item.interval!r}")
+                continue
+            item.interval_years, item.interval_months, item.interval_days = parse_interval(item.interval)
+            if item.type:
+                interval = (item.interval_years, item.interval_months, item.interval_days)
+                item.next_due = next_occurrence(item.date, interval, today)
+            batch.append(item)
+        model.objects.bulk_update(batch, ['interval', 'interval_years', 'interval_months', 'interval_days', 'next_due'], batch_size=1000)
+    # Rather than items that silently stop recurring
+    if invalid:
+        raise ValueError(
+            "Fix or clear these intervals, which aren't yy-mm-dd, and migrate again:\n" + '\n'.join(invalid)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='interval_days',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='interval_months',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='interval_years',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='next_due',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='interval_days',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='interval_months',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='interval_years',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='next_due',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='interval',
+            field=models.CharField(blank=True, max_length=10, validators=[django.core.validators.RegexValidator('^([0-9]|10)-([0-9]|1[0-1])-([0-9]|[12][0-9]|30)$', 'The interval format is wrong.')]),
+        ),
+        migrations.AlterField(
+            model_name='income',
+            name='interval',
+            field=models.CharField(blank=True, max_length=10, validators=[django.core.validators.RegexValidator('^([0-9]|10)-([0-9]|1[0-1])-([0-9]|[12][0-9]|30)$', 'The interval format is wrong.')]),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(condition=models.Q(('type', True)), fields=['user', 'next_due'], name='expense_user_next_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(condition=models.Q(('type', True)), fields=['user', 'next_due'], name='income_user_next_due_idx'),
+        ),
+        migrations.RunPython(fill_schedule, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:17
+
+import app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_recurring_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=app.models.new_data_version, editable=False),
+        ),
+    ]
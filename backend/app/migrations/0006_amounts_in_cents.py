@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:56
+
+import app.money
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Round
+
+# (model, field, max_digits, blank) of the amounts moved to integer cents
+FIELDS = [
+    ('income', 'amount', 10, False),
+    ('expense', 'amount', 10, False),
+    ('monthlyrollup', 'total', 15, False),
+    ('user', 'income_goal', 15, True),
+    ('user', 'expense_budget', 15, True),
+]
+
+
+def to_cents(apps, schema_editor):
+    # One UPDATE per table, computed by the database
+    for model_name, name, max_digits, blank in FIELDS:
+        model = apps.get_model('app', model_name)
+        model.objects.update(**{name + '_cents': Cast(Round(F(name) * 100), models.BigIntegerField())})
+
+
+def from_cents(apps, schema_editor):
+    for model_name, name, max_digits, blank in FIELDS:
+        model = apps.get_model('app', model_name)
+        model.objects.update(**{name: F(name + '_cents') / Value(100.0)})
+
+
+def operations():
+    # Copy each amount to a new bigint column, then swap the columns
+    add, remove = [], []
+    for model_name, name, max_digits, blank in FIELDS:
+        add.append(migrations.AddField(
+            model_name=model_name,
+            name=name + '_cents',
+            field=models.BigIntegerField(default=0),
+        ))
+        remove += [
+            migrations.RemoveField(model_name=model_name, name=name),
+            migrations.RenameField(model_name=model_name, old_name=name + '_cents', new_name=name),
+            migrations.AlterField(
+                model_name=model_name,
+                name=name,
+                field=app.money.CentsField(blank=blank, default=0.0, max_digits=max_digits),
+            ),
+        ]
+    return add + [migrations.RunPython(to_cents, from_cents)] + remove
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_user_data_version'),
+    ]
+
+    operations = operations()
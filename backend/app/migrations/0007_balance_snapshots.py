@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:07
+
+import app.money
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import datetime
+
+
+def next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def fill_snapshots(apps, schema_editor):
+    # The running totals of every user from the monthly rollups
+    MonthlyRollup = apps.get_model('app', 'MonthlyRollup')
+    BalanceSnapshot = apps.get_model('app', 'BalanceSnapshot')
+    fields = {'INCOME': 'income', 'EXPENSE': 'expense'}
+    totals = {}
+    for user_id, year, month, kind, total in MonthlyRollup.objects.values_list('user_id', 'year', 'month', 'kind', 'total').iterator():
+        months = totals.setdefault(user_id, {})
+        totals_of_month = months.setdefault(datetime.date(year, month, 1), {})
+        totals_of_month[kind] = totals_of_month.get(kind, 0) + total
+    batch = []
+    for user_id, months in totals.items():
+        month, last = min(months), max(months)
+        balance = {kind: 0 for kind in fields}
+        while month <= next_month(last):
+            batch.append(BalanceSnapshot(user_id=user_id, month=month, **{fields[kind]: value for kind, value in balance.items()}))
+            for kind, total in months.get(month, {}).items():
+                balance[kind] += total
+            month = next_month(month)
+    BalanceSnapshot.objects.bulk_create(batch, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_amounts_in_cents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('income', app.money.CentsField(default=0.0, max_digits=15)),
+                ('expense', app.money.CentsField(default=0.0, max_digits=15)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='balancesnapshot',
+            constraint=models.UniqueConstraint(fields=('user', 'month'), name='unique_balance_snapshot'),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:57
+
+import app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_balance_snapshots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='data_version',
+            field=models.PositiveBigIntegerField(db_index=True, default=app.models.new_data_version, editable=False),
+        ),
+    ]
@@ -1,15 +1,31 @@
-from django.db import models
+import datetime
+import time
+from django.core.exceptions import ValidationError
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Count, Value
+from django.db.models.functions import ExtractYear, ExtractMonth, Greatest
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
+from . import recurrence
+from .money import CentsField, cents, from_cents, sum_cents, to_cents
 
 # Interval Validator:
 # It consists of three fields, yy-mm-dd.
 # The number of years can't exceed 10.
 # The number of months can't exceed 11.
 # The number of days can't exceed 30.
-interval_validator = RegexValidator(r"\b([0-9]|10)\-\b([0-9]|1[0-1])\-\b([0-9]|[12][0-9]|30)", "The interval format is wrong.")
+interval_validator = RegexValidator(recurrence.INTERVAL_REGEX, "The interval format is wrong.")
 # Create your models here.
 
+def new_data_version():
+  # Microseconds since the epoch
+  return time.time_ns() // 1000
+
+def next_data_version():
+  # A bumped data version: one more, and at least the current time, so
+  # the newest version of all the users changes with every write
+  return Greatest(F('data_version') + 1, Value(new_data_version()))
+
 # GC: Deleted 'username' as it is already implemented in 'AbstractUser' class
 # GC: Deleted 'USERNAME_FIELD' as it is already set in 'AbstractUser' class
 # GC: Deleted 'username' field from 'REQUIRED_FIELDS'
@@ -17,16 +33,274 @@ class User(AbstractUser):
   first_name = models.CharField(max_length=100, default='')
   last_name = models.CharField(max_length=100, default='')
   email = models.EmailField(('email address'), unique = True)
-  income_goal = models.DecimalField(default=0.00, max_digits=15, decimal_places=2, blank=True)
-  expense_budget = models.DecimalField(default=0.00, max_digits=15, decimal_places=2, blank=True)
+  income_goal = CentsField(default=0.00, max_digits=15, blank=True)
+  expense_budget = CentsField(default=0.00, max_digits=15, blank=True)
+  # Bumped on every write to the user or their incomes and expenses, so
+  # results cached under an older version are never read again. It starts
+  # at the current time: a reused id must not meet the entries of a deleted
+  # user. Indexed for the newest version, the marker of the user list.
+  data_version = models.PositiveBigIntegerField(default=new_data_version, editable=False, db_index=True)
   REQUIRED_FIELDS = ['first_name', 'last_name', 'email']
 
   def __str__(self):
       return "{}".format(self.email)
+
+  def save(self, *args, **kwargs):
+    if self._state.adding:
+      super().save(*args, **kwargs)
+      return
+    # Incremented in the database: the loaded value may be stale already
+    self.data_version = next_data_version()
+    if kwargs.get('update_fields') is not None:
+      kwargs['update_fields'] = set(kwargs['update_fields']) | {'data_version'}
+    super().save(*args, **kwargs)
+    # Rather than the expression, which a second save would apply again
+    self.refresh_from_db(fields=['data_version'])
+
+  @classmethod
+  def bump_data_version(cls, user_ids):
+    cls.objects.filter(pk__in=set(user_ids)).update(data_version=next_data_version())
 #   pass
 
+# Monthly Rollup:
+# Sum and count of the incomes/expenses of a user per month and category.
+# It is kept up to date by RollupMixin.save() and the post_delete signal,
+# and can be rebuilt from scratch with `manage.py rebuild_rollups`, along
+# with the balance snapshots. Amounts are added up in cents (see money.py).
+class MonthlyRollupManager(models.Manager):
+  def apply(self, user_id, kind, date, category, amount, count):
+    BalanceSnapshot.objects.apply(user_id, kind, date, amount, count)
+    self.apply_rollup(user_id, kind, date, category, amount, count)
+
+  def apply_rollup(self, user_id, kind, date, category, amount, count):
+    key = dict(user_id=user_id, year=date.year, month=date.month, kind=kind, category=category)
+    updated = self.filter(**key).update(total=F('total') + amount, count=F('count') + count)
+    if updated:
+      if count < 0:
+        self.filter(count__lte=0, **key).delete()
+      return
+    # Removing rows from a month without a rollup means it is already gone
+    # (e.g. the user is being deleted), so only additions create one.
+    if count <= 0:
+      return
+    try:
+      with transaction.atomic():
+        self.create(total=from_cents(amount), count=count, **key)
+    except IntegrityError:
+      self.filter(**key).update(total=F('total') + amount, count=F('count') + count)
+
+  def apply_all(self, objs, sign=1):
+    # Add (or remove, with sign=-1) many rows with one update per month and
+    # category, and one snapshot update per month
+    deltas, months = {}, {}
+    for obj in objs:
+      user_id, date, category, amount = obj.rollup_values()
+      key = (user_id, obj.rollup_kind, date.replace(day=1))
+      for deltas_of, key in ((deltas, key + (category,)), (months, key)):
+        total, count = deltas_of.get(key, (0, 0))
+        deltas_of[key] = (total + amount, count + 1)
+    for (user_id, kind, date), (total, count) in months.items():
+      BalanceSnapshot.objects.apply(user_id, kind, date, sign * total, sign * count)
+    for (user_id, kind, date, category), (total, count) in deltas.items():
+      self.apply_rollup(user_id, kind, date, category, sign * total, sign * count)
+
+  def rebuild(self, user_ids=None):
+    with transaction.atomic():
+      rollups = self.all()
+      if user_ids is not None:
+        rollups = rollups.filter(user_id__in=user_ids)
+      rollups.delete()
+      for model in (Income, Expense):
+        rows = model.objects.all()
+        if user_ids is not None:
+          rows = rows.filter(user_id__in=user_ids)
+        rows = (
+          rows.annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+          .values('user_id', 'year', 'month', model.rollup_category)
+          .annotate(total=sum_cents('amount'), count=Count('id'))
+          .order_by()
+        )
+        self.bulk_create([
+          MonthlyRollup(
+            user_id=row['user_id'],
+            year=row['year'],
+            month=row['month'],
+            kind=model.rollup_kind,
+            category=row[model.rollup_category],
+            total=from_cents(row['total']),
+            count=row['count'],
+          )
+          for row in rows.iterator()
+        ], batch_size=1000)
+      BalanceSnapshot.objects.rebuild(user_ids)
+
+class MonthlyRollup(models.Model):
+  INCOME = 'INCOME'
+  EXPENSE = 'EXPENSE'
+  KIND_CHOICES = [
+    (INCOME, 'Income'),
+    (EXPENSE, 'Expense')
+  ]
+  user = models.ForeignKey(User, related_name='rollups', on_delete=models.CASCADE)
+  year = models.PositiveSmallIntegerField()
+  month = models.PositiveSmallIntegerField()
+  kind = models.CharField(choices=KIND_CHOICES, max_length=10)
+  category = models.CharField(max_length=100)
+  total = CentsField(default=0.00, max_digits=15)
+  count = models.IntegerField(default=0)
+
+  objects = MonthlyRollupManager()
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['user', 'year', 'month', 'kind', 'category'], name='unique_monthly_rollup'),
+    ]
+
+def next_month(month):
+  # The first day of the month after the one of the given date
+  return (month.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+# Balance Snapshot:
+# Totals of the incomes/expenses of a user dated before the first day of a
+# month. There is one for every month from the oldest row of the user to
+# the month after the newest, so the totals up to any date are those of the
+# nearest snapshot before it plus the rows since. They are kept up to date
+# by MonthlyRollupManager.apply() and rebuilt with the rollups.
+class BalanceSnapshotManager(models.Manager):
+  def apply(self, user_id, kind, date, amount, count):
+    # Add amount (in cents) to the totals after the month of date
+    month = date.replace(day=1)
+    if count > 0:
+      self.cover(user_id, month)
+    field = BalanceSnapshot.KIND_FIELDS[kind]
+    self.filter(user_id=user_id, month__gt=month).update(**{field: F(field) + amount})
+
+  def cover(self, user_id, month):
+    # Make sure the snapshots span month and the month after it
+    after = next_month(month)
+    if self.filter(user_id=user_id, month__in=[month, after]).count() == 2:
+      return
+    snapshots = self.filter(user_id=user_id)
+    first = snapshots.order_by('month').first()
+    last = snapshots.order_by('-month').first()
+    if first is None:
+      new, start, end = BalanceSnapshot(), month, after
+    elif month < first.month:
+      # Nothing before the oldest snapshot
+      new, start, end = BalanceSnapshot(), month, first.month - datetime.timedelta(days=1)
+    else:
+      # Nothing after the newest snapshot either
+      new, start, end = last, next_month(last.month), after
+    months = []
+    while start <= end:
+      months.append(BalanceSnapshot(user_id=user_id, month=start, income=new.income, expense=new.expense))
+      start = next_month(start)
+    self.bulk_create(months, batch_size=1000, ignore_conflicts=True)
+
+  def rebuild(self, user_ids=None):
+    # From the monthly rollups, which must be up to date
+    with transaction.atomic():
+      snapshots = self.all()
+      rollups = MonthlyRollup.objects.all()
+      if user_ids is not None:
+        snapshots = snapshots.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+      snapshots.delete()
+      rows = (
+        rollups.values('user_id', 'year', 'month', 'kind').annotate(total=sum_cents('total'))
+        .order_by('user_id', 'year', 'month')
+      )
+      totals = {}
+      for row in rows.iterator():
+        totals.setdefault(row['user_id'], {}).setdefault(datetime.date(row['year'], row['month'], 1), {})[row['kind']] = row['total']
+      new = []
+      for user_id, months in totals.items():
+        month, last = min(months), max(months)
+        balance = {kind: 0 for kind in BalanceSnapshot.KIND_FIELDS}
+        while month <= next_month(last):
+          new.append(BalanceSnapshot(
+            user_id=user_id, month=month,
+            **{field: from_cents(balance[kind]) for kind, field in BalanceSnapshot.KIND_FIELDS.items()}
+          ))
+          for kind, total in months.get(month, {}).items():
+            balance[kind] += total
+          month = next_month(month)
+      self.bulk_create(new, batch_size=1000)
+
+class BalanceSnapshot(models.Model):
+  # The total of each MonthlyRollup kind
+  KIND_FIELDS = {
+    MonthlyRollup.INCOME: 'income',
+    MonthlyRollup.EXPENSE: 'expense',
+  }
+  user = models.ForeignKey(User, related_name='balance_snapshots', on_delete=models.CASCADE)
+  # First day of the month
+  month = models.DateField()
+  income = CentsField(default=0.00, max_digits=15)
+  expense = CentsField(default=0.00, max_digits=15)
+
+  objects = BalanceSnapshotManager()
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['user', 'month'], name='unique_balance_snapshot'),
+    ]
+
+class RollupMixin:
+  # Set by the models: MonthlyRollup kind and the field used as its category
+  rollup_kind = None
+  rollup_category = None
+
+  def rollup_values(self):
+    # Normalize the values the way they are stored, as they may still be
+    # strings or floats when the object was built by hand. The amount is in cents.
+    date = self._meta.get_field('date').to_python(self.date)
+    amount = to_cents(self._meta.get_field('amount').to_python(self.amount))
+    return self.user_id, date, getattr(self, self.rollup_category), amount
+
+  def save(self, *args, **kwargs):
+    with transaction.atomic():
+      user_ids = {self.user_id}
+      if self.pk is not None:
+        previous = (
+          type(self).objects.select_for_update().filter(pk=self.pk)
+          .values_list('user_id', 'date', self.rollup_category, cents('amount')).first()
+        )
+        if previous is not None:
+          user_id, date, category, amount = previous
+          MonthlyRollup.objects.apply(user_id, self.rollup_kind, date, category, -amount, -1)
+          user_ids.add(user_id)
+      super().save(*args, **kwargs)
+      user_id, date, category, amount = self.rollup_values()
+      MonthlyRollup.objects.apply(user_id, self.rollup_kind, date, category, amount, 1)
+      User.bump_data_version(user_ids)
+
+class RecurrenceMixin:
+  # Columns derived from 'interval', 'type' and 'date' on every save
+  schedule_fields = ['interval_years', 'interval_months', 'interval_days', 'next_due']
+
+  @property
+  def schedule(self):
+    return (self.interval_years, self.interval_months, self.interval_days)
+
+  def set_schedule(self, today=None):
+    try:
+      self.interval_years, self.interval_months, self.interval_days = recurrence.parse_interval(self.interval)
+    except ValueError as e:
+      raise ValidationError({'interval': str(e)})
+    self.next_due = None
+    if self.type:
+      date = self._meta.get_field('date').to_python(self.date)
+      self.next_due = recurrence.next_occurrence(date, self.schedule, today or datetime.date.today())
+
+  def save(self, *args, **kwargs):
+    self.set_schedule()
+    if kwargs.get('update_fields') is not None:
+      kwargs['update_fields'] = set(kwargs['update_fields']) | set(self.schedule_fields)
+    super().save(*args, **kwargs)
+
 # GC: Added max_digit in 'amount' field.
-class Income(models.Model):
+class Income(RecurrenceMixin, RollupMixin, models.Model):
   INCOME_CATEGORY_CHOICES = [
     ('SALARY', 'Salary'),
     ('INVESTMENT', 'Investment'),
@@ -43,16 +317,32 @@ class Income(models.Model):
     (False, 'Non-fixed')
   ]
   user = models.ForeignKey(User, related_name='incomes', on_delete=models.CASCADE)
-  amount = models.DecimalField(default=0.00, max_digits=10, decimal_places=2)
+  amount = CentsField(default=0.00, max_digits=10)
   source = models.CharField(choices=INCOME_CATEGORY_CHOICES, max_length=100, default='OTHER')
   description = models.CharField(max_length=150, default='')
   type = models.BooleanField(choices=INCOME_TYPE_CHOICES, default=False, blank=False)
   interval = models.CharField(max_length=10, validators=[interval_validator], blank=True)
   date = models.DateField()
+  # Parsed 'interval' and the first occurrence due on or after the last save
+  interval_years = models.PositiveSmallIntegerField(default=0, editable=False)
+  interval_months = models.PositiveSmallIntegerField(default=0, editable=False)
+  interval_days = models.PositiveSmallIntegerField(default=0, editable=False)
+  next_due = models.DateField(null=True, blank=True, editable=False)
+
+  rollup_kind = MonthlyRollup.INCOME
+  rollup_category = 'source'
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['user', 'date'], name='income_user_date_idx'),
+      models.Index(fields=['user', 'source', 'date'], name='income_user_source_date_idx'),
+      models.Index(fields=['user', 'type', 'date'], name='income_user_type_date_idx'),
+      models.Index(fields=['user', 'next_due'], condition=models.Q(type=True), name='income_user_next_due_idx'),
+    ]
 
 # GC: Added max_digit in 'amount' field.
 
-class Expense(models.Model):
+class Expense(RecurrenceMixin, RollupMixin, models.Model):
   EXPENSE_CATEGORY_CHOICES = [
     ('FOOD', 'Food'),
     ('HOUSING', 'Housing'),
@@ -75,9 +365,25 @@ class Expense(models.Model):
     (False, 'Non-recurring')
   ]
   user = models.ForeignKey(User, related_name='expenses', on_delete=models.CASCADE)
-  amount = models.DecimalField(default=0.00, max_digits=10, decimal_places=2)
+  amount = CentsField(default=0.00, max_digits=10)
   category = models.CharField(choices=EXPENSE_CATEGORY_CHOICES, max_length=50, default='OTHER')
   description = models.CharField(max_length=150, default='')
   type = models.BooleanField(choices=EXPENSE_TYPE_CHOICES, default=False, blank=False)
   interval = models.CharField(max_length=10, validators=[interval_validator], blank=True)
   date = models.DateField()
+  # Parsed 'interval' and the first occurrence due on or after the last save
+  interval_years = models.PositiveSmallIntegerField(default=0, editable=False)
+  interval_months = models.PositiveSmallIntegerField(default=0, editable=False)
+  interval_days = models.PositiveSmallIntegerField(default=0, editable=False)
+  next_due = models.DateField(null=True, blank=True, editable=False)
+
+  rollup_kind = MonthlyRollup.EXPENSE
+  rollup_category = 'category'
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['user', 'date'], name='expense_user_date_idx'),
+      models.Index(fields=['user', 'category', 'date'], name='expense_user_category_date_idx'),
+      models.Index(fields=['user', 'type', 'date'], name='expense_user_type_date_idx'),
+      models.Index(fields=['user', 'next_due'], condition=models.Q(type=True), name='expense_user_next_due_idx'),
+    ]
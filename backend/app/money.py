@@ -0,0 +1,78 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+
+from django.db import models
+from django.db.models import ExpressionWrapper, F, Sum
+from django.db.models.functions import Cast
+
+"""
+Money
+
+Amounts are stored as 64-bit integers of cents by CentsField, which reads
+and writes exact Decimal values with two decimal places, so models, forms
+and serializers see the same values as with a DecimalField. Code that only
+adds amounts up reads the integers themselves instead, with cents() and
+sum_cents(), and converts the results once with from_cents().
+"""
+
+CENT = Decimal('0.01')
+
+def to_cents(value):
+  """
+  The number of cents of a Decimal (or int) amount, rounded half to even
+  like DecimalField.
+  """
+  return int(Decimal(value).quantize(CENT, rounding=ROUND_HALF_EVEN).scaleb(2))
+
+def from_cents(cents):
+  # Exact, and already quantized to two places
+  return Decimal(int(cents)).scaleb(-2)
+
+def format_cents(cents):
+  # The DecimalField representation of an amount, without a Decimal. The
+  # float is within 0.001 of the amount up to 15 digits, so rounding it to
+  # two places gives the amount back.
+  return f'{cents / 100:.2f}'
+
+def cents(name):
+  """
+  A CentsField column read as its int of cents, e.g. in values_list().
+  """
+  return ExpressionWrapper(F(name), output_field=models.BigIntegerField())
+
+def sum_cents(name):
+  """
+  Sum of a CentsField column as an int of cents (PostgreSQL sums bigint
+  into numeric, hence the cast).
+  """
+  return Cast(Sum(name), models.BigIntegerField())
+
+class CentsField(models.DecimalField):
+  """
+  A DecimalField with two decimal places stored in a bigint column as
+  cents. max_digits still bounds the values.
+  """
+  def __init__(self, verbose_name=None, name=None, max_digits=None, **kwargs):
+    kwargs['decimal_places'] = 2
+    super().__init__(verbose_name, name, max_digits, **kwargs)
+
+  def deconstruct(self):
+    name, path, args, kwargs = super().deconstruct()
+    del kwargs['decimal_places']
+    return name, path, args, kwargs
+
+  def get_internal_type(self):
+    return 'BigIntegerField'
+
+  def from_db_value(self, value, expression, connection):
+    return None if value is None else from_cents(value)
+
+  def get_db_prep_value(self, value, connection, prepared=False):
+    # Also used for lookups: the value compared has to be in cents as well
+    if hasattr(value, 'as_sql'):
+      return value
+    if not prepared:
+      value = self.get_prep_value(value)
+    return None if value is None else to_cents(value)
+
+  def get_db_prep_save(self, value, connection):
+    return self.get_db_prep_value(value, connection)
@@ -0,0 +1,71 @@
+import base64
+import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import replace_query_param
+
+"""
+Keyset pagination for the income and expense lists
+"""
+
+class DateCursorPagination(BasePagination):
+  """
+  Pages ordered by (date, id) descending. The cursor is the (date, id) of
+  the last row of the previous page, so each page is a range read on the
+  (user, date) index instead of an OFFSET, and rows inserted meanwhile do
+  not shift the following pages.
+  """
+  page_size = 100
+  max_page_size = 1000
+  page_size_query_param = 'page_size'
+  cursor_query_param = 'cursor'
+  invalid_cursor_message = 'Invalid cursor'
+
+  def paginate_queryset(self, queryset, request, view=None, key=None):
+    # key gives the (date, id) of a result row, for rows that are not
+    # model instances such as values_list() tuples
+    self.request = request
+    self.page_size = self.get_page_size(request)
+    self.cursor = self.decode_cursor(request)
+
+    queryset = queryset.order_by('-date', '-id')
+    if self.cursor is not None:
+      date, id = self.cursor
+      queryset = queryset.filter(Q(date__lt=date) | Q(id__lt=id), date__lte=date)
+
+    results = list(queryset[:self.page_size + 1])
+    self.next_cursor = None
+    if len(results) > self.page_size:
+      results = results[:self.page_size]
+      last = results[-1]
+      self.next_cursor = key(last) if key is not None else (last.date, last.id)
+    return results
+
+  def get_page_size(self, request):
+    try:
+      page_size = int(request.query_params[self.page_size_query_param])
+    except (KeyError, ValueError):
+      return self.page_size
+    return min(max(page_size, 1), self.max_page_size)
+
+  def decode_cursor(self, request):
+    encoded = request.query_params.get(self.cursor_query_param, None)
+    if not encoded:
+      return None
+    try:
+      date, id = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split(':')
+      return datetime.date.fromisoformat(date), int(id)
+    except (ValueError, UnicodeError):
+      raise NotFound(self.invalid_cursor_message)
+
+  def encode_cursor(self, cursor):
+    date, id = cursor
+    return base64.urlsafe_b64encode(f"{date.isoformat()}:{id}".encode('ascii')).decode('ascii')
+
+  def get_next_link(self):
+    if self.next_cursor is None:
+      return None
+    url = self.request.build_absolute_uri()
+    return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_cursor))
@@ -0,0 +1,238 @@
+import cProfile
+import datetime
+import fnmatch
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from .metrics import route_of
+
+"""
+Request profiling
+
+ProfilingMiddleware runs the selected requests, the view and the
+rendering of its response, under cProfile or a sampler of the request's
+stack. A request is selected when:
+  PROFILING_ENABLED is on (every request),
+  its X-Profile header matches PROFILING_TOKEN, or
+  it is drawn at PROFILING_SAMPLE_RATE,
+and, except with the header, its route matches one of PROFILING_ROUTES
+(shell patterns, e.g. "*graphData"; empty for every route).
+
+Each profile is written to PROFILING_DIR with a .json file of the URL,
+route, user and timings, and only the newest PROFILING_MAX_FILES are
+kept. `manage.py profile_summary` adds them up.
+
+Under ASGI the profile is of the thread that runs the request's sync code:
+sync views, the rendering of their responses, and the ORM calls of async
+views. The code of async views, which runs in the event loop, is left out.
+"""
+
+HEADER = 'X-Profile'
+MODE_HEADER = 'X-Profile-Mode'
+MODES = ('cprofile', 'sampler')
+
+class StackSampler:
+  """
+  Counts the stacks of one thread, read every interval seconds from
+  another thread. Much cheaper than cProfile on deep call trees, at the
+  cost of missing short calls; the GIL makes the actual interval at least
+  sys.getswitchinterval().
+  """
+  def __init__(self, interval):
+    self.interval = interval
+    self.stacks = Counter()
+    self.samples = 0
+    self.thread_id = threading.get_ident()
+    self.done = threading.Event()
+    self.thread = threading.Thread(target=self.run, daemon=True)
+
+  def run(self):
+    while not self.done.wait(self.interval):
+      frame = sys._current_frames().get(self.thread_id)
+      stack = []
+      while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_filename}:{code.co_firstlineno}({code.co_name})')
+        frame = frame.f_back
+      self.stacks[';'.join(reversed(stack))] += 1
+      self.samples += 1
+
+  def start(self):
+    self.thread.start()
+
+  def stop(self):
+    self.done.set()
+    self.thread.join()
+
+class Profiler:
+  """
+  A profile of the calling thread between start() and stop(), with the
+  wall and CPU time in between.
+  """
+  def __init__(self, mode):
+    self.mode = mode
+    self.profile = None
+
+  def start(self):
+    if self.mode == 'cprofile':
+      self.profile = cProfile.Profile()
+    else:
+      # Samples the thread that creates it
+      self.profile = StackSampler(getattr(settings, 'PROFILING_INTERVAL', 0.001))
+    self.wall, self.cpu = time.perf_counter(), time.thread_time()
+    if self.mode == 'cprofile':
+      self.profile.enable()
+    else:
+      self.profile.start()
+
+  def stop(self):
+    if self.mode == 'cprofile':
+      self.profile.disable()
+    else:
+      self.profile.stop()
+    self.wall, self.cpu = time.perf_counter() - self.wall, time.thread_time() - self.cpu
+
+def selected_routes(request):
+  # Whether the route of the request matches PROFILING_ROUTES
+  patterns = getattr(settings, 'PROFILING_ROUTES', [])
+  if not patterns:
+    return True
+  try:
+    match = resolve(request.path_info)
+  except Resolver404:
+    return False
+  route = match.url_name or match.route
+  return any(fnmatch.fnmatchcase(route, pattern) for pattern in patterns)
+
+def select(request):
+  """
+  The mode to profile the request with, or None.
+  """
+  mode = getattr(settings, 'PROFILING_MODE', 'cprofile')
+  token = getattr(settings, 'PROFILING_TOKEN', '')
+  if token and request.headers.get(HEADER) == token:
+    requested = request.headers.get(MODE_HEADER)
+    return requested if requested in MODES else mode
+  if getattr(settings, 'PROFILING_ENABLED', False) or random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0):
+    return mode if selected_routes(request) else None
+  return None
+
+"""
+Profiles directory
+"""
+
+def profile_dir():
+  return str(getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+def slug(route):
+  return re.sub(r'[^A-Za-z0-9]+', '-', route).strip('-')[:60] or 'root'
+
+def rotate(directory, keep):
+  # Remove the oldest profiles beyond keep, with their metadata
+  names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+  for name in names[:max(0, len(names) - keep)]:
+    base = name[:-len('.json')]
+    for extension in ('.json', '.prof', '.stacks'):
+      try:
+        os.remove(os.path.join(directory, base + extension))
+      except FileNotFoundError:
+        pass
+
+def request_user(request, match):
+  # The authenticated user, or else the user whose data the route reads
+  user = getattr(request, 'user', None)
+  if user is not None and user.is_authenticated:
+    return user.pk
+  if match is not None and match.route.startswith('api/users/<int:pk>'):
+    return match.kwargs['pk']
+  return None
+
+def save(request, response, profiler):
+  mode, profile = profiler.mode, profiler.profile
+  directory = profile_dir()
+  os.makedirs(directory, exist_ok=True)
+  now = datetime.datetime.now(datetime.timezone.utc)
+  route = route_of(request)
+  # Names sort by time, which rotate() relies on
+  base = f"{now.strftime('%Y%m%dT%H%M%S.%f')}-{slug(route)}-{random.getrandbits(32):08x}"
+
+  if mode == 'cprofile':
+    profile.dump_stats(os.path.join(directory, base + '.prof'))
+  else:
+    with open(os.path.join(directory, base + '.stacks'), 'w') as file:
+      for stack, count in profile.stacks.most_common():
+        file.write(f'{stack} {count}\n')
+
+  match = getattr(request, 'resolver_match', None)
+  metadata = {
+    'time': now.isoformat(),
+    'mode': mode,
+    'method': request.method,
+    'url': request.get_full_path(),
+    'route': route,
+    'kwargs': dict(match.kwargs) if match else {},
+    'user': request_user(request, match),
+    'status': response.status_code,
+    'wall_ms': round(profiler.wall * 1000, 3),
+    'cpu_ms': round(profiler.cpu * 1000, 3),
+  }
+  if mode == 'sampler':
+    metadata['samples'] = profile.samples
+  with open(os.path.join(directory, base + '.json'), 'w') as file:
+    json.dump(metadata, file, indent=2)
+  rotate(directory, getattr(settings, 'PROFILING_MAX_FILES', 200))
+  return base
+
+"""
+Middleware
+"""
+
+class ProfilingMiddleware:
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+    self.is_async = iscoroutinefunction(get_response)
+    if self.is_async:
+      markcoroutinefunction(self)
+
+  def __call__(self, request):
+    if self.is_async:
+      return self.__acall__(request)
+    mode = select(request)
+    if mode is None:
+      return self.get_response(request)
+
+    profiler = Profiler(mode)
+    profiler.start()
+    try:
+      response = self.get_response(request)
+    finally:
+      profiler.stop()
+    response['X-Profile-Id'] = save(request, response, profiler)
+    return response
+
+  async def __acall__(self, request):
+    mode = select(request)
+    if mode is None:
+      return await self.get_response(request)
+
+    # Started and stopped in the thread the request's sync code runs in
+    profiler = Profiler(mode)
+    await sync_to_async(profiler.start, thread_sensitive=True)()
+    try:
+      response = await self.get_response(request)
+    finally:
+      await sync_to_async(profiler.stop, thread_sensitive=True)()
+    response['X-Profile-Id'] = await sync_to_async(save)(request, response, profiler)
+    return response
@@ -0,0 +1,64 @@
+import calendar
+import datetime
+import math
+import re
+
+"""
+Recurring items
+
+An interval is written as "yy-mm-dd" and stored as three integer columns.
+The k-th occurrence of an item is its date plus k times the interval, so
+any occurrence can be computed directly instead of stepping through them.
+"""
+
+# The number of years can't exceed 10, months 11 and days 30.
+INTERVAL_REGEX = r"^([0-9]|10)-([0-9]|1[0-1])-([0-9]|[12][0-9]|30)$"
+INTERVAL_PATTERN = re.compile(INTERVAL_REGEX)
+
+# Average length of a month in the Gregorian calendar
+DAYS_PER_MONTH = 365.2425 / 12
+
+def parse_interval(interval):
+  """
+  Parse a "yy-mm-dd" interval into (years, months, days).
+  An empty interval is (0, 0, 0). Raises ValueError on anything else.
+  """
+  if not interval:
+    return (0, 0, 0)
+  match = INTERVAL_PATTERN.match(interval)
+  if match is None:
+    raise ValueError(f"The interval format is wrong: {interval!r}")
+  return tuple(int(n) for n in match.groups())
+
+def add_months(date:datetime.date, months):
+  index = date.year * 12 + date.month - 1 + months
+  year, month = divmod(index, 12)
+  day = min(date.day, calendar.monthrange(year, month + 1)[1])
+  return datetime.date(year, month + 1, day)
+
+def occurrence(date:datetime.date, interval, k):
+  """
+  The k-th occurrence of an item starting on date, 0 being the date itself.
+  """
+  years, months, days = interval
+  return add_months(date, (years * 12 + months) * k) + datetime.timedelta(days=days * k)
+
+def next_occurrence(date:datetime.date, interval, on_or_after:datetime.date):
+  """
+  First occurrence on or after the given day, or None if an item without
+  interval is already past. Runs in constant time whatever the distance.
+  """
+  if date >= on_or_after:
+    return date
+  years, months, days = interval
+  step = (years * 12 + months) * DAYS_PER_MONTH + days
+  if step == 0:
+    return None
+  # Month lengths vary by a few days around the average, which puts the
+  # estimate at most a step away from the answer.
+  k = max(1, math.ceil((on_or_after - date).days / step))
+  while k > 1 and occurrence(date, interval, k - 1) >= on_or_after:
+    k -= 1
+  while occurrence(date, interval, k) < on_or_after:
+    k += 1
+  return occurrence(date, interval, k)
@@ -1,5 +1,9 @@
+import operator
+
+from django.db import models
 from rest_framework import serializers
 from .models import User, Income, Expense
+from .money import CentsField, cents, format_cents, to_cents
 
 # Create Serializers Here
 
@@ -17,6 +21,84 @@ class UserSerializer(serializers.ModelSerializer):
     incomes = IncomeSerializer(many=True)
     expenses = ExpenseSerializer(many=True)
 
+    # Nested relations, only serialized when asked for
+    EXPANDABLE_FIELDS = ['incomes', 'expenses']
+
     class Meta:
         model = User
         fields = ['first_name', 'last_name', 'username', 'email', 'income_goal', 'expense_budget', 'incomes', 'expenses']
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        # fields: profile fields to keep (all of them by default)
+        # expand: nested relations to include (all of them by default)
+        super().__init__(*args, **kwargs)
+        keep = set(self.fields) - set(self.EXPANDABLE_FIELDS) if fields is None else set(fields)
+        keep |= set(self.EXPANDABLE_FIELDS) if expand is None else set(expand)
+        for name in set(self.fields) - keep:
+            self.fields.pop(name)
+
+    @classmethod
+    def profile_fields(cls):
+        return [name for name in cls.Meta.fields if name not in cls.EXPANDABLE_FIELDS]
+
+
+class ValuesSerializer:
+    """
+    Read-only counterpart of a ModelSerializer for long lists. Rows are read
+    as values_list() tuples and each column goes through a converter picked
+    once per field, instead of building model instances and calling every
+    serializer field's to_representation. The output is the same.
+
+    Amounts are read as their ints of cents, which rows keep (e.g. for
+    sums), and formatted without going through Decimal.
+    """
+
+    def __init__(self, serializer_class):
+        model = serializer_class.Meta.model
+        self.fields = list(serializer_class.Meta.fields)
+        self.model_fields = [model._meta.get_field(name) for name in self.fields]
+        self.columns = [cents(field.name) if isinstance(field, CentsField) else field.name for field in self.model_fields]
+        self.converters = [self.get_converter(field) for field in self.model_fields]
+
+    @staticmethod
+    def get_converter(field):
+        # Decimal and date values come back from the database already
+        # quantized and typed, so formatting them is all DRF does
+        if isinstance(field, CentsField):
+            return lambda value: None if value is None else format_cents(value)
+        if isinstance(field, models.DecimalField):
+            return lambda value: None if value is None else '{:f}'.format(value)
+        if isinstance(field, models.DateField) and not isinstance(field, models.DateTimeField):
+            return lambda value: None if value is None else value.isoformat()
+        return None
+
+    def index(self, name):
+        return self.fields.index(name)
+
+    def getter(self, *names):
+        # Reads the named columns of a row, e.g. the (date, id) pagination key
+        return operator.itemgetter(*(self.index(name) for name in names))
+
+    def values_list(self, queryset, *extra):
+        # Serialized columns first, then any extra columns the caller needs
+        return queryset.values_list(*self.columns, *extra)
+
+    def row(self, obj):
+        # The row of a saved instance, as values_list() would read it
+        return tuple(
+            to_cents(getattr(obj, field.attname)) if isinstance(field, CentsField) else getattr(obj, field.attname)
+            for field in self.model_fields
+        )
+
+    def to_representation(self, row):
+        return {
+            name: value if convert is None else convert(value)
+            for name, convert, value in zip(self.fields, self.converters, row)
+        }
+
+    def data(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+income_values = ValuesSerializer(IncomeSerializer)
+expense_values = ValuesSerializer(ExpenseSerializer)
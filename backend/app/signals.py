@@ -0,0 +1,35 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import User, MonthlyRollup, Income, Expense
+
+# Set while the caller updates the rollups of the rows it deletes itself,
+# once per month and category (see batch.py)
+rollups_applied = ContextVar('rollups_applied', default=False)
+
+@contextmanager
+def bulk_delete():
+  token = rollups_applied.set(True)
+  try:
+    yield
+  finally:
+    rollups_applied.reset(token)
+
+# post_delete runs inside the deletion transaction, for single objects as
+# well as queryset and cascade deletes, so the rollups stay in step.
+@receiver(post_delete, sender=Income)
+@receiver(post_delete, sender=Expense)
+def remove_from_rollup(sender, instance, **kwargs):
+  if rollups_applied.get():
+    return
+  user_id, date, category, amount = instance.rollup_values()
+  MonthlyRollup.objects.apply(user_id, instance.rollup_kind, date, category, -amount, -1)
+  User.bump_data_version([user_id])
+
+# The user list's marker is the newest data version (see caching.users_marker),
+# which has to move on when a user is gone as well
+@receiver(post_delete, sender=User)
+def remove_user(sender, instance, **kwargs):
+  User.bump_data_version(User.objects.order_by('-data_version').values_list('pk', flat=True)[:1])
@@ -0,0 +1,101 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+from .models import User, Income, Expense, MonthlyRollup
+
+"""
+Synthetic ledgers
+
+Users with a few years of history: a monthly salary and some occasional
+income, a monthly rent, and everyday expenses spread over each month. A
+share of the rows is recurring, with the intervals people actually use.
+Rows are written with bulk_create and the rollups rebuilt once, so large
+datasets take seconds. The same seed gives the same ledgers.
+"""
+
+# Recurring intervals, most common first (see recurrence.parse_interval)
+INTERVALS = ['0-1-0', '0-1-0', '0-0-14', '0-0-7', '0-3-0', '1-0-0']
+
+# Category weights and amount ranges of the everyday rows. bulk_create
+# doesn't validate, so these must be among the models' choices.
+INCOME_MIX = [('INVESTMENT', 2, (20, 400)), ('INTEREST', 2, (1, 40)), ('BUSINESS', 1, (100, 1500)), ('OTHER', 1, (10, 200))]
+EXPENSE_MIX = [
+  ('FOOD', 10, (5, 120)),
+  ('TRANSPORTATION', 5, (2, 80)),
+  ('ENTERTAINMENT', 3, (10, 150)),
+  ('HOUSEHOLD', 2, (30, 200)),
+  ('MEDICAL', 1, (20, 400)),
+  ('OTHER', 2, (5, 300)),
+]
+
+def months(today, years):
+  # First day of each month of the history, oldest first
+  year, month = today.year - years, today.month
+  while (year, month) <= (today.year, today.month):
+    yield datetime.date(year, month, 1)
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+def day_of(rng, month, today):
+  # A random day of the month, not after today
+  last = (month.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+  if month.year == today.year and month.month == today.month:
+    last = today
+  return month.replace(day=rng.randint(1, last.day))
+
+def money(rng, low, high):
+  return Decimal(rng.uniform(low, high)).quantize(Decimal('0.01'))
+
+def pick(rng, mix):
+  category, weight, (low, high) = rng.choices(mix, weights=[weight for category, weight, amounts in mix])[0]
+  return category, money(rng, low, high)
+
+def ledger_rows(user, rng, today, years, expenses_per_month, recurring):
+  """
+  The unsaved incomes and expenses of one user, with their schedules set.
+  recurring is the share of the everyday rows that recur.
+  """
+  salary = money(rng, 2000, 6000)
+  rent = (salary * Decimal(rng.uniform(0.25, 0.4))).quantize(Decimal('0.01'))
+  incomes, expenses = [], []
+  for month in months(today, years):
+    incomes.append(Income(user=user, amount=salary, source='SALARY', description='Salary', date=month))
+    expenses.append(Expense(user=user, amount=rent, category='HOUSING', description='Rent', date=month))
+    for _ in range(rng.randint(0, 2)):
+      source, amount = pick(rng, INCOME_MIX)
+      incomes.append(Income(user=user, amount=amount, source=source, date=day_of(rng, month, today)))
+    for _ in range(rng.randint(expenses_per_month // 2, expenses_per_month * 3 // 2)):
+      category, amount = pick(rng, EXPENSE_MIX)
+      expenses.append(Expense(user=user, amount=amount, category=category, date=day_of(rng, month, today)))
+
+  for obj in incomes + expenses:
+    if rng.random() < recurring:
+      obj.type = True
+      obj.interval = rng.choice(INTERVALS)
+    obj.set_schedule(today)
+  return incomes, expenses
+
+def generate(users=10, years=3, expenses_per_month=30, recurring=0.05, seed=0, batch_size=5000, today=None):
+  """
+  Create users with synthetic ledgers. Returns the ids of the new users.
+  """
+  rng = random.Random(seed)
+  today = today or datetime.date.today()
+  with transaction.atomic():
+    # Usernames are unique: number them after the last user
+    first = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    created = User.objects.bulk_create([
+      User(username=f'synthetic{first + n}', email=f'synthetic{first + n}@email.com',
+           income_goal=rng.randrange(2000, 8000, 100), expense_budget=rng.randrange(1000, 5000, 100))
+      for n in range(users)
+    ])
+    # bulk_create only sets the ids on backends that return them
+    user_ids = list(User.objects.filter(username__in=[user.username for user in created]).order_by('id').values_list('id', flat=True))
+    for user_id in user_ids:
+      incomes, expenses = ledger_rows(User(pk=user_id), rng, today, years, expenses_per_month, recurring)
+      Income.objects.bulk_create(incomes, batch_size=batch_size)
+      Expense.objects.bulk_create(expenses, batch_size=batch_size)
+    MonthlyRollup.objects.rebuild(user_ids)
+  return user_ids
@@ -1,5 +1,36 @@
-from django.test import TestCase
-from app.models import User, Income, Expense
+import csv
+import datetime
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from unittest import skipUnless
+
+from dateutil.relativedelta import relativedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from asgiref.sync import sync_to_async
+from django.test import TestCase, RequestFactory, AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from app.models import User, Income, Expense, MonthlyRollup, BalanceSnapshot
+from app import analytics, authentication, recurrence, forecast, importers, exporters, caching, views, async_views, dashboard, synthetic, metrics, money
+from app.pagination import DateCursorPagination
+from benchmarks import endpoints, startup
+from app.serializers import IncomeSerializer, ExpenseSerializer, income_values, expense_values
 
 # Create your tests here.
 
@@ -62,6 +93,17 @@ class UserTestCase(TestCase):
     def test_username_field(self):
         self.assertEqual(User.USERNAME_FIELD, 'username')
 
+    def test_data_version(self):
+        version = self.user.data_version
+        self.user.save()
+        self.assertGreater(self.user.data_version, version)
+        # A second save bumps it again, and the instance stays usable
+        version = self.user.data_version
+        self.user.first_name = 'Other'
+        self.user.save(update_fields=['first_name'])
+        self.assertGreater(self.user.data_version, version)
+        self.assertEqual(User.objects.get(pk=self.user.pk).data_version, self.user.data_version)
+
 
 class IncomeTestCase(TestCase):
     def setUp(self):
@@ -175,4 +217,1595 @@ class ExpenseTestCase(TestCase):
           (False, 'Non-recurring')
         ])
 
-        self.assertEqual(Expense._meta.get_field('type').max_length, 20)
\ No newline at end of file
+        self.assertEqual(Expense._meta.get_field('type').max_length, 20)
+
+class GraphDataTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+        self.today = datetime.date.today()
+        for days in range(0, 1200, 9):
+            date = self.today - datetime.timedelta(days=days)
+            Income.objects.create(user=self.user, amount=100, date=date)
+            Expense.objects.create(user=self.user, amount=30, date=date)
+        # Future items are not part of the net income so far
+        Income.objects.create(user=self.user, amount=1000, date=self.today + datetime.timedelta(days=3))
+
+    def naive_sum(self, model, start, end):
+        total = model.objects.filter(user=self.user, date__gte=start, date__lte=end).aggregate(Sum('amount')).get('amount__sum')
+        return total or 0
+
+    def test_query_count_is_constant(self):
+        for scale in analytics.SCALES:
+            # The user's data version, then the sums
+            with self.assertNumQueries(4):
+                response = self.client.get(f'/api/users/{self.user.id}/graphData', {'scale': scale})
+            self.assertEqual(response.status_code, 200)
+
+    def test_series_match_per_bucket_sums(self):
+        for scale in analytics.SCALES:
+            buckets = analytics.get_buckets(scale, self.today)
+            data = self.client.get(f'/api/users/{self.user.id}/graphData', {'scale': scale}).json()
+
+            expected_list = [
+                float(self.naive_sum(Income, start, end) - self.naive_sum(Expense, start, end))
+                for start, end in reversed(buckets)
+            ]
+            self.assertEqual(list(data['net_income_list'].values()), expected_list)
+
+            net_income_so_far = self.naive_sum(Income, datetime.date.min, self.today) - self.naive_sum(Expense, datetime.date.min, self.today)
+            flow = list(data['net_income_flow'].values())
+            self.assertEqual(flow[-1], float(net_income_so_far))
+            self.assertEqual(len(flow), len(buckets))
+
+    def test_unknown_scale(self):
+        response = self.client.get(f'/api/users/{self.user.id}/graphData', {'scale': '2w'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CategoryStatTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+        Expense.objects.create(user=self.user, amount=75, category='FOOD', date='2023-06-01')
+        Expense.objects.create(user=self.user, amount=25, category='HOUSING', date='2023-06-15')
+        Expense.objects.create(user=self.user, amount=100, category='FOOD', date='2023-07-01')
+        Income.objects.create(user=self.user, amount=300, source='SALARY', date='2023-06-01')
+        Income.objects.create(user=self.user, amount=100, source='INTEREST', date='2023-06-02')
+
+    def test_expense_stat(self):
+        # The page, the user's data version and the rollups
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/users/{self.user.id}/expenses', {'year': 2023, 'month': 6})
+        data = response.json()
+        self.assertEqual(len(data['list']), 2)
+        self.assertEqual(data['stat']['FOOD'], 75.0)
+        self.assertEqual(data['stat']['HOUSING'], 25.0)
+        self.assertEqual(data['stat']['OTHER'], 0.0)
+        self.assertEqual(len(data['stat']), len(Expense.EXPENSE_CATEGORY_CHOICES))
+
+    def test_income_stat(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/users/{self.user.id}/incomes')
+        data = response.json()
+        self.assertEqual(data['stat']['SALARY'], 75.0)
+        self.assertEqual(data['stat']['INTEREST'], 25.0)
+        self.assertEqual(len(data['stat']), len(Income.INCOME_CATEGORY_CHOICES))
+
+    def test_empty_stat(self):
+        response = self.client.get(f'/api/users/{self.user.id}/expenses', {'year': 2020, 'month': 1})
+        data = response.json()
+        self.assertEqual(data['list'], [])
+        self.assertTrue(all(value == 0.0 for value in data['stat'].values()))
+
+
+class MonthlyRollupTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+
+    def rollups(self):
+        return {
+            (r.year, r.month, r.kind, r.category): (r.total, r.count)
+            for r in MonthlyRollup.objects.filter(user=self.user)
+        }
+
+    def test_create_update_delete(self):
+        expense = Expense.objects.create(user=self.user, amount=10, category='FOOD', date='2023-06-01')
+        Expense.objects.create(user=self.user, amount=5.5, category='FOOD', date='2023-06-20')
+        self.assertEqual(self.rollups(), {(2023, 6, 'EXPENSE', 'FOOD'): (Decimal('15.50'), 2)})
+
+        expense.amount = 20
+        expense.category = 'HOUSING'
+        expense.date = '2023-07-02'
+        expense.save()
+        self.assertEqual(self.rollups(), {
+            (2023, 6, 'EXPENSE', 'FOOD'): (Decimal('5.50'), 1),
+            (2023, 7, 'EXPENSE', 'HOUSING'): (Decimal('20.00'), 1),
+        })
+
+        expense.delete()
+        Expense.objects.filter(user=self.user).delete()
+        self.assertEqual(self.rollups(), {})
+
+    def test_user_delete(self):
+        Income.objects.create(user=self.user, amount=10, source='SALARY', date='2023-06-01')
+        self.user.delete()
+        self.assertFalse(MonthlyRollup.objects.exists())
+
+    def test_rebuild(self):
+        Income.objects.create(user=self.user, amount=10, source='SALARY', date='2023-06-01')
+        Income.objects.create(user=self.user, amount=2.25, source='SALARY', date='2023-06-30')
+        Expense.objects.create(user=self.user, amount=7, category='FOOD', date='2023-08-01')
+        incremental = self.rollups()
+        MonthlyRollup.objects.all().delete()
+        MonthlyRollup.objects.rebuild()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_range_totals(self):
+        for days in range(0, 400, 7):
+            date = datetime.date(2023, 1, 15) + datetime.timedelta(days=days)
+            Income.objects.create(user=self.user, amount=100, date=date)
+            Expense.objects.create(user=self.user, amount=30, date=date)
+        ranges = [
+            (None, datetime.date(2023, 12, 31)),
+            (None, datetime.date(2023, 12, 30)),
+            (datetime.date(2023, 3, 1), datetime.date(2023, 5, 31)),
+            (datetime.date(2023, 3, 4), datetime.date(2023, 5, 20)),
+            (datetime.date(2023, 3, 4), datetime.date(2023, 3, 20)),
+        ]
+        for start, end in ranges:
+            totals = analytics.range_totals(self.user.id, start, end)
+            for kind, model in analytics.KINDS.items():
+                rows = model.objects.filter(user=self.user, date__lte=end)
+                if start is not None:
+                    rows = rows.filter(date__gte=start)
+                self.assertEqual(totals[kind], money.to_cents(rows.aggregate(Sum('amount')).get('amount__sum') or 0))
+
+    def test_net_income_and_budget(self):
+        other = User.objects.create(username='other', email='other@email.com')
+        today = datetime.date.today()
+        Income.objects.create(user=self.user, amount=100, date=today.replace(day=1))
+        Income.objects.create(user=self.user, amount=50, date='2020-01-10')
+        Expense.objects.create(user=self.user, amount=30, date=today)
+        Income.objects.create(user=other, amount=999, date=today)
+
+        response = self.client.get(f'/api/users/{self.user.id}/netIncome',
+                                   {'year': today.year, 'month': today.month, 'day': today.day})
+        self.assertEqual(response.json()['net_income'], 120.0)
+
+        response = self.client.get(f'/api/users/{self.user.id}/budget', {'incomeGoal': 1, 'expenseBudget': 1})
+        self.assertEqual(response.json()['monthly_total_income'], 100.0)
+        self.assertEqual(response.json()['monthly_total_expense'], 30.0)
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+class QueryPlanTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+        self.start, self.end = analytics.month_range(2023, 6)
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.query_plan(queryset)
+        self.assertRegex(plan, rf'SEARCH .* USING (COVERING )?INDEX {index} ', plan)
+
+    def test_month_filter(self):
+        self.assertUsesIndex(Income.objects.filter(user=self.user, date__gte=self.start, date__lt=self.end), 'income_user_date_idx')
+        self.assertUsesIndex(Expense.objects.filter(user=self.user, date__gte=self.start, date__lt=self.end), 'expense_user_date_idx')
+
+    def test_category_filter(self):
+        self.assertUsesIndex(Income.objects.filter(user=self.user, source='SALARY', date__gte=self.start, date__lt=self.end), 'income_user_source_date_idx')
+        self.assertUsesIndex(Expense.objects.filter(user=self.user, category='FOOD', date__gte=self.start, date__lt=self.end), 'expense_user_category_date_idx')
+
+    def test_next_due_filter(self):
+        self.assertUsesIndex(Expense.objects.filter(user=self.user, type=True, next_due__lte=self.end), 'expense_user_next_due_idx')
+
+    def test_type_filter(self):
+        self.assertUsesIndex(Income.objects.filter(user=self.user, type__in=[True], date__gte=self.start), 'income_user_type_date_idx')
+        self.assertUsesIndex(Expense.objects.filter(user=self.user, type__in=[True], date__gte=self.start), 'expense_user_type_date_idx')
+
+    def test_snapshot_lookup(self):
+        # SQLite creates unique constraints along with the table, under its own index name
+        self.assertUsesIndex(analytics.snapshots_before(self.user, analytics.month_index(self.start), 12), 'sqlite_autoindex_app_balancesnapshot_1')
+
+
+class BalanceSnapshotTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user', email='testuser@email.com')
+
+    def snapshots(self):
+        return {
+            s.month: (s.income, s.expense)
+            for s in BalanceSnapshot.objects.filter(user=self.user).order_by('month')
+        }
+
+    def assertSnapshotsMatchRows(self):
+        snapshots = self.snapshots()
+        months = list(snapshots)
+        self.assertEqual(months, [months[0] + relativedelta(months=n) for n in range(len(months))])
+        for month, (income, expense) in snapshots.items():
+            totals = [
+                model.objects.filter(user=self.user, date__lt=month).aggregate(Sum('amount'))['amount__sum'] or 0
+                for model in (Income, Expense)
+            ]
+            self.assertEqual((income, expense), tuple(totals), month)
+        dates = [date for model in (Income, Expense) for date in model.objects.filter(user=self.user).values_list('date', flat=True)]
+        if dates:
+            self.assertLessEqual(months[0], min(dates))
+            self.assertGreater(months[-1], max(dates))
+
+    def test_writes(self):
+        expense = Expense.objects.create(user=self.user, amount=10, date='2023-06-15')
+        self.assertEqual(self.snapshots(), {
+            datetime.date(2023, 6, 1): (Decimal('0.00'), Decimal('0.00')),
+            datetime.date(2023, 7, 1): (Decimal('0.00'), Decimal('10.00')),
+        })
+        # Before the oldest, after the newest, and in between
+        Income.objects.create(user=self.user, amount='100.25', date='2022-11-30')
+        Income.objects.create(user=self.user, amount=40, date='2024-02-01')
+        Income.objects.create(user=self.user, amount=5, date='2023-08-10')
+        self.assertSnapshotsMatchRows()
+
+        expense.amount = 12
+        expense.date = '2024-01-20'
+        expense.save()
+        self.assertSnapshotsMatchRows()
+        Income.objects.filter(user=self.user, date='2022-11-30').delete()
+        self.assertSnapshotsMatchRows()
+
+        expected = self.snapshots()
+        # The months without rows at the edges are not rebuilt
+        MonthlyRollup.objects.rebuild([self.user.id])
+        self.assertEqual({month: totals for month, totals in expected.items() if month >= datetime.date(2023, 8, 1)}, self.snapshots())
+        self.assertSnapshotsMatchRows()
+
+    def test_batch(self):
+        Income.objects.create(user=self.user, amount=1, date='2023-01-01')
+        response = self.client.post(f'/api/users/{self.user.id}/expenses/batch', {'operations': [
+            {'op': 'create', 'data': {'amount': '5.50', 'date': '2021-03-04'}},
+            {'op': 'create', 'data': {'amount': '7', 'date': '2025-07-01'}},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertSnapshotsMatchRows()
+
+    def test_balance_as_of(self):
+        dates = [datetime.date(1990, 1, 1) + datetime.timedelta(days=days) for days in range(0, 12000, 97)]
+        for date in dates:
+            Income.objects.create(user=self.user, amount=100, date=date)
+            Expense.objects.create(user=self.user, amount='30.10', date=date)
+        for end in [datetime.date(1989, 12, 31), dates[0], datetime.date(2000, 2, 29), datetime.date(2000, 3, 31), dates[-1], datetime.date(2040, 1, 1)]:
+            # One snapshot, and the rows of the month of end unless it ends there
+            with self.assertNumQueries(1 if (end + datetime.timedelta(days=1)).day == 1 else 3):
+                totals = analytics.range_totals(self.user.id, None, end)
+            for kind, model in analytics.KINDS.items():
+                expected = model.objects.filter(user=self.user, date__lte=end).aggregate(Sum('amount'))['amount__sum'] or 0
+                self.assertEqual(totals[kind], money.to_cents(expected), end)
+
+
+class RecurrenceTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+
+    def test_parse_interval(self):
+        self.assertEqual(recurrence.parse_interval('1-2-3'), (1, 2, 3))
+        self.assertEqual(recurrence.parse_interval(''), (0, 0, 0))
+        for interval in ('11-0-0', '0-12-0', '0-0-31', '1-2', '__import__("os")', '1-2-3x'):
+            with self.assertRaises(ValueError):
+                recurrence.parse_interval(interval)
+
+    def test_next_occurrence_matches_stepping(self):
+        anchors = [datetime.date(2001, 1, 31), datetime.date(2019, 2, 28), datetime.date(2020, 2, 29)]
+        intervals = [(0, 0, 1), (0, 0, 30), (0, 1, 0), (0, 3, 0), (1, 0, 0), (0, 1, 15), (10, 11, 30)]
+        days = [datetime.date(2001, 1, 1), datetime.date(2020, 3, 1), datetime.date(2023, 6, 15), datetime.date(2040, 12, 31)]
+        for anchor in anchors:
+            for interval in intervals:
+                for day in days:
+                    k = 0
+                    while recurrence.occurrence(anchor, interval, k) < day:
+                        k += 1
+                    self.assertEqual(recurrence.next_occurrence(anchor, interval, day),
+                                     recurrence.occurrence(anchor, interval, k), (anchor, interval, day))
+
+    def test_next_occurrence_without_interval(self):
+        self.assertIsNone(recurrence.next_occurrence(datetime.date(2020, 1, 1), (0, 0, 0), datetime.date(2021, 1, 1)))
+        self.assertEqual(recurrence.next_occurrence(datetime.date(2022, 1, 1), (0, 0, 0), datetime.date(2021, 1, 1)),
+                         datetime.date(2022, 1, 1))
+
+    def test_schedule_is_saved(self):
+        expense = Expense.objects.create(user=self.user, amount=10, type=True, interval='0-0-7', date='2000-01-01')
+        expense.refresh_from_db()
+        self.assertEqual(expense.schedule, (0, 0, 7))
+        self.assertGreaterEqual(expense.next_due, datetime.date.today())
+        self.assertLess(expense.next_due, datetime.date.today() + datetime.timedelta(days=7))
+        self.assertEqual((expense.next_due - expense.date).days % 7, 0)
+
+        expense.type = False
+        expense.save(update_fields=['type'])
+        expense.refresh_from_db()
+        self.assertIsNone(expense.next_due)
+
+    def test_invalid_interval(self):
+        with self.assertRaises(ValidationError):
+            Expense.objects.create(user=self.user, amount=10, type=True, interval='1+1-0-0', date='2000-01-01')
+
+    def test_upcoming_expenses(self):
+        today = datetime.date.today()
+        daily = Expense.objects.create(user=self.user, amount=1, type=True, interval='0-0-1', date=today - datetime.timedelta(days=5000))
+        Expense.objects.create(user=self.user, amount=2, type=True, interval='1-0-0', date=today + datetime.timedelta(days=60))
+        Expense.objects.create(user=self.user, amount=3, type=False, date=today + datetime.timedelta(days=2))
+        monthly = Expense.objects.create(user=self.user, amount=4, type=True, interval='0-1-0', date=today - datetime.timedelta(days=400))
+        # Let next_due go stale, as it does when days pass after the last save
+        Expense.objects.filter(pk=daily.pk).update(next_due=today - datetime.timedelta(days=100))
+
+        # The data version for the ETag, then one range read
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/users/{self.user.id}/upcomingExpenses')
+        data = response.json()
+        self.assertEqual({row['id'] for row in data}, {daily.id, monthly.id})
+        self.assertEqual(data[0]['date'], today.isoformat())
+        self.assertLessEqual(data[0]['date'], data[1]['date'])
+        # Nothing is written on the request path
+        daily.refresh_from_db()
+        self.assertEqual(daily.date, today - datetime.timedelta(days=5000))
+        self.assertEqual(daily.next_due, today - datetime.timedelta(days=100))
+
+    def test_advance_recurring(self):
+        today = datetime.date.today()
+        expense = Expense.objects.create(user=self.user, amount=1, type=True, interval='0-0-1', date='2000-01-01')
+        Expense.objects.filter(pk=expense.pk).update(next_due='2000-01-01')
+        call_command('advance_recurring', stdout=StringIO())
+        expense.refresh_from_db()
+        self.assertEqual(expense.next_due, today)
+
+    def test_fill_schedule(self):
+        migration = importlib.import_module('app.migrations.0004_recurring_schedule')
+        expense = Expense.objects.create(user=self.user, amount=1, type=True, date='2000-01-01')
+        # Saved under the old validator
+        Expense.objects.filter(pk=expense.pk).update(interval=' 0-01-0 ', interval_months=0, next_due=None)
+        migration.fill_schedule(apps, None)
+        expense.refresh_from_db()
+        self.assertEqual((expense.interval, expense.schedule), ('0-1-0', (0, 1, 0)))
+        self.assertGreaterEqual(expense.next_due, datetime.date.today())
+
+        Expense.objects.filter(pk=expense.pk).update(interval='1-2-31')
+        with self.assertRaisesMessage(ValueError, f"Expense {expense.pk}: '1-2-31'"):
+            migration.fill_schedule(apps, None)
+
+
+class ForecastTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+
+    def test_expand_matches_occurrences(self):
+        dates = [datetime.date(2001, 1, 31), datetime.date(2020, 2, 29), datetime.date(2023, 5, 5), datetime.date(2024, 3, 1)]
+        intervals = [(0, 1, 0), (1, 0, 0), (0, 0, 7), (0, 0, 0)]
+        start, end = datetime.date(2023, 6, 1), datetime.date(2028, 6, 1)
+        item, occurrences = forecast.expand(dates, intervals, start, end)
+        found = sorted(zip(item.tolist(), occurrences.astype(datetime.date).tolist()))
+
+        expected = []
+        for i, (date, interval) in enumerate(zip(dates, intervals)):
+            k = 0
+            while True:
+                day = recurrence.occurrence(date, interval, k)
+                if day > end or (interval == (0, 0, 0) and k > 0):
+                    break
+                if day >= start:
+                    expected.append((i, day))
+                k += 1
+        self.assertEqual(found, sorted(expected))
+
+    def test_horizon(self):
+        today = datetime.date(2023, 1, 31)
+        self.assertEqual(forecast.horizon_end('1m', today), datetime.date(2023, 2, 28))
+        self.assertEqual(forecast.horizon_end('2w', today), datetime.date(2023, 2, 14))
+        self.assertEqual(forecast.horizon_end('5y', today), datetime.date(2028, 1, 31))
+        for horizon in ('', '0d', '11y', '1q', '-1m'):
+            with self.assertRaises(ValueError):
+                forecast.horizon_end(horizon, today)
+
+    def test_forecast_endpoint(self):
+        today = datetime.date.today()
+        Income.objects.create(user=self.user, amount=1000, date=today)
+        Expense.objects.create(user=self.user, amount=10, type=True, interval='0-0-1', date=today)
+        Income.objects.create(user=self.user, amount=5.5, date=today + datetime.timedelta(days=2))
+
+        response = self.client.get(f'/api/users/{self.user.id}/forecast', {'horizon': '3d', 'granularity': 'daily'})
+        data = response.json()
+        self.assertEqual(data['net_income'], 990.0)
+        self.assertEqual(list(data['balances'].values()), [980.0, 975.5, 965.5])
+        self.assertEqual(list(data['balances'])[0], (today + datetime.timedelta(days=1)).isoformat())
+
+        data = self.client.get(f'/api/users/{self.user.id}/forecast', {'horizon': '5y'}).json()
+        self.assertIn(len(data['balances']), (60, 61))
+        last = forecast.horizon_end('5y', today)
+        self.assertEqual(list(data['balances'].values())[-1], 995.5 - 10 * (last - today).days)
+
+    def test_forecast_bad_params(self):
+        response = self.client.get(f'/api/users/{self.user.id}/forecast', {'horizon': 'forever'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(f'/api/users/{self.user.id}/forecast', {'granularity': 'hourly'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportTestCase(TestCase):
+    CSV = (
+        "kind,date,amount,category,description,type,interval\n"
+        "expense,2023-06-01,12.50,FOOD,Lunch,,\n"
+        "income,2023-06-02,1000,SALARY,Pay,True,0-1-0\n"
+        ",2023-06-03,-20,HOUSING,Inferred expense,False,\n"
+        "expense,2023-06-31,5,FOOD,Bad date,,\n"
+        "expense,2023-06-04,abc,FOOD,Bad amount,,\n"
+        "expense,2023-06-05,5,NOPE,Bad category,,\n"
+        "expense,2023-06-06,5,FOOD,Bad interval,True,eval(1)\n"
+    )
+    OFX = (
+        "OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20230610120000<TRNAMT>-42.10<FITID>1<NAME>Grocery store</STMTTRN>"
+        "<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20230611<TRNAMT>250.00<FITID>2<MEMO>Refund</STMTTRN>"
+        "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>"
+    )
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+
+    def test_csv_import(self):
+        upload = SimpleUploadedFile('ledger.csv', self.CSV.encode())
+        response = self.client.post(f'/api/users/{self.user.id}/import', {'file': upload})
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual(report['accepted'], 3)
+        self.assertEqual(report['rejected'], 4)
+        self.assertEqual([error['row'] for error in report['errors']], [5, 6, 7, 8])
+        self.assertIn('date', report['errors'][0]['errors'])
+        self.assertIn('category', report['errors'][2]['errors'])
+
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Expense.objects.get(description='Inferred expense').amount, 20)
+        salary = Income.objects.get(user=self.user)
+        self.assertEqual(salary.schedule, (0, 1, 0))
+        self.assertGreaterEqual(salary.next_due, datetime.date.today())
+        self.assertEqual(MonthlyRollup.objects.get(user=self.user, kind='EXPENSE', category='FOOD').total, Decimal('12.50'))
+
+    def test_serializer_rules(self):
+        # A row is taken exactly when the API would take the same values
+        changes = [
+            {}, {'category': 'food'}, {'category': 'SALARY'}, {'category': 'FOOD'},
+            {'type': 'True'}, {'type': 'true'}, {'type': 'fixed'}, {'type': '1'},
+            {'amount': '12.345'}, {'amount': '123456789'}, {'amount': 'NaN'}, {'amount': ' 7 '},
+            {'description': 'x' * 151}, {'description': ' Lunch '},
+            {'interval': '0-1-0'}, {'interval': '1 month'},
+            {'date': '2023-02-30'}, {'date': '06/01/2023'},
+        ]
+        for serializer_class in (IncomeSerializer, ExpenseSerializer):
+            validator = importers.RowValidator(serializer_class.Meta.model, self.user.id)
+            for change in changes:
+                row = {'date': '2023-06-01', 'amount': '5'}
+                row.update({validator.category_field if key == 'category' else key: value for key, value in change.items()})
+                with self.subTest(model=serializer_class.Meta.model.__name__, row=row):
+                    serializer = serializer_class(data={**row, 'user': self.user.id})
+                    obj, errors = validator.validate(row)
+                    self.assertEqual(obj is not None, serializer.is_valid())
+                    self.assertEqual(set(errors or {}), set(serializer.errors))
+                    if obj is not None:
+                        for name, value in serializer.validated_data.items():
+                            if name != 'user':
+                                self.assertEqual(getattr(obj, name), value)
+
+    def test_chunked_import(self):
+        rows = ((i, 'expense', {'date': '2023-06-01', 'amount': '1', 'category': 'FOOD'}) for i in range(25))
+        report = importers.import_rows(self.user.id, rows, chunk_size=10)
+        self.assertEqual(report, {'accepted': 25, 'rejected': 0, 'errors': []})
+        rollup = MonthlyRollup.objects.get(user=self.user)
+        self.assertEqual((rollup.total, rollup.count), (Decimal('25.00'), 25))
+
+    def test_ofx_import(self):
+        rows = list(importers.read_ofx(BytesIO(self.OFX.encode()), block_size=16))
+        self.assertEqual([row for _, _, row in rows], [
+            {'date': '2023-06-10', 'amount': '-42.10', 'description': 'Grocery store'},
+            {'date': '2023-06-11', 'amount': '250.00', 'description': 'Refund'},
+        ])
+
+        upload = SimpleUploadedFile('statement.ofx', self.OFX.encode())
+        report = self.client.post(f'/api/users/{self.user.id}/import', {'file': upload}).json()
+        self.assertEqual(report['accepted'], 2)
+        self.assertEqual(Expense.objects.get(user=self.user).amount, Decimal('42.10'))
+        self.assertEqual(Income.objects.get(user=self.user).amount, Decimal('250.00'))
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write(self.CSV)
+            f.flush()
+            out = StringIO()
+            call_command('import_ledger', self.user.id, f.name, '--kind', 'expense', stdout=out)
+        report = json.loads(out.getvalue())
+        # SALARY is not an expense category once every row is an expense
+        self.assertEqual(report['accepted'], 2)
+        self.assertEqual(report['rejected'], 5)
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+        self.expense = Expense.objects.create(user=self.user, amount=12.5, category='FOOD', description='Lunch, "quoted"', date='2023-06-02')
+        self.income = Income.objects.create(user=self.user, amount=1000, source='SALARY', type=True, interval='0-1-0', date='2023-06-01')
+        Expense.objects.create(user=self.user, amount=7, category='HOUSING', date='2023-07-01')
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        response = self.client.get(f'/api/users/{self.user.id}/export', {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(StringIO(self.content(response))))
+        self.assertEqual(rows[0], exporters.COLUMNS)
+        self.assertEqual(rows[1], ['income', str(self.income.id), '2023-06-01', '1000.00', 'SALARY', '', 'True', '0-1-0'])
+        self.assertEqual(rows[2], ['expense', str(self.expense.id), '2023-06-02', '12.50', 'FOOD', 'Lunch, "quoted"', 'False', ''])
+        self.assertEqual(len(rows), 4)
+
+    def test_ndjson_export_with_filters(self):
+        response = self.client.get(f'/api/users/{self.user.id}/export',
+                                   {'format': 'ndjson', 'start': '2023-06-02', 'end': '2023-06-30', 'kind': 'expense'})
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(rows, [{
+            'kind': 'expense', 'id': self.expense.id, 'date': '2023-06-02', 'amount': '12.50',
+            'category': 'FOOD', 'description': 'Lunch, "quoted"', 'type': False, 'interval': '',
+        }])
+
+        response = self.client.get(f'/api/users/{self.user.id}/export', {'format': 'ndjson', 'category': 'HOUSING'})
+        self.assertEqual(len(self.content(response).splitlines()), 1)
+
+    def test_export_bad_params(self):
+        self.assertEqual(self.client.get(f'/api/users/{self.user.id}/export', {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/users/{self.user.id}/export', {'start': '2023-13-01'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/users/999/export').status_code, 404)
+
+
+class CursorPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+        for i in range(25):
+            Expense.objects.create(user=self.user, amount=i, category='FOOD', date=datetime.date(2023, 6, 1 + i // 3))
+
+    def test_pages(self):
+        expected = list(Expense.objects.filter(user=self.user).order_by('-date', '-id').values_list('id', flat=True))
+        url = f'/api/users/{self.user.id}/expenses?page_size=10'
+        ids = []
+        pages = 0
+        while url:
+            data = self.client.get(url).json()
+            if pages == 0:
+                self.assertEqual(data['stat']['FOOD'], 100.0)
+                # Rows inserted while paging do not shift the following pages
+                Expense.objects.create(user=self.user, amount=1, date='2023-07-01')
+            else:
+                self.assertIsNone(data['stat'])
+            ids += [row['id'] for row in data['list']]
+            url = data['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, expected)
+
+    def test_default_page(self):
+        data = self.client.get(f'/api/users/{self.user.id}/expenses').json()
+        self.assertEqual(len(data['list']), 25)
+        self.assertIsNone(data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'/api/users/{self.user.id}/expenses', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    @skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+    def test_page_query_plan(self):
+        paginator = DateCursorPagination()
+        request = Request(RequestFactory().get('/', {'cursor': paginator.encode_cursor((datetime.date(2023, 6, 5), 14))}))
+        with CaptureQueriesContext(connection) as queries:
+            paginator.paginate_queryset(Expense.objects.filter(user=self.user), request)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries[0]['sql'])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING INDEX expense_user_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+    def test_month_filter(self):
+        for kind in ('incomes', 'expenses'):
+            url = f'/api/users/{self.user.id}/{kind}'
+            self.assertEqual(self.client.get(url, {'year': 2023, 'month': 6}).status_code, 200)
+            for params in ({'year': 2023, 'month': 0}, {'year': 2023, 'month': 13}, {'year': 'x', 'month': 6}, {'year': 9999, 'month': 12}):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400, params)
+        data = self.client.get(f'/api/users/{self.user.id}/expenses', {'year': 2023, 'month': 13}).json()
+        self.assertEqual(data, {'month': "Must be between 1 and 12."})
+        self.assertEqual(len(self.client.get(f'/api/users/{self.user.id}/expenses', {'year': 2023, 'month': 6}).json()['list']), 25)
+
+class ValuesSerializerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+        Income.objects.create(user=self.user, amount=Decimal('2500'), source='SALARY', date='2023-06-01', type=True, interval='0-1-0')
+        Income.objects.create(user=self.user, amount=Decimal('12.5'), description='Refund', date='2023-06-02')
+        Expense.objects.create(user=self.user, amount=Decimal('0.07'), category='FOOD', date='2023-06-03')
+        Expense.objects.create(user=self.user, amount=Decimal('-3'), description='Fee', date='2023-06-04')
+
+    def test_same_output_as_model_serializer(self):
+        for model, serializer_class, values in (
+            (Income, IncomeSerializer, income_values),
+            (Expense, ExpenseSerializer, expense_values),
+        ):
+            rows = model.objects.filter(user=self.user).order_by('id')
+            expected = serializer_class(rows, many=True).data
+            self.assertEqual(values.data(values.values_list(rows)), [dict(row) for row in expected])
+
+    def test_income_list_fields(self):
+        with self.assertNumQueries(3):
+            data = self.client.get(f'/api/users/{self.user.id}/incomes').json()
+        self.assertEqual(data['list'][0]['source'], 'OTHER')
+        self.assertEqual(data['list'][0]['amount'], '12.50')
+        self.assertNotIn('category', data['list'][0])
+
+    def test_user_detail_lists(self):
+        data = self.client.get(f'/api/users/{self.user.id}/').json()
+        self.assertEqual([row['amount'] for row in data['incomes']], ['12.50', '2500.00'])
+        self.assertEqual(data['expenses'][0]['date'], '2023-06-04')
+
+
+class MoneyTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user', email='testuser@email.com', income_goal='1234.56')
+
+    def test_stored_as_cents(self):
+        income = Income.objects.create(user=self.user, amount=0.1 + 0.2, date='2023-06-01')
+        Income.objects.create(user=self.user, amount='0.125', date='2023-06-01')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT amount FROM app_income ORDER BY id')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [30, 12])
+            cursor.execute('SELECT income_goal FROM app_user')
+            self.assertEqual(cursor.fetchone()[0], 123456)
+        income.refresh_from_db()
+        self.assertEqual(income.amount, Decimal('0.30'))
+        self.assertEqual(str(income.amount), '0.30')
+
+    def test_lookups(self):
+        for amount in ('9.99', '10', '10.01'):
+            Expense.objects.create(user=self.user, amount=amount, date='2023-06-01')
+        self.assertEqual(Expense.objects.filter(amount=Decimal('10.00')).count(), 1)
+        self.assertEqual(Expense.objects.filter(amount__gt='9.99').count(), 2)
+        self.assertEqual(User.objects.filter(income_goal__lt=2000).count(), 1)
+
+    def test_exact_sums(self):
+        Expense.objects.bulk_create([Expense(user=self.user, amount='0.10', date='2023-06-01') for _ in range(1000)])
+        total = Expense.objects.aggregate(total=money.sum_cents('amount'))['total']
+        self.assertEqual(total, 10000)
+        self.assertEqual(money.from_cents(total), Decimal('100.00'))
+        self.assertEqual(Expense.objects.aggregate(Sum('amount'))['amount__sum'], Decimal('100.00'))
+
+    def test_format_cents(self):
+        for cents in (0, 5, -5, 1250, -123456, 10 ** 15 - 1, -(10 ** 15 - 1), 2 ** 49 + 1):
+            self.assertEqual(money.format_cents(cents), '{:f}'.format(money.from_cents(cents)))
+
+
+class AnalyticsCacheTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+        self.income = Income.objects.create(user=self.user, amount=100, date='2023-06-01')
+        Expense.objects.create(user=self.user, amount=30, date='2023-06-02')
+        caching.reset_stats()
+
+    def net_income(self):
+        return self.client.get(f'/api/users/{self.user.id}/netIncome', {'year': 2023, 'month': 12, 'day': 31})
+
+    def test_hit_after_miss(self):
+        response = self.net_income()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):
+            response = self.net_income()
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['net_income'], 70.0)
+        self.assertEqual(caching.stats()['netIncome'], {'hits': 1, 'misses': 1})
+
+    def test_writes_bump_version(self):
+        self.assertEqual(self.net_income().json()['net_income'], 70.0)
+
+        self.income.amount = 200
+        self.income.save()
+        response = self.net_income()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['net_income'], 170.0)
+
+        Expense.objects.filter(user=self.user).delete()
+        self.assertEqual(self.net_income().json()['net_income'], 200.0)
+
+        importers.import_rows(self.user.id, [(1, 'income', {'date': '2023-07-01', 'amount': '5'})])
+        self.assertEqual(self.net_income().json()['net_income'], 205.0)
+
+        version = caching.data_version(self.user.id)
+        self.client.put(f'/api/users/{self.user.id}/budget?incomeGoal=10')
+        self.assertGreater(caching.data_version(self.user.id), version)
+
+    def test_stat_block(self):
+        url = f'/api/users/{self.user.id}/expenses'
+        self.assertEqual(self.client.get(url).json()['stat']['OTHER'], 100.0)
+        self.client.get(url)
+        self.assertEqual(caching.stats()['expense-stat'], {'hits': 1, 'misses': 1})
+        Expense.objects.create(user=self.user, amount=30, category='FOOD', date='2023-06-03')
+        self.assertEqual(self.client.get(url).json()['stat']['FOOD'], 50.0)
+
+    def test_params_are_part_of_the_key(self):
+        url = f'/api/users/{self.user.id}/graphData'
+        self.client.get(url)
+        self.assertEqual(self.client.get(url, {'scale': ' 6m '})['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url, {'scale': '1y'})['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url, {'scale': '2w'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'scale': '2w'})['X-Cache'], 'MISS')
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            cache = {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+                'TIMEOUT': 60,
+                'OPTIONS': {'MAX_ENTRIES': 10},
+            }
+            with override_settings(CACHES={'default': cache, 'analytics': cache}):
+                self.assertEqual(self.net_income()['X-Cache'], 'MISS')
+                response = self.net_income()
+                self.assertEqual(response['X-Cache'], 'HIT')
+                self.assertEqual(response.json()['net_income'], 70.0)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+        self.income = Income.objects.create(user=self.user, amount=100, date='2023-06-01')
+        self.expense = Expense.objects.create(user=self.user, amount=30, date='2023-06-02', type=True, interval='0-1-0')
+
+    def urls(self):
+        pk = self.user.id
+        return [
+            '/api/users/',
+            f'/api/users/{pk}/',
+            f'/api/users/{pk}/incomes',
+            f'/api/users/{pk}/expenses',
+            f'/api/users/{pk}/export',
+            f'/api/users/{pk}/netIncome?year=2023&month=12&day=31',
+            f'/api/users/{pk}/graphData',
+            f'/api/users/{pk}/upcomingExpenses',
+            f'/api/users/{pk}/budget?incomeGoal=1',
+            f'/api/users/{pk}/forecast',
+            f'/api/income/{self.income.id}',
+            f'/api/expense/{self.expense.id}',
+        ]
+
+    def test_not_modified(self):
+        for url in self.urls():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            etag = response['ETag']
+            self.assertIn('private', response['Cache-Control'])
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b'')
+
+    def test_writes_change_etag(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls()}
+        self.income.amount = 200
+        self.income.save()
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_params_change_etag(self):
+        url = f'/api/users/{self.user.id}/graphData'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, {'scale': '1y'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_errors_have_no_etag(self):
+        response = self.client.get('/api/users/0/incomes')
+        self.assertFalse(response.has_header('ETag'))
+        response = self.client.get(f'/api/users/{self.user.id}/graphData', {'scale': '2w'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'analytics': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+})
+class AsyncAnalyticsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com',
+            income_goal=500,
+            expense_budget=200,
+        )
+        today = datetime.date.today()
+        for days in range(0, 800, 11):
+            date = today - datetime.timedelta(days=days)
+            Income.objects.create(user=self.user, amount=100, date=date)
+            Expense.objects.create(user=self.user, amount=35, date=date)
+
+    async def get_both(self, name, params):
+        sync_response = await sync_to_async(getattr(views, name).as_view())(RequestFactory().get('/', params), pk=self.user.id)
+        sync_response.render()
+        async_response = await getattr(async_views, name).as_view()(AsyncRequestFactory().get('/', params), pk=self.user.id)
+        return sync_response, async_response
+
+    async def test_same_responses_as_sync_views(self):
+        today = datetime.date.today()
+        requests = [('NetIncome', {'year': today.year, 'month': today.month, 'day': today.day})]
+        requests += [('GraphDataDetail', {'scale': scale}) for scale in analytics.SCALES + ('2w',)]
+        requests += [('UserBudgetDetail', {'incomeGoal': 'true', 'expenseBudget': 'true'}), ('UserBudgetDetail', {'expenseBudget': 'true'})]
+        for name, params in requests:
+            sync_response, async_response = await self.get_both(name, params)
+            self.assertEqual(async_response.status_code, sync_response.status_code, name)
+            self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content), name)
+            self.assertEqual(async_response.get('ETag'), sync_response.get('ETag'), name)
+
+    async def test_shared_cache(self):
+        # The same decorators: an entry cached by one is read by the other
+        cache = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'}
+        with override_settings(CACHES={'default': cache, 'analytics': cache}):
+            sync_response, async_response = await self.get_both('GraphDataDetail', {'scale': '1y'})
+        self.assertEqual((sync_response['X-Cache'], async_response['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(json.loads(async_response.content), sync_response.data)
+
+    async def test_not_modified(self):
+        view = async_views.GraphDataDetail.as_view()
+        response = await view(AsyncRequestFactory().get('/'), pk=self.user.id)
+        etag = response['ETag']
+        response = await view(AsyncRequestFactory().get('/', headers={'If-None-Match': etag}), pk=self.user.id)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_budget(self):
+        view = async_views.UserBudgetDetail.as_view()
+        response = await view(AsyncRequestFactory().get('/', {'incomeGoal': 'true'}), pk=0)
+        self.assertEqual(response.status_code, 404)
+        response = await view(AsyncRequestFactory().put('/?incomeGoal=750'), pk=self.user.id)
+        self.assertEqual(response.status_code, 200)
+        response = await view(AsyncRequestFactory().get('/', {'incomeGoal': 'true'}), pk=self.user.id)
+        self.assertEqual(json.loads(response.content)['income_goal'], 750.0)
+
+
+class DashboardTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com',
+            income_goal=500,
+            expense_budget=200,
+        )
+        self.today = datetime.date.today()
+        for days in range(0, 1200, 5):
+            date = self.today - datetime.timedelta(days=days)
+            Income.objects.create(user=self.user, amount=100 + days % 7, source='SALARY' if days % 2 else 'OTHER', date=date)
+            Expense.objects.create(user=self.user, amount=30 + days % 11, category='FOOD' if days % 3 else 'OTHER', date=date)
+        Expense.objects.create(user=self.user, amount=12, date=self.today - datetime.timedelta(days=400), type=True, interval='0-1-0')
+        Expense.objects.create(user=self.user, amount=9, date=self.today - datetime.timedelta(days=10), type=True, interval='0-0-7')
+        Income.objects.create(user=self.user, amount=1000, date=self.today + datetime.timedelta(days=3))
+        self.url = f'/api/users/{self.user.id}/dashboard'
+
+    def get(self, path, params=None):
+        response = self.client.get(f'/api/users/{self.user.id}/{path}', params)
+        self.assertEqual(response.status_code, 200, path)
+        return response.json()
+
+    def test_sections_match_endpoints(self):
+        for scale in analytics.SCALES:
+            data = self.get('dashboard', {'scale': scale, 'page_size': 20})
+            self.assertEqual(list(data), dashboard.SECTIONS)
+            self.assertEqual(data['graphData'], self.get('graphData', {'scale': scale}))
+        self.assertEqual(data['netIncome'], self.get('netIncome', {'year': self.today.year, 'month': self.today.month, 'day': self.today.day}))
+        self.assertEqual(data['budget'], self.get('budget', {'incomeGoal': 'true', 'expenseBudget': 'true'}))
+        self.assertEqual(data['upcomingExpenses'], self.get('upcomingExpenses'))
+        for name in ('incomes', 'expenses'):
+            expected = self.get(name, {'page_size': 20})
+            self.assertEqual(data[name]['list'], expected['list'])
+            self.assertEqual(data[name]['stat'], expected['stat'])
+            self.assertEqual(self.client.get(data[name]['next']).json()['list'], self.client.get(expected['next']).json()['list'])
+
+    def test_query_count_is_constant(self):
+        for scale in analytics.SCALES:
+            caching.get_cache().clear()
+            # The data version, the user, the rollups and one read per table
+            with self.assertNumQueries(5):
+                self.get('dashboard', {'scale': scale})
+
+    def test_sections(self):
+        # Both tables but no rollups
+        with self.assertNumQueries(4):
+            data = self.get('dashboard', {'sections': 'budget'})
+        self.assertEqual(list(data), ['budget'])
+        response = self.client.get(self.url, {'sections': 'budget,weather'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_older_than_window(self):
+        # Two rows in the window, the rest of the page from older months
+        Income.objects.filter(user=self.user, date__gte=self.today.replace(day=1)).delete()
+        Income.objects.create(user=self.user, amount=1, date=self.today)
+        Income.objects.create(user=self.user, amount=2, date=self.today)
+        # The data version, the user, the rollups and the incomes
+        with self.assertNumQueries(4):
+            data = self.get('dashboard', {'sections': 'incomes', 'page_size': 10})
+        self.assertEqual(data['incomes']['list'], self.get('incomes', {'page_size': 10})['list'])
+
+
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username='test_user',
+            first_name='Test',
+            last_name='User',
+            email='testuser@email.com'
+        )
+        self.other = User.objects.create(username='other_user', email='other@email.com')
+        self.expense = Expense.objects.create(user=self.user, amount=10, category='FOOD', date='2023-06-01')
+        self.removed = Expense.objects.create(user=self.user, amount=4, category='FOOD', date='2023-06-02')
+        self.url = f'/api/users/{self.user.id}/expenses/batch'
+
+    def post(self, operations, url=None):
+        return self.client.post(url or self.url, {'operations': operations}, content_type='application/json')
+
+    def rollups(self):
+        return {
+            (r.year, r.month, r.kind, r.category): (r.total, r.count)
+            for r in MonthlyRollup.objects.filter(user=self.user)
+        }
+
+    def test_apply(self):
+        version = User.objects.get(pk=self.user.pk).data_version
+        response = self.post([
+            {'op': 'create', 'data': {'amount': '5.5', 'category': 'FOOD', 'date': '2023-06-20'}},
+            {'op': 'create', 'data': {'amount': 7, 'category': 'HOUSING', 'date': '2023-07-01', 'type': True, 'interval': '0-1-0'}},
+            {'op': 'patch', 'id': self.expense.id, 'data': {'amount': '20', 'date': '2023-07-02'}},
+            {'op': 'delete', 'id': self.removed.id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['applied'])
+        self.assertEqual([r['status'] for r in data['results']], [201, 201, 200, 204])
+
+        created = Expense.objects.get(pk=data['results'][1]['id'])
+        self.assertEqual(data['results'][1]['data'], ExpenseSerializer(created).data)
+        self.assertIsNotNone(created.next_due)
+        self.expense.refresh_from_db()
+        self.assertEqual((self.expense.amount, self.expense.category), (Decimal('20.00'), 'FOOD'))
+        self.assertEqual(data['results'][2]['data'], ExpenseSerializer(self.expense).data)
+        self.assertFalse(Expense.objects.filter(pk=self.removed.id).exists())
+
+        incremental = self.rollups()
+        self.assertEqual(incremental, {
+            (2023, 6, 'EXPENSE', 'FOOD'): (Decimal('5.50'), 1),
+            (2023, 7, 'EXPENSE', 'FOOD'): (Decimal('20.00'), 1),
+            (2023, 7, 'EXPENSE', 'HOUSING'): (Decimal('7.00'), 1),
+        })
+        MonthlyRollup.objects.rebuild()
+        self.assertEqual(self.rollups(), incremental)
+        self.assertNotEqual(User.objects.get(pk=self.user.pk).data_version, version)
+
+    def test_invalid_batch_is_not_applied(self):
+        foreign = Expense.objects.create(user=self.other, amount=1, date='2023-06-01')
+        response = self.post([
+            {'op': 'create', 'data': {'amount': '5', 'date': '2023-06-20'}},
+            {'op': 'create', 'data': {'amount': 'five', 'date': '2023-06-20'}},
+            {'op': 'patch', 'id': self.expense.id, 'data': {'category': 'WEATHER'}},
+            {'op': 'delete', 'id': foreign.id},
+            {'op': 'delete', 'id': self.removed.id},
+            {'op': 'delete', 'id': self.removed.id},
+            {'op': 'move', 'id': self.removed.id},
+        ])
+        self.assertEqual(response.status_code, 400)
+        data = response.json()
+        self.assertFalse(data['applied'])
+        self.assertEqual([r.get('status') for r in data['results']], [None, 400, 400, 400, None, 400, 400])
+        self.assertIn('amount', data['results'][1]['errors'])
+        self.assertIn('category', data['results'][2]['errors'])
+        self.assertEqual(data['results'][3]['errors'], {'id': "Not found."})
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+        self.assertTrue(Expense.objects.filter(pk=foreign.id).exists())
+
+    def test_bad_requests(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.client.post(self.url, {}, content_type='application/json').status_code, 400)
+        self.assertEqual(self.post([{'op': 'delete', 'id': self.removed.id}] * 1001).status_code, 400)
+        self.assertEqual(self.post([{'op': 'delete', 'id': 1}], '/api/users/0/expenses/batch').status_code, 404)
+
+    def test_invalid_ids(self):
+        # Reported per operation, not a 500
+        data = self.post([
+            {'op': 'delete', 'id': [self.removed.id]},
+            {'op': 'patch', 'id': {'pk': self.expense.id}, 'data': {'amount': '1'}},
+            {'op': 'delete', 'id': str(self.removed.id)},
+            {'op': 'delete', 'id': True},
+        ]).json()
+        self.assertEqual([result['errors'] for result in data['results']], [{'id': "A valid integer is required."}] * 4)
+        self.assertTrue(Expense.objects.filter(pk=self.removed.id).exists())
+
+    def test_incomes(self):
+        url = f'/api/users/{self.user.id}/incomes/batch'
+        response = self.post([{'op': 'create', 'data': {'amount': '100', 'source': 'SALARY', 'date': '2023-06-01'}}] * 3, url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Income.objects.filter(user=self.user, source='SALARY').count(), 3)
+
+    def test_query_count(self):
+        # Creates and updates cost the same number of queries however many
+        # there are: locking the rows, the inserts, the updates, and the
+        # rollups of each month and category
+        operations = [{'op': 'create', 'data': {'amount': i, 'category': 'FOOD', 'date': '2023-06-10'}} for i in range(50)]
+        operations += [{'op': 'patch', 'id': self.expense.id, 'data': {'amount': 11}}]
+        with CaptureQueriesContext(connection) as small:
+            self.post(operations[-3:])
+        with CaptureQueriesContext(connection) as large:
+            self.post(operations[:-1] + [{'op': 'patch', 'id': self.expense.id, 'data': {'amount': 12}}])
+        self.assertEqual(len(small), len(large))
+
+    def test_delete_query_count(self):
+        ids = [Expense.objects.create(user=self.user, amount=i, category='FOOD', date='2023-06-10').id for i in range(20)]
+        with CaptureQueriesContext(connection) as small:
+            self.post([{'op': 'delete', 'id': ids[0]}])
+        with CaptureQueriesContext(connection) as large:
+            self.post([{'op': 'delete', 'id': id} for id in ids[1:]])
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(self.rollups(), {(2023, 6, 'EXPENSE', 'FOOD'): (Decimal('14.00'), 2)})
+
+
+@skipUnless(connection.vendor == 'sqlite', "PRAGMAs are SQLite specific")
+class DatabaseProfileTestCase(TestCase):
+    def pragmas(self, names, **settings):
+        # Read from a new connection, as the pragmas are set on connect
+        with override_settings(**settings):
+            new = connections.create_connection('default')
+            try:
+                with new.cursor() as cursor:
+                    return {name: cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in names}
+            finally:
+                new.close()
+
+    def test_pragmas_on_connect(self):
+        pragmas = {'busy_timeout': 1234, 'synchronous': 'NORMAL', 'cache_size': -2048}
+        self.assertEqual(self.pragmas(pragmas, SQLITE_PRAGMAS=pragmas), {'busy_timeout': 1234, 'synchronous': 1, 'cache_size': -2048})
+
+    def test_asgi_closes_connections(self):
+        # Read in a new interpreter, as the settings depend on the entry point
+        code = "import backend.asgi; from django.conf import settings; print(settings.DATABASES['default']['CONN_MAX_AGE'])"
+        environment = {name: value for name, value in os.environ.items() if name not in ('DATABASE_CONN_MAX_AGE', 'DJANGO_INTERFACE')}
+        with tempfile.TemporaryDirectory() as directory:
+            environment['SQLITE_PATH'] = os.path.join(directory, 'db.sqlite3')
+            output = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=environment, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '0')
+
+    def test_plain_profile(self):
+        # The 5 s timeout of Python's sqlite3 module, and SQLite's FULL
+        self.assertEqual(self.pragmas(['busy_timeout', 'synchronous'], SQLITE_PRAGMAS={}), {'busy_timeout': 5000, 'synchronous': 2})
+
+
+class SyntheticLedgerTestCase(TestCase):
+    def test_generate(self):
+        today = datetime.date(2024, 3, 15)
+        user_ids = synthetic.generate(users=2, years=1, expenses_per_month=10, recurring=0.2, seed=1, today=today)
+        self.assertEqual(len(user_ids), 2)
+        incomes = Income.objects.filter(user__in=user_ids)
+        # A salary on the first of each of the 13 months
+        self.assertEqual(incomes.filter(source='SALARY', date__day=1).count(), 26)
+        self.assertFalse(incomes.filter(date__gt=today).exists())
+        recurring = Expense.objects.filter(user__in=user_ids, type=True)
+        self.assertTrue(recurring.exists())
+        self.assertFalse(recurring.filter(next_due=None).exists())
+        # The rollups match the rows
+        incremental = set(MonthlyRollup.objects.values_list('user', 'year', 'month', 'kind', 'category', 'total', 'count'))
+        MonthlyRollup.objects.rebuild()
+        self.assertEqual(set(MonthlyRollup.objects.values_list('user', 'year', 'month', 'kind', 'category', 'total', 'count')), incremental)
+
+    def test_categories_are_choices(self):
+        # The rows skip validation on the way in
+        user_ids = synthetic.generate(users=1, years=1, seed=2, today=datetime.date(2024, 3, 15))
+        sources = set(Income.objects.filter(user__in=user_ids).values_list('source', flat=True))
+        categories = set(Expense.objects.filter(user__in=user_ids).values_list('category', flat=True))
+        self.assertLessEqual(sources, {choice for choice, label in Income.INCOME_CATEGORY_CHOICES})
+        self.assertLessEqual(categories, {choice for choice, label in Expense.EXPENSE_CATEGORY_CHOICES})
+        self.assertIn('MEDICAL', categories)
+
+    def test_command_without_users(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_ledgers', '--users', '0', stdout=StringIO())
+        out = StringIO()
+        call_command('generate_ledgers', users=0, stdout=out)
+        self.assertEqual(out.getvalue(), "No users created.\n")
+        self.assertFalse(User.objects.exists())
+
+    def test_query_count_does_not_grow_with_data(self):
+        # Every endpoint of the benchmark suite, on a small and a larger
+        # ledger: a query per row (N+1) would show up as a difference
+        small = endpoints.run(users=2, years=1, repeat=1, seed=0)
+        large = endpoints.run(users=4, years=2, repeat=1, seed=1)
+        self.assertEqual({name: result['queries'] for name, result in large.items()},
+                         {name: result['queries'] for name, result in small.items()})
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'analytics': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}, METRICS_ENABLED=True)
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user', email='testuser@email.com')
+        for day in range(1, 11):
+            Income.objects.create(user=self.user, amount=10, date=datetime.date(2023, 6, day))
+        self.url = f'/api/users/{self.user.id}/incomes'
+        metrics.reset_stats()
+
+    def server_timing(self, response):
+        return dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'db', 'view', 'serialize', 'total'})
+        self.assertIn(f'desc="{len(queries)} queries"', timing['db'])
+
+    def test_metrics_endpoint(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.client.get('/api/users/0/incomes/batch')
+        text = self.client.get('/metrics').content.decode()
+        route = 'api/users/<int:pk>/incomes'
+        self.assertIn(f'http_requests_total{{route="{route}",method="GET",status="200"}} 2', text)
+        self.assertIn(f'http_request_duration_seconds_count{{route="{route}"}} 2', text)
+        self.assertIn(f'http_request_db_queries_bucket{{route="{route}",le="+Inf"}} 2', text)
+        self.assertIn('status="405"', text)
+
+    @override_settings(METRICS_QUERY_SAMPLE_RATE=1)
+    def test_sampled_queries(self):
+        with self.assertLogs('app.metrics', 'INFO') as logs:
+            self.client.get(self.url)
+        self.assertIn('FROM "app_income"', logs.output[0])
+        histograms, requests = metrics.stats()
+        self.assertIn(('db_query_duration_seconds', 'api/users/<int:pk>/incomes'), histograms)
+
+    @override_settings(METRICS_QUERY_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        with self.assertNoLogs('app.metrics', 'INFO'):
+            self.client.get(self.url)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(self.url))
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer other').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_requests_total', response.content.decode())
+
+    async def test_async_handler(self):
+        # The queries of the sync view, run in a thread, are counted as well
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('desc="0 queries"', self.server_timing(response)['db'])
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user', email='testuser@email.com')
+        Income.objects.create(user=self.user, amount=10, date=datetime.date.today())
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        settings = override_settings(PROFILING_DIR=self.dir, PROFILING_TOKEN='secret', PROFILING_SAMPLE_RATE=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def profiles(self):
+        result = {}
+        for name in sorted(os.listdir(self.dir)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.dir, name)) as file:
+                    result[name[:-len('.json')]] = json.load(file)
+        return result
+
+    def test_header(self):
+        url = f'/api/users/{self.user.id}/graphData?scale=1y'
+        response = self.client.get(url, headers={'X-Profile': 'secret'})
+        profiles = self.profiles()
+        self.assertEqual(list(profiles), [response['X-Profile-Id']])
+        metadata = profiles[response['X-Profile-Id']]
+        self.assertEqual(metadata['url'], url)
+        self.assertEqual(metadata['route'], 'api/users/<int:pk>/graphData')
+        self.assertEqual(metadata['user'], self.user.id)
+        self.assertEqual(metadata['status'], 200)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, response['X-Profile-Id'] + '.prof')))
+
+        self.client.get(url, headers={'X-Profile': 'wrong'})
+        self.assertEqual(len(self.profiles()), 1)
+        with override_settings(PROFILING_TOKEN=''):
+            self.client.get(url, headers={'X-Profile': ''})
+        self.assertEqual(len(self.profiles()), 1)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_ROUTES=['*graphData', '*upcomingExpenses'])
+    def test_sampled_routes(self):
+        self.client.get(f'/api/users/{self.user.id}/incomes')
+        self.client.get(f'/api/users/{self.user.id}/upcomingExpenses')
+        self.assertEqual([p['route'] for p in self.profiles().values()], ['api/users/<int:pk>/upcomingExpenses'])
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_MODE='sampler', PROFILING_MAX_FILES=2)
+    def test_sampler_and_rotation(self):
+        ids = [self.client.get(f'/api/users/{self.user.id}/incomes')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(list(self.profiles()), ids[1:])
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(f'{id}{ext}' for id in ids[1:] for ext in ('.json', '.stacks')))
+
+    def test_summary(self):
+        for mode in ('cprofile', 'sampler'):
+            self.client.get(f'/api/users/{self.user.id}/graphData', headers={'X-Profile': 'secret', 'X-Profile-Mode': mode})
+        out = StringIO()
+        call_command('profile_summary', stdout=out)
+        output = out.getvalue()
+        self.assertIn('2 profiles', output)
+        self.assertIn('api/users/<int:pk>/graphData', output)
+        self.assertIn('cProfile, 1 profiles', output)
+        self.assertIn('views.py', output)
+
+    async def test_async_handler(self):
+        # The view runs in another thread than the middleware
+        for mode in ('cprofile', 'sampler'):
+            response = await self.async_client.get(f'/api/users/{self.user.id}/incomes', headers={'X-Profile': 'secret', 'X-Profile-Mode': mode})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('X-Profile-Id', response)
+        profiles = list(self.profiles().values())
+        self.assertEqual([p['mode'] for p in profiles], ['cprofile', 'sampler'])
+        self.assertEqual({p['route'] for p in profiles}, {'api/users/<int:pk>/incomes'})
+        out = StringIO()
+        await sync_to_async(call_command)('profile_summary', stdout=out)
+        self.assertIn('views.py', out.getvalue())
+
+
+class UserListTestCase(TestCase):
+    def setUp(self):
+        for i in range(12):
+            user = User.objects.create(username=f'user{i}', email=f'user{i}@email.com')
+            Income.objects.create(user=user, amount=10, date='2023-06-01')
+            Expense.objects.create(user=user, amount=5, date='2023-06-02')
+            Expense.objects.create(user=user, amount=6, date='2023-06-03')
+        self.user = user
+
+    def test_profile_only_list(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/')
+        data = response.json()
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(len(data['results']), 10)
+        self.assertNotIn('incomes', data['results'][0])
+        self.assertFalse(any('app_income' in q['sql'] or 'app_expense' in q['sql'] for q in queries))
+
+    def test_expanded_list(self):
+        # The ETag's marker, the count, the page and one query per relation
+        with self.assertNumQueries(5):
+            data = self.client.get('/api/users/', {'expand': 'incomes,expenses', 'page': 2}).json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(len(data['results'][1]['expenses']), 2)
+        self.assertEqual(data['results'][1]['expenses'][0]['date'], '2023-06-03')
+
+    def test_detail_fields(self):
+        with self.assertNumQueries(4):
+            data = self.client.get(f'/api/users/{self.user.id}/').json()
+        self.assertEqual(len(data['incomes']), 1)
+
+        with self.assertNumQueries(2):
+            data = self.client.get(f'/api/users/{self.user.id}/', {'fields': 'email,username', 'expand': ''}).json()
+        self.assertEqual(data, {'email': 'user11@email.com', 'username': 'user11'})
+
+        response = self.client.get(f'/api/users/{self.user.id}/', {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag(self):
+        def etag():
+            return self.client.get('/api/users/', {'expand': 'incomes'})['ETag']
+
+        # The newest data version, from the index rather than a scan
+        tag = etag()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/', {'expand': 'incomes'}, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('MAX', queries[0]['sql'])
+
+        first = User.objects.order_by('id').first()
+        tags = [etag()]
+        # Also when the user written to isn't the newest one
+        Income.objects.create(user=first, amount=1, date='2023-07-01')
+        tags.append(etag())
+        User.objects.order_by('id')[1].delete()
+        tags.append(etag())
+        self.user.delete()
+        tags.append(etag())
+        self.assertEqual(len(set(tags)), 4)
+
+
+class StartupTestCase(TestCase):
+    def test_deferred_imports(self):
+        # A worker up to its first request, in a new interpreter
+        wall, packages = startup.run(startup.PROCESSES['worker'])
+        self.assertEqual([package for package in startup.DEFERRED if package in packages], [])
+
+    def test_auth0_client(self):
+        # Registered once, without fetching the provider metadata yet
+        client = views.auth0()
+        self.assertIs(views.auth0(), client)
+        self.assertEqual(client.name, 'auth0')
+        self.assertNotIn('_loaded_at', client.server_metadata)
+
+
+class JWTAuthenticationTestCase(TestCase):
+    # A local key pair stands in for Auth0's
+    issuer = 'https://tenant.example.com/'
+    audience = 'https://api.example.com/'
+
+    def setUp(self):
+        import jwt
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        self.jwt = jwt
+        self.user = User.objects.create(username='jwt_user', email='jwt@email.com')
+        self.keys = {kid: rsa.generate_private_key(public_exponent=65537, key_size=2048) for kid in ('one', 'two')}
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.jwks = os.path.join(directory.name, 'jwks.json')
+        self.publish('one')
+        settings = override_settings(
+            JWT_JWKS_URL='file://' + self.jwks,
+            JWT_ISSUER=self.issuer,
+            JWT_AUDIENCE=self.audience,
+            JWT_USER_CLAIM='email',
+            JWT_JWKS_REFRESH_INTERVAL=60,
+            JWT_CACHE_SIZE=100,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        authentication.key_set.clear()
+        authentication.claims_cache.clear()
+
+    def publish(self, *kids):
+        keys = [dict(self.jwt.algorithms.RSAAlgorithm.to_jwk(self.keys[kid].public_key(), as_dict=True), kid=kid, use='sig') for kid in kids]
+        with open(self.jwks, 'w') as file:
+            json.dump({'keys': keys}, file)
+
+    def token(self, kid='one', key=None, **claims):
+        claims = {'iss': self.issuer, 'aud': self.audience, 'email': 'jwt@email.com', 'exp': int(time.time()) + 600, **claims}
+        return self.jwt.encode(claims, key or self.keys[kid], algorithm='RS256', headers={'kid': kid})
+
+    def authenticate(self, token):
+        request = Request(RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+        return authentication.JWTAuthentication().authenticate(request)
+
+    def test_authenticate(self):
+        user, claims = self.authenticate(self.token())
+        self.assertEqual(user, self.user)
+        self.assertEqual(claims['email'], 'jwt@email.com')
+        # Other schemes are left to the next authentication class
+        request = Request(RequestFactory().get('/', HTTP_AUTHORIZATION='Basic dXNlcjpwYXNz'))
+        self.assertIsNone(authentication.JWTAuthentication().authenticate(request))
+
+    def test_rejected(self):
+        tokens = {
+            'expired': self.token(exp=int(time.time()) - 10),
+            'issuer': self.token(iss='https://other.example.com/'),
+            'audience': self.token(aud='https://other.example.com/'),
+            'signature': self.token(key=self.keys['two']),
+            'unknown user': self.token(email='nobody@email.com'),
+            'malformed': 'not.a.token',
+        }
+        for name, token in tokens.items():
+            with self.assertRaises(AuthenticationFailed, msg=name):
+                self.authenticate(token)
+
+    def test_not_configured(self):
+        # Without them a token of the tenant for another API would pass
+        for name in ('JWT_AUDIENCE', 'JWT_ISSUER', 'JWT_JWKS_URL'):
+            with override_settings(**{name: None}), self.assertRaisesMessage(AuthenticationFailed, name):
+                self.authenticate(self.token())
+        response = self.client.get(f'/api/users/{self.user.id}/', HTTP_AUTHORIZATION=f'Bearer {self.token()}')
+        self.assertEqual(response.status_code, 200)
+        with override_settings(JWT_JWKS_URL=None):
+            authentication.claims_cache.clear()
+            response = self.client.get(f'/api/users/{self.user.id}/', HTTP_AUTHORIZATION=f'Bearer {self.token()}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_claims_cached(self):
+        token = self.token()
+        self.authenticate(token)
+        # Neither the keys nor the signature are needed again
+        os.remove(self.jwks)
+        authentication.key_set.clear()
+        with self.assertNumQueries(1):
+            user, claims = self.authenticate(token)
+        self.assertEqual(user, self.user)
+        self.assertIsNotNone(authentication.claims_cache.get(authentication.token_digest(token)))
+
+    def test_claims_expire_in_cache(self):
+        token = self.token(exp=int(time.time()) + 1)
+        self.authenticate(token)
+        time.sleep(1.1)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+        self.assertIsNone(authentication.claims_cache.get(authentication.token_digest(token)))
+
+    def test_lru_bound(self):
+        tokens = [self.token(jti=str(n)) for n in range(3)]
+        with override_settings(JWT_CACHE_SIZE=2):
+            for token in tokens:
+                self.authenticate(token)
+            self.authenticate(tokens[1])
+            self.authenticate(self.token(jti='3'))
+        digests = list(authentication.claims_cache.entries)
+        self.assertEqual(digests, [authentication.token_digest(token) for token in (tokens[1], self.token(jti='3'))])
+
+    def test_unknown_kid_refresh(self):
+        self.authenticate(self.token('one'))
+        fetched = authentication.key_set.fetched
+        # The provider rotated its keys: the new kid fetches them again
+        authentication.key_set.fetched -= 60
+        self.publish('one', 'two')
+        user, claims = self.authenticate(self.token('two'))
+        self.assertEqual(user, self.user)
+        self.assertGreater(authentication.key_set.fetched, fetched)
+        # Only once per interval
+        fetched = authentication.key_set.fetched
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token('three', key=self.keys['one']))
+        self.assertEqual(authentication.key_set.fetched, fetched)
+
+    def test_api_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/users/{self.user.id}/', HTTP_AUTHORIZATION=f'Bearer {self.token()}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('django_session' in query['sql'] for query in queries))
+
+        response = self.client.get(f'/api/users/{self.user.id}/', HTTP_AUTHORIZATION=f'Bearer {self.token(exp=0)}')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    async def test_async_views(self):
+        view = async_views.NetIncome.as_view()
+        params = {'year': 2023, 'month': 6, 'day': 1}
+        request = AsyncRequestFactory().get('/', params, headers={'Authorization': f'Bearer {self.token()}'})
+        response = await view(request, pk=self.user.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.user, self.user)
+        self.assertEqual(request.auth['email'], 'jwt@email.com')
+
+        request = AsyncRequestFactory().get('/', params, headers={'Authorization': f'Bearer {self.token(iss="https://other.example.com/")}'})
+        response = await view(request, pk=self.user.id)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+
+# A local cache stands in for the shared one cached_db needs
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'},
+    },
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    SESSION_CACHE_ALIAS='sessions',
+)
+class SessionTestCase(TestCase):
+    def setUp(self):
+        from django.contrib.sessions.backends.cached_db import SessionStore
+        from django.core.cache import caches
+        self.SessionStore = SessionStore
+        self.cache = caches['sessions']
+        self.cache.clear()
+
+    def test_logout(self):
+        # Cleared sessions are gone from the shared cache as well
+        session = self.SessionStore()
+        session['user'] = {'userinfo': {'email': 'user@email.com'}}
+        session.save()
+        self.client.cookies['sessionid'] = session.session_key
+        self.client.get('/logout')
+        self.assertNotIn('user', self.SessionStore(session.session_key))
+
+    def test_cached_reads(self):
+        session = self.SessionStore()
+        session['user'] = {'userinfo': {'email': 'user@email.com'}}
+        session.save()
+        # Written through: the next request reads the cache only
+        with self.assertNumQueries(0):
+            self.assertEqual(self.SessionStore(session.session_key)['user']['userinfo']['email'], 'user@email.com')
+
+        # Another process, or an evicted entry, falls back to the database
+        self.cache.clear()
+        with self.assertNumQueries(1):
+            self.assertIn('user', self.SessionStore(session.session_key))
+        with self.assertNumQueries(0):
+            self.assertIn('user', self.SessionStore(session.session_key))
+
+    def test_prune_sessions(self):
+        from django.contrib.sessions.models import Session
+        from django.utils import timezone
+        now = timezone.now()
+        for n in range(5):
+            Session.objects.create(session_key=f'expired{n}', session_data='', expire_date=now - datetime.timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + datetime.timedelta(days=1))
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('prune_sessions', '--batch-size', '2', stdout=out)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        self.assertIn('Deleted 5 expired sessions.', out.getvalue())
+        # Three batches
+        self.assertEqual(sum(query['sql'].startswith('DELETE') for query in queries), 3)
@@ -1,19 +1,30 @@
 # app/urls.py
+from django.conf import settings
 from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
-from app import views
+from app import views, async_views
+from app.models import Income, Expense
+
+# Under ASGI the analytics endpoints are served by their async versions
+analytics_views = async_views if settings.ASYNC_ANALYTICS else views
 
 urlpatterns = [
     path('users/', views.UserList.as_view()),
     path('users/<int:pk>/', views.UserDetail.as_view()),
     path('users/<int:pk>/incomes', views.IncomeList.as_view()),
     path('users/<int:pk>/expenses', views.ExpenseList.as_view()),
-    path('users/<int:pk>/netIncome', views.NetIncome.as_view()),
-    path('users/<int:pk>/graphData', views.GraphDataDetail.as_view()),
+    path('users/<int:pk>/incomes/batch', views.LedgerBatch.as_view(model=Income)),
+    path('users/<int:pk>/expenses/batch', views.LedgerBatch.as_view(model=Expense)),
+    path('users/<int:pk>/import', views.LedgerImport.as_view()),
+    path('users/<int:pk>/export', views.LedgerExport.as_view()),
+    path('users/<int:pk>/netIncome', analytics_views.NetIncome.as_view()),
+    path('users/<int:pk>/graphData', analytics_views.GraphDataDetail.as_view()),
     path('users/<int:pk>/upcomingExpenses', views.UpcomingExpenses.as_view()),
-    path('users/<int:pk>/budget', views.UserBudgetDetail.as_view()),
+    path('users/<int:pk>/budget', analytics_views.UserBudgetDetail.as_view()),
+    path('users/<int:pk>/forecast', views.Forecast.as_view()),
+    path('users/<int:pk>/dashboard', views.Dashboard.as_view()),
     path('income/<int:pk>', views.IncomeDetail.as_view()),
     path('expense/<int:pk>', views.ExpenseDetail.as_view()),
 ]
 
-urlpatterns = format_suffix_patterns(urlpatterns)
\ No newline at end of file
+urlpatterns = format_suffix_patterns(urlpatterns)
\ No newline at end of file
@@ -1,10 +1,7 @@
 import json
-import jwt
 import datetime
-from dateutil.relativedelta import *
 
-from functools import wraps
-from authlib.integrations.django_client import OAuth
+from functools import cache, wraps
 from django.conf import settings
 from django.shortcuts import redirect, render, redirect
 from django.urls import reverse
@@ -13,26 +10,37 @@ from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.views import APIView
 from rest_framework import status, permissions
-from django.http import Http404, JsonResponse
-from django.db.models import Sum
-from .models import User, Income, Expense
-from .serializers import UserSerializer, IncomeSerializer, ExpenseSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+from rest_framework.parsers import MultiPartParser
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.db.models import Q, Prefetch
+from .models import User, Income, Expense, MonthlyRollup
+from .serializers import UserSerializer, IncomeSerializer, ExpenseSerializer, income_values, expense_values
+from . import analytics, recurrence, importers, exporters, dashboard, batch
+from .money import cents, from_cents
+from .caching import data_version, cached_response, get_or_set, conditional, user_marker, owner_marker, users_marker
+from .pagination import DateCursorPagination
 
 """
 Auth
 """
 
-oauth = OAuth()
-
-oauth.register(
-    "auth0",
-    client_id=settings.AUTH0_CLIENT_ID,
-    client_secret=settings.AUTH0_CLIENT_SECRET,
-    client_kwargs={
-        "scope": "openid profile email",
-    },
-    server_metadata_url=f"https://{settings.AUTH0_DOMAIN}/.well-known/openid-configuration",
-)
+@cache
+def auth0():
+    # Registered on first use, so that authlib is only imported by the login
+    # views. The client fetches the provider metadata once and keeps it.
+    from authlib.integrations.django_client import OAuth
+    return OAuth().register(
+        "auth0",
+        client_id=settings.AUTH0_CLIENT_ID,
+        client_secret=settings.AUTH0_CLIENT_SECRET,
+        client_kwargs={
+            "scope": "openid profile email",
+        },
+        server_metadata_url=f"https://{settings.AUTH0_DOMAIN}/.well-known/openid-configuration",
+    )
 
 def index(request):
 
@@ -46,12 +54,12 @@ def index(request):
     )
 
 def login(request):
-    return oauth.auth0.authorize_redirect(
+    return auth0().authorize_redirect(
         request, request.build_absolute_uri(reverse("callback"))
     )
 
 def callback(request):
-    token = oauth.auth0.authorize_access_token(request)
+    token = auth0().authorize_access_token(request)
     request.session["user"] = token
     return redirect(request.build_absolute_uri(reverse("index")))
 
@@ -73,19 +81,65 @@ def logout(request):
 """
 USER
 """
+def get_user_selection(request, expand=None):
+  """
+  Read the ?fields= (profile fields) and ?expand= (nested relations) lists
+  of the request. A missing list keeps every profile field, and the
+  given default set of relations.
+  """
+  selection = {'fields': None, 'expand': expand}
+  allowed = {
+    'fields': UserSerializer.profile_fields(),
+    'expand': UserSerializer.EXPANDABLE_FIELDS,
+  }
+  for param in selection:
+    value = request.query_params.get(param, None)
+    if value is None:
+      continue
+    names = [name for name in value.split(',') if name]
+    unknown = [name for name in names if name not in allowed[param]]
+    if unknown:
+      raise ValidationError({param: f"Unknown field(s): {', '.join(unknown)}"})
+    selection[param] = names
+  return selection
+
+def get_user_queryset(fields=None, expand=None):
+  # Only load the selected columns, and each expanded relation with one query
+  users = User.objects.only(*(fields or UserSerializer.profile_fields()))
+  expand = UserSerializer.EXPANDABLE_FIELDS if expand is None else expand
+  related = {
+    'incomes': Income.objects.only(*IncomeSerializer.Meta.fields),
+    'expenses': Expense.objects.only(*ExpenseSerializer.Meta.fields),
+  }
+  for name in expand:
+    users = users.prefetch_related(Prefetch(name, queryset=related[name].order_by('-date', '-id')))
+  return users
+
 class UserDetail(APIView):
   #permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-  def get_object(self, pk):
+  def get_object(self, pk, queryset=None):
     try:
-      return User.objects.get(pk=pk)
+      return (queryset if queryset is not None else User.objects).get(pk=pk)
     except User.DoesNotExist:
       raise Http404
     
   # Retrieve
+  @conditional(user_marker())
   def get(self, request, pk, format=None):
-    user = self.get_object(pk)
-    serializer = UserSerializer(user)
-    return Response(serializer.data)
+    selection = get_user_selection(request)
+    user = self.get_object(pk, get_user_queryset(selection['fields'], expand=[]))
+    data = UserSerializer(user, fields=selection['fields'], expand=[]).data
+    # The nested lists can be long: read them as plain rows
+    expand = UserSerializer.EXPANDABLE_FIELDS if selection['expand'] is None else selection['expand']
+    related = {
+      'incomes': (Income, income_values),
+      'expenses': (Expense, expense_values),
+    }
+    for name in UserSerializer.EXPANDABLE_FIELDS:
+      if name in expand:
+        model, values = related[name]
+        data[name] = values.data(values.values_list(model.objects.filter(user=pk).order_by('-date', '-id')))
+    return Response(data)
   
   # Update
   def put(self, request, pk, format=None):
@@ -104,11 +158,16 @@ class UserDetail(APIView):
 
 class UserList(APIView):
     #permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    # List all users
+    # List all users, one page at a time and without their
+    # transactions unless ?expand= asks for them
+    @conditional(users_marker)
     def get(self, request, format=None):
-      users = User.objects.all()
-      serializer = UserSerializer(users, many=True)
-      return Response(serializer.data)
+      selection = get_user_selection(request, expand=[])
+      users = get_user_queryset(**selection).order_by('id')
+      paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+      page = paginator.paginate_queryset(users, request, view=self)
+      serializer = UserSerializer(page, many=True, **selection)
+      return paginator.get_paginated_response(serializer.data)
     
     # Insert a new user
     def post(self, request, format=None):
@@ -118,20 +177,48 @@ class UserList(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
       return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def get_month(request):
+  """
+  The ?year= and ?month= of a list request as ints, or (None, None) when
+  either is missing.
+  """
+  year = request.query_params.get('year', None)
+  month = request.query_params.get('month', None)
+  if not (year and month):
+    return None, None
+  errors = {}
+  try:
+    year = int(year)
+  except ValueError:
+    errors['year'] = "A valid integer is required."
+  else:
+    # The month after has to be a date as well
+    if not datetime.MINYEAR <= year < datetime.MAXYEAR:
+      errors['year'] = f"Must be between {datetime.MINYEAR} and {datetime.MAXYEAR - 1}."
+  try:
+    month = int(month)
+  except ValueError:
+    errors['month'] = "A valid integer is required."
+  else:
+    if not 1 <= month <= 12:
+      errors['month'] = "Must be between 1 and 12."
+  if errors:
+    raise ValidationError(errors)
+  return year, month
+
 """
 INCOME
 """
 class IncomeList(APIView):
   #permission_classes = [permissions.IsAuthenticatedOrReadOnly]
   # List all incomes that belong to the user key
+  @conditional(user_marker())
   def get(self, request, pk, format=None):
     # Filter by year and month
-    year = request.query_params.get('year', None)
-    month = request.query_params.get('month', None)
+    year, month = get_month(request)
     if year and month:
-      year = int(year)
-      month = int(month)
-      incomes = Income.objects.filter(user=pk, date__year=year, date__month=month)
+      start, end = analytics.month_range(year, month)
+      incomes = Income.objects.filter(user=pk, date__gte=start, date__lt=end)
     else:
       incomes = Income.objects.filter(user=pk)
 
@@ -140,20 +227,25 @@ class IncomeList(APIView):
     if source is not None:
       incomes = incomes.filter(source=source)
 
-    # Calculate statistics
-    stat = {}
-    total_amount = incomes.aggregate(Sum('amount')).get('amount__sum')
-    for choice in Income.INCOME_CATEGORY_CHOICES:
-      partial_sum = incomes.filter(source=choice[0]).aggregate(Sum('amount')).get('amount__sum')
-      if partial_sum:
-        stat[choice[0]] = round(float(partial_sum)/float(total_amount), 3) * 100.0
-      else:
-        stat[choice[0]] = 0.0
-
-    # Order the result
-    incomes = incomes.order_by('-date')
-    serializer = ExpenseSerializer(incomes, many=True)
-    json = {'list': serializer.data, 'stat': stat}
+    # Page through the result, newest first
+    paginator = DateCursorPagination()
+    page = paginator.paginate_queryset(
+      income_values.values_list(incomes), request, view=self, key=income_values.getter('date', 'id')
+    )
+    data = income_values.data(page)
+
+    # Calculate statistics from the monthly rollups, with the first page only
+    stat = None
+    if paginator.cursor is None:
+      rollups = MonthlyRollup.objects.filter(user=pk, kind=MonthlyRollup.INCOME)
+      if year and month:
+        rollups = rollups.filter(year=year, month=month)
+      if source is not None:
+        rollups = rollups.filter(category=source)
+      params = {'year': year or None, 'month': month or None, 'source': source}
+      stat = get_or_set('income-stat', pk, params, lambda: analytics.category_stat(rollups, Income.INCOME_CATEGORY_CHOICES), request)
+
+    json = {'list': data, 'stat': stat, 'next': paginator.get_next_link()}
     return Response(json)
   
   # Insert a new income to the list
@@ -173,6 +265,7 @@ class IncomeDetail(APIView):
       raise Http404
     
   # Retrieve
+  @conditional(owner_marker(Income))
   def get(self, request, pk, format=None):
     income = self.get_object(pk)
     serializer = IncomeSerializer(income)
@@ -193,20 +286,87 @@ class IncomeDetail(APIView):
     income.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
+class LedgerImport(APIView):
+  #permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+  parser_classes = [MultiPartParser]
+
+  # Import an uploaded CSV or OFX file of incomes and/or expenses
+  def post(self, request, pk, format=None):
+    if not User.objects.filter(pk=pk).exists():
+      raise Http404
+    upload = request.data.get('file', None)
+    if upload is None:
+      return Response({'file': "No file was submitted."}, status=status.HTTP_400_BAD_REQUEST)
+    file_format = request.data.get('file_format', None) or importers.file_format(upload.name)
+    if file_format not in importers.READERS:
+      return Response({'file_format': f'"{file_format}" is not a valid choice.'}, status=status.HTTP_400_BAD_REQUEST)
+    kind = request.data.get('kind', None) or None
+    if kind is not None and kind not in importers.KINDS:
+      return Response({'kind': f'"{kind}" is not a valid choice.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    report = importers.import_file(pk, upload, file_format, kind)
+    return Response(report, status=status.HTTP_201_CREATED if report['accepted'] else status.HTTP_200_OK)
+
+class LedgerBatch(APIView):
+  #permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+  # Income or Expense, set in urls.py
+  model = None
+
+  # Create, patch and delete many incomes or expenses at once: all of them
+  # are applied, or none when any is invalid (see batch.py)
+  def post(self, request, pk, format=None):
+    if data_version(pk, request) is None:
+      raise Http404
+    operations = request.data.get('operations', None) if isinstance(request.data, dict) else None
+    if not isinstance(operations, list) or not operations:
+      return Response({'operations': "Expected a non-empty list of operations."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(operations) > batch.MAX_OPERATIONS:
+      return Response({'operations': f"Ensure there are no more than {batch.MAX_OPERATIONS} operations."}, status=status.HTTP_400_BAD_REQUEST)
+
+    applied, results = batch.Batch(self.model, pk).apply(operations)
+    return Response({'applied': applied, 'results': results}, status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST)
+
+# A plain Django view: DRF would treat ?format= as a renderer override
+class LedgerExport(View):
+  @conditional(user_marker())
+  def get(self, request, pk):
+    if data_version(pk, request) is None:
+      raise Http404
+    file_format = request.GET.get('format', None) or 'csv'
+    if file_format not in exporters.FORMATS:
+      return JsonResponse({'format': f'"{file_format}" is not a valid choice.'}, status=status.HTTP_400_BAD_REQUEST)
+    kind = request.GET.get('kind', None) or None
+    if kind is not None and kind not in exporters.KINDS:
+      return JsonResponse({'kind': f'"{kind}" is not a valid choice.'}, status=status.HTTP_400_BAD_REQUEST)
+    dates = {}
+    for param in ('start', 'end'):
+      value = request.GET.get(param, None)
+      if value:
+        try:
+          dates[param] = datetime.date.fromisoformat(value)
+        except ValueError:
+          return JsonResponse({param: "Enter a valid date in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+    category = request.GET.get('category', None) or None
+
+    rows = exporters.ledger_rows(pk, category=category, kind=kind, **dates)
+    encode, content_type = exporters.FORMATS[file_format]
+    response = StreamingHttpResponse(encode(rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="ledger-{pk}.{file_format}"'
+    return response
+
 """
 EXPENSE
 """
 class ExpenseList(APIView):
   #permission_classes = [permissions.IsAuthenticatedOrReadOnly]
   # List all expenses that belong to the user key
+  @conditional(user_marker())
   def get(self, request, pk, format=None):
     # Filter by year and month
-    year = request.query_params.get('year', None)
-    month = request.query_params.get('month', None)
+    year, month = get_month(request)
     if year and month:
-      year = int(year)
-      month = int(month)
-      expenses = Expense.objects.filter(user=pk, date__year=year, date__month=month)
+      start, end = analytics.month_range(year, month)
+      expenses = Expense.objects.filter(user=pk, date__gte=start, date__lt=end)
     else:
       expenses = Expense.objects.filter(user=pk)
 
@@ -215,20 +375,25 @@ class ExpenseList(APIView):
     if category is not None:
       expenses = expenses.filter(category=category)
 
-    # Calculate statistics
-    stat = {}
-    total_amount = expenses.aggregate(Sum('amount')).get('amount__sum')
-    for choice in Expense.EXPENSE_CATEGORY_CHOICES:
-      partial_sum = expenses.filter(category=choice[0]).aggregate(Sum('amount')).get('amount__sum')
-      if partial_sum:
-        stat[choice[0]] = round(float(partial_sum)/float(total_amount), 3) * 100.0
-      else:
-        stat[choice[0]] = 0.0
-
-    # Order the result
-    expenses = expenses.order_by('-date')
-    serializer = ExpenseSerializer(expenses, many=True)
-    json = {'list': serializer.data, 'stat': stat}
+    # Page through the result, newest first
+    paginator = DateCursorPagination()
+    page = paginator.paginate_queryset(
+      expense_values.values_list(expenses), request, view=self, key=expense_values.getter('date', 'id')
+    )
+    data = expense_values.data(page)
+
+    # Calculate statistics from the monthly rollups, with the first page only
+    stat = None
+    if paginator.cursor is None:
+      rollups = MonthlyRollup.objects.filter(user=pk, kind=MonthlyRollup.EXPENSE)
+      if year and month:
+        rollups = rollups.filter(year=year, month=month)
+      if category is not None:
+        rollups = rollups.filter(category=category)
+      params = {'year': year or None, 'month': month or None, 'category': category}
+      stat = get_or_set('expense-stat', pk, params, lambda: analytics.category_stat(rollups, Expense.EXPENSE_CATEGORY_CHOICES), request)
+
+    json = {'list': data, 'stat': stat, 'next': paginator.get_next_link()}
     return Response(json)
   
   # Insert a new expense into the list
@@ -248,6 +413,7 @@ class ExpenseDetail(APIView):
       raise Http404
     
   # Retrieve
+  @conditional(owner_marker(Expense))
   def get(self, request, pk, format=None):
     expense = self.get_object(pk)
     serializer = ExpenseSerializer(expense)
@@ -272,20 +438,18 @@ class ExpenseDetail(APIView):
 '''
 class NetIncome(APIView):
   permission_classes = [permissions.AllowAny]
+
+  @conditional(user_marker())
+  @cached_response('netIncome', {'year': None, 'month': None, 'day': None})
   def get(self, request, pk, format=None):
     now_year = int(request.query_params.get('year'))
     now_month = int(request.query_params.get('month'))
     now_day = int(request.query_params.get('day'))
-    today = datetime.datetime(now_year, now_month, now_day)
-    incomes_so_far = Income.objects.filter(user=pk,date__lte=today).aggregate(Sum('amount'))
-    expenses_so_far = Expense.objects.filter(user=pk, date__lte=today).aggregate(Sum('amount'))
+    today = datetime.date(now_year, now_month, now_day)
+    totals = analytics.range_totals(pk, None, today)
 
     # Calculate the net income
-    net_income = 0
-    if incomes_so_far:
-      net_income += incomes_so_far['amount__sum']
-    if expenses_so_far:
-      net_income -= expenses_so_far['amount__sum']
+    net_income = from_cents(totals[MonthlyRollup.INCOME] - totals[MonthlyRollup.EXPENSE])
 
     return Response({'net_income': net_income}, status=status.HTTP_200_OK)
 
@@ -293,200 +457,56 @@ class NetIncome(APIView):
 class GraphDataDetail(APIView):
   permission_classes = [permissions.AllowAny]
 
-  def getLabel(self, scale, date:datetime.date):
-    label = ''
-    if (scale == '3y'):
-      label = f"{int((date.month-1)/3)}, {date.year}"
-    elif (scale == '1y'):
-      label = f"{date.month}, {date.year}"
-    elif (scale == '6m'):
-      label = f"{date.month}, {date.year}"
-    elif (scale == '3m'):
-      label = f"{date.day}, {date.month}, {date.year}"
-    elif (scale == '1m'):
-      label = f"{date.day}, {date.month}"
-    return label
-
-
-  def getAbsoluteNetIncomeList(self, pk, scale):
-    net_income_list = {}
-    # Retrieve objects first
-    incomes = Income.objects.filter(user=pk)
-    expenses = Expense.objects.filter(user=pk)
-    # Get TODAY
-    curr_date = datetime.date.today()
-    # Set interval and num iteration
-    interval = relativedelta(months=-1)
-    num_iteration = 5
-    curr_date_start = curr_date + relativedelta(day=1)
-    curr_date_end = curr_date
-    if (scale == '3y'):
-      interval = relativedelta(months=-3)
-      num_iteration = 11
-      quater = int((curr_date.month-1) / 3)
-      curr_date_start = curr_date + relativedelta(month=(quater*3)+1, day=1)
-      curr_date_end = curr_date
-    elif (scale == '1y'):
-      interval = relativedelta(months=-2)
-      num_iteration = 5
-      curr_date_start = curr_date + relativedelta(months=-1, day=1)
-      curr_date_end = curr_date
-    elif (scale == '6m'):
-      pass
-    elif (scale == '3m'):
-      interval = relativedelta(weeks=-1)
-      num_iteration = 11
-      curr_date_start = curr_date + relativedelta(weekday=MO(-1))
-      curr_date_end = curr_date
-    elif (scale == '1m'):
-      interval = relativedelta(days=-1)
-      num_iteration = curr_date.day - 1
-      curr_date_start = curr_date
-      curr_date_end = curr_date
-    else:
-      return ResourceWarning({}, status=status.HTTP_400_BAD_REQUEST)
-      
-    # Calculate the net income of the current month
-    # Retrieve objects and sum up the items
-    income_sum = incomes.filter(date__gte=curr_date_start,date__lte=curr_date_end).aggregate(Sum('amount')).get('amount__sum')
-    expense_sum = expenses.filter(date__gte=curr_date_start,date__lte=curr_date_end).aggregate(Sum('amount')).get('amount__sum')
-    # Calculate the net income
-    net_income = 0
-    if income_sum and expense_sum:
-      net_income = income_sum - expense_sum
-    # Store it in the list
-    net_income_list[self.getLabel(scale, curr_date_end)] = net_income
-    # Calculate the net incomes
-    for i in range(num_iteration):
-      
-      # Create Datetime objects and
-      # Calculate the date one interval before
-      prev_date_start = curr_date_start + interval
-      prev_date_end = curr_date_start + relativedelta(days=-1)
-      
-      # Retrieve objects and calculate the net income
-      income_sum = incomes.filter(date__gte=prev_date_start,date__lte=prev_date_end).aggregate(Sum('amount')).get('amount__sum')
-      expense_sum = expenses.filter(date__gte=prev_date_start,date__lte=prev_date_end).aggregate(Sum('amount')).get('amount__sum')
-      # Calculate the net income
-      net_income = 0
-      # If net income and expense items are found
-      net_income = 0
-      if income_sum:
-        net_income += income_sum
-      if expense_sum:
-        net_income -= expense_sum
-      # Store it in the list
-      net_income_list[self.getLabel(scale, prev_date_end)] = net_income
-      # Update the current month
-      curr_date_start = prev_date_start
-
-    # Reverse the list
-    net_income_list = dict(reversed(list(net_income_list.items())))
-    return net_income_list
-
-  def getMoneyFlow(self, pk, scale):
-    net_income_flow = {}
-    # Retrieve objects first
-    incomes = Income.objects.filter(user=pk)
-    expenses = Expense.objects.filter(user=pk)
-    # Get TODAY
-    curr_date = datetime.date.today()
-    # Get net income so far
-    incomes_so_far = incomes.filter(date__lte=curr_date).aggregate(Sum('amount'))
-    expenses_so_far = expenses.filter(date__lte=curr_date).aggregate(Sum('amount'))
-    # Calculate the net income so far
-    net_income_so_far = incomes_so_far['amount__sum'] - expenses_so_far['amount__sum']
-    # Store it as a current net income
-    net_income_flow[self.getLabel(scale, curr_date)] = net_income_so_far
-    # Set interval and num iteration
-    interval = relativedelta(months=-1)
-    num_iteration = 5
-    curr_date_start = curr_date + relativedelta(day=1)
-    curr_date_end = curr_date
-    if (scale == '3y'):
-      interval = relativedelta(months=-3)
-      num_iteration = 11
-      quater = int((curr_date.month-1) / 3)
-      curr_date_start = curr_date + relativedelta(month=(quater*3)+1, day=1)
-      curr_date_end = curr_date
-    elif (scale == '1y'):
-      interval = relativedelta(months=-2)
-      num_iteration = 5
-      curr_date_start = curr_date + relativedelta(months=-1, day=1)
-      curr_date_end = curr_date
-    elif (scale == '6m'):
-      pass
-    elif (scale == '3m'):
-      interval = relativedelta(weeks=-1)
-      num_iteration = 11
-      curr_date_start = curr_date + relativedelta(weekday=MO(-1))
-      curr_date_end = curr_date
-    elif (scale == '1m'):
-      interval = relativedelta(days=-1)
-      num_iteration = curr_date.day - 1
-      curr_date_start = curr_date
-      curr_date_end = curr_date
-    else:
-      return ResourceWarning({}, status=status.HTTP_400_BAD_REQUEST)
-
-    # Calculate the net incomes
-    for i in range(num_iteration):
-      # Calculate the net income of the current month
-      # Retrieve objects and sum up the items
-      
-      income_sum = incomes.filter(date__gte=curr_date_start,date__lte=curr_date_end).aggregate(Sum('amount')).get('amount__sum')
-      expense_sum = expenses.filter(date__gte=curr_date_start,date__lte=curr_date_end).aggregate(Sum('amount')).get('amount__sum')
-      # Calculate the net income
-      net_income = 0
-      if income_sum:
-        net_income += income_sum
-      if expense_sum:
-        net_income -= expense_sum
-      net_income_so_far = net_income_so_far - net_income
-      # Store it in the list
-      prev_date_end = curr_date_start + relativedelta(days=-1)
-      net_income_flow[self.getLabel(scale, prev_date_end)] = net_income_so_far
-      # Update curr_date
-      curr_date_start = curr_date_start + interval
-      curr_date_end = prev_date_end
-
-    # Reverse the list
-    net_income_flow = dict(reversed(list(net_income_flow.items())))
-    return net_income_flow
-  
+  @conditional(user_marker(daily=True))
+  @cached_response('graphData', {'scale': '6m'}, daily=True)
   def get(self, request, pk, format=None):
     scale = request.query_params.get('scale', None)
     if scale is None or scale == '':
       scale = '6m'
+    if scale not in analytics.SCALES:
+      return Response({'scale': f"Unknown scale: {scale}"}, status=status.HTTP_400_BAD_REQUEST)
 
-    net_income_flow = self.getMoneyFlow(pk, scale)
-    net_income_list = self.getAbsoluteNetIncomeList(pk, scale)
+    # Get TODAY
+    today = datetime.date.today()
+    buckets = analytics.get_buckets(scale, today)
+    # The same sums give every bucket and the total so far
+    sums = analytics.bucket_sums(pk, buckets, today)
+    income_sums, income_total = sums[MonthlyRollup.INCOME]
+    expense_sums, expense_total = sums[MonthlyRollup.EXPENSE]
+
+    net_income_flow = analytics.money_flow_series(scale, income_sums, expense_sums, buckets, income_total - expense_total, today)
+    net_income_list = analytics.net_income_series(scale, income_sums, expense_sums, buckets)
     data = {'net_income_flow': net_income_flow, 'net_income_list': net_income_list}
     return Response(data)
   
 class UpcomingExpenses(APIView):
   permission_classes = [permissions.AllowAny]
 
+  @conditional(user_marker(daily=True))
   def get(self, request, pk, format=None):
     curr_date = datetime.date.today()
+    until = curr_date + datetime.timedelta(days=30)
+
+    # next_due never comes after the actual next occurrence, so one range
+    # read on the (user, next_due) index finds every expense due in the window
+    recurring_expenses = Expense.objects.filter(user=pk, type=True, next_due__lte=until)
+
+    # next_due may be stale since the last save: compute the occurrence
+    # directly instead of stepping through the intervals or writing it back
+    rows = expense_values.values_list(recurring_expenses, 'interval_years', 'interval_months', 'interval_days')
+    date_index = expense_values.index('date')
+    count = len(expense_values.fields)
+    upcoming = []
+    for row in rows:
+      due = recurrence.next_occurrence(row[date_index], row[count:], curr_date)
+      if due is not None and due <= until:
+        row = list(row[:count])
+        row[date_index] = due
+        upcoming.append(row)
 
-    recurring_expenses = Expense.objects.filter(user=pk, type=True)
-    
-    # Update the dates of recurring expenses
-    for expense in recurring_expenses:
-      [y_delta, m_delta, d_delta] = [eval(n) for n in expense.interval.split('-')]
-      interval = relativedelta(years=y_delta, months=m_delta, days=d_delta)
-      while expense.date < curr_date:
-        expense.date += interval
-
-    # Bulk update recurring expenses
-    Expense.objects.bulk_update(recurring_expenses, ["date"])
-
-    # Order the result and return top 5
-    recurring_expenses = recurring_expenses.filter(date__gte=curr_date, date__lte=curr_date+datetime.timedelta(days=30))
-    recurring_expenses = recurring_expenses.order_by('date')
-    serializer = ExpenseSerializer(recurring_expenses, many=True)
-    return Response(serializer.data)
+    # Order the result
+    upcoming.sort(key=lambda row: row[date_index])
+    return Response(expense_values.data(upcoming))
 
 class UserBudgetDetail(APIView):
   permission_classes = [permissions.AllowAny]
@@ -508,11 +528,8 @@ class UserBudgetDetail(APIView):
       ret['income_goal'] = user.income_goal
       today = datetime.date.today()
       this_month = datetime.date(year=today.year, month=today.month, day=1)
-      monthly_total_income = Income.objects.filter(date__gte=this_month, date__lte=today).aggregate(Sum('amount')).get('amount__sum')
-      if monthly_total_income:
-        ret['monthly_total_income'] = monthly_total_income
-      else:
-        ret['monthly_total_income'] = 0.0
+      monthly_total_income = analytics.range_totals(pk, this_month, today, [MonthlyRollup.INCOME])[MonthlyRollup.INCOME]
+      ret['monthly_total_income'] = from_cents(monthly_total_income)
     
     if expense_budget is not None:
       user.expense_budget = expense_budget
@@ -520,16 +537,15 @@ class UserBudgetDetail(APIView):
       ret['expense_budget'] = user.expense_budget
       today = datetime.date.today()
       this_month = datetime.date(year=today.year, month=today.month, day=1)
-      monthly_total_expense = Expense.objects.filter(date__gte=this_month, date__lte=today).aggregate(Sum('amount')).get('amount__sum')
-      if monthly_total_expense:
-        ret['monthly_total_expense'] = monthly_total_expense
-      else:
-        ret['monthly_total_expense'] = 0.0
+      monthly_total_expense = analytics.range_totals(pk, this_month, today, [MonthlyRollup.EXPENSE])[MonthlyRollup.EXPENSE]
+      ret['monthly_total_expense'] = from_cents(monthly_total_expense)
 
     user.save()
     
     return Response(ret)
   
+  @conditional(user_marker(daily=True))
+  @cached_response('budget', {'incomeGoal': None, 'expenseBudget': None}, daily=True)
   def get(self, request, pk, format=None):
     user = self.get_object(pk)
     income_goal = request.query_params.get('incomeGoal', None)
@@ -542,21 +558,108 @@ class UserBudgetDetail(APIView):
       ret['income_goal'] = user.income_goal
       today = datetime.date.today()
       this_month = datetime.date(year=today.year, month=today.month, day=1)
-      monthly_total_income = Income.objects.filter(date__gte=this_month, date__lte=today).aggregate(Sum('amount')).get('amount__sum')
-      if monthly_total_income:
-        ret['monthly_total_income'] = monthly_total_income
-      else:
-        ret['monthly_total_income'] = 0.0
+      monthly_total_income = analytics.range_totals(pk, this_month, today, [MonthlyRollup.INCOME])[MonthlyRollup.INCOME]
+      ret['monthly_total_income'] = from_cents(monthly_total_income)
 
     if expense_budget:
       ret['expense_budget'] = user.expense_budget
       today = datetime.date.today()
       this_month = datetime.date(year=today.year, month=today.month, day=1)
-      monthly_total_expense = Expense.objects.filter(date__gte=this_month, date__lte=today).aggregate(Sum('amount')).get('amount__sum')
-      if monthly_total_expense:
-        ret['monthly_total_expense'] = monthly_total_expense
-      else:
-        ret['monthly_total_expense'] = 0.0
+      monthly_total_expense = analytics.range_totals(pk, this_month, today, [MonthlyRollup.EXPENSE])[MonthlyRollup.EXPENSE]
+      ret['monthly_total_expense'] = from_cents(monthly_total_expense)
 
     return Response(ret)
-  
\ No newline at end of file
+  
+
+class Forecast(APIView):
+  permission_classes = [permissions.AllowAny]
+
+  def get_items(self, model, pk, today, end):
+    # Recurring items, and the one-off items dated inside the window
+    rows = model.objects.filter(Q(type=True) | Q(date__gt=today, date__lte=end), user=pk).values_list(
+      'type', 'date', 'interval_years', 'interval_months', 'interval_days', cents('amount')
+    )
+    dates, intervals, amounts = [], [], []
+    for type, date, years, months, days, amount in rows:
+      dates.append(date)
+      intervals.append((years, months, days) if type else (0, 0, 0))
+      amounts.append(amount)
+    return dates, intervals, amounts
+
+  @conditional(user_marker(daily=True))
+  def get(self, request, pk, format=None):
+    # Imported here: numpy is only needed by this view
+    from . import forecast
+    horizon = request.query_params.get('horizon', None) or '1y'
+    granularity = request.query_params.get('granularity', None) or 'monthly'
+    if granularity not in ('daily', 'monthly'):
+      return Response({'granularity': f"Unknown granularity: {granularity}"}, status=status.HTTP_400_BAD_REQUEST)
+    today = datetime.date.today()
+    try:
+      end = forecast.horizon_end(horizon, today)
+    except ValueError as e:
+      return Response({'horizon': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Start from the current net income, in cents
+    totals = analytics.range_totals(pk, None, today)
+    net_income = totals[MonthlyRollup.INCOME] - totals[MonthlyRollup.EXPENSE]
+
+    income_dates, income_intervals, income_amounts = self.get_items(Income, pk, today, end)
+    expense_dates, expense_intervals, expense_amounts = self.get_items(Expense, pk, today, end)
+    balances = forecast.daily_balances(
+      net_income,
+      income_dates + expense_dates,
+      income_intervals + expense_intervals,
+      income_amounts + [-amount for amount in expense_amounts],
+      today + datetime.timedelta(days=1),
+      end,
+    )
+
+    if granularity == 'daily':
+      labels = forecast.day_labels(today + datetime.timedelta(days=1), len(balances))
+    else:
+      labels, balances = forecast.monthly_balances(balances, today + datetime.timedelta(days=1))
+    data = {
+      'net_income': from_cents(net_income),
+      'balances': {label: from_cents(cents) for label, cents in zip(labels, balances.tolist())},
+    }
+    return Response(data)
+
+class Dashboard(APIView):
+  permission_classes = [permissions.AllowAny]
+
+  # Every section of the dashboard in one response, from one snapshot
+  @conditional(user_marker(daily=True))
+  @cached_response('dashboard', {'sections': None, 'scale': '6m', 'page_size': None}, daily=True)
+  def get(self, request, pk, format=None):
+    try:
+      sections = dashboard.parse_sections(request.query_params.get('sections', None))
+    except ValueError as e:
+      return Response({'sections': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    scale = request.query_params.get('scale', None) or '6m'
+    if scale not in analytics.SCALES:
+      return Response({'scale': f"Unknown scale: {scale}"}, status=status.HTTP_400_BAD_REQUEST)
+    user = User.objects.only('income_goal', 'expense_budget').filter(pk=pk).first()
+    if user is None:
+      raise Http404
+
+    paginator = DateCursorPagination()
+    page_size = paginator.get_page_size(request)
+    snapshot = dashboard.Snapshot(user, sections, scale, page_size, datetime.date.today())
+    data = {}
+    for section in sections:
+      if section == 'netIncome':
+        data[section] = snapshot.net_income()
+      elif section == 'graphData':
+        data[section] = snapshot.graph_data(scale)
+      elif section == 'budget':
+        data[section] = snapshot.budget()
+      elif section == 'upcomingExpenses':
+        data[section] = snapshot.upcoming_expenses()
+      else:
+        # The following pages come from the list endpoint, next to this one
+        def next_link(cursor, section=section):
+          query = urlencode({'page_size': page_size, paginator.cursor_query_param: paginator.encode_cursor(cursor)})
+          return request.build_absolute_uri(f'{section}?{query}')
+        data[section] = snapshot.ledger(section, page_size, next_link)
+    return Response(data)
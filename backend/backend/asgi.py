@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Serve the analytics endpoints with their async views
+os.environ.setdefault('ASYNC_ANALYTICS', '1')
+# Read by the settings: no persistent connections (see CONN_MAX_AGE)
+os.environ.setdefault('DJANGO_INTERFACE', 'asgi')
 
 application = get_asgi_application()
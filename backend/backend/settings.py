@@ -12,12 +12,18 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv, find_dotenv
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Load .env first: the settings below read it
+ENV_FILE = find_dotenv()
+if ENV_FILE:
+    load_dotenv(ENV_FILE)
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -46,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that it times the other middleware as well
+    'app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +62,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    # Last, so that it profiles the view and its rendering only
+    'app.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -80,18 +90,72 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Rest Framowrk
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # Bearer JWTs first (app/authentication.py), then DRF's defaults
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'app.authentication.JWTAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
 }
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_PROFILE picks one of:
+#   sqlite         the local file, with WAL and the SQLITE_PRAGMAS below
+#   sqlite-plain   the local file with SQLite's own defaults
+#   postgres       PostgreSQL from the POSTGRES_* variables (needs psycopg)
+# Benchmark them with `python -m benchmarks.database`.
+
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
+# Seconds a connection is kept open between requests (0 closes it after each).
+# Under ASGI (backend/asgi.py) the ORM runs in sync_to_async threads that
+# Django never closes connections for, so persistent connections would
+# pile up: they are off unless DATABASE_CONN_MAX_AGE is set.
+DJANGO_INTERFACE = os.environ.get('DJANGO_INTERFACE', 'wsgi')
+CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 0 if DJANGO_INTERFACE == 'asgi' else 60))
+
+# Applied to every new SQLite connection (see app/db.py)
+SQLITE_PRAGMAS = {}
+
+if DATABASE_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'finance'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            # Reused connections are checked before the first query of a request
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
-}
+elif DATABASE_PROFILE in ('sqlite', 'sqlite-plain'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            # Checks run in subprocesses point it at a throwaway file
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+        }
+    }
+    if DATABASE_PROFILE == 'sqlite':
+        SQLITE_PRAGMAS = {
+            # Readers no longer block the writer, nor the writer the readers
+            'journal_mode': 'WAL',
+            # Milliseconds a connection waits for a lock before "database is locked"
+            'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+            # Safe with WAL: only the last commits can be lost on power loss
+            'synchronous': 'NORMAL',
+            'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+            # Negative: in KiB rather than pages
+            'cache_size': -int(os.environ.get('SQLITE_CACHE_KIB', 64 * 1024)),
+        }
+else:
+    raise ImproperlyConfigured(f'Unknown DATABASE_PROFILE "{DATABASE_PROFILE}"')
 
 AUTH_USER_MODEL = "app.User"
 
@@ -141,13 +205,115 @@ CORS_ORIGIN_WHITELIST = [
 ]
 
 
-# Load .env
-ENV_FILE = find_dotenv()
-if ENV_FILE:
-    load_dotenv(ENV_FILE)
-
-
 # Load Auth0
 AUTH0_DOMAIN = os.environ.get("AUTH0_DOMAIN")
 AUTH0_CLIENT_ID = os.environ.get("AUTH0_CLIENT_ID")
 AUTH0_CLIENT_SECRET = os.environ.get("AUTH0_CLIENT_SECRET")
+
+
+# API authentication with bearer JWTs (app/authentication.py), checked
+# against the signing keys of JWT_JWKS_URL
+JWT_ISSUER = os.environ.get('JWT_ISSUER', f'https://{AUTH0_DOMAIN}/' if AUTH0_DOMAIN else None)
+JWT_JWKS_URL = os.environ.get('JWT_JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json' if AUTH0_DOMAIN else None)
+# The identifier of the API in Auth0 (empty: bearer tokens are refused)
+JWT_AUDIENCE = os.environ.get('JWT_AUDIENCE', '')
+JWT_ALGORITHMS = ['RS256']
+# Claim matched against User.email
+JWT_USER_CLAIM = os.environ.get('JWT_USER_CLAIM', 'email')
+# A token with an unknown key id refetches the keys, at most once per this many seconds
+JWT_JWKS_REFRESH_INTERVAL = float(os.environ.get('JWT_JWKS_REFRESH_INTERVAL', 60))
+# Decoded tokens kept per process
+JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', 1024))
+
+
+# Async analytics views (app/async_views.py), on by default under ASGI
+ASYNC_ANALYTICS = os.environ.get('ASYNC_ANALYTICS', '0') == '1'
+
+
+# Request metrics (app/metrics.py), served at /metrics. Off by default, as
+# they show the traffic and latency of every route; when METRICS_TOKEN is
+# set, /metrics requires it as a bearer token.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Share of the requests whose queries are logged one by one
+METRICS_QUERY_SAMPLE_RATE = float(os.environ.get('METRICS_QUERY_SAMPLE_RATE', 0.01))
+
+
+# Request profiling (app/profiling.py), summarized by `manage.py profile_summary`
+# Profile every request
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+# Share of the requests profiled
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+# Requests with this value in their X-Profile header are profiled (empty: never)
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+# Routes profiled when enabled or sampled, as shell patterns, e.g. "*graphData,*upcomingExpenses"
+PROFILING_ROUTES = [route for route in os.environ.get('PROFILING_ROUTES', '').split(',') if route]
+# cprofile, or sampler (stack samples every PROFILING_INTERVAL seconds)
+PROFILING_MODE = os.environ.get('PROFILING_MODE', 'cprofile')
+PROFILING_INTERVAL = float(os.environ.get('PROFILING_INTERVAL', 0.001))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+# Older profiles are removed
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 200))
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/ref/settings/#caches
+# The analytics cache holds per-user results (see app/caching.py). It is
+# local to each process by default; use
+# ANALYTICS_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# with a directory as ANALYTICS_CACHE_LOCATION to share it between processes.
+
+ANALYTICS_CACHE = 'analytics'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    ANALYTICS_CACHE: {
+        'BACKEND': os.environ.get('ANALYTICS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('ANALYTICS_CACHE_LOCATION', 'analytics'),
+        # Seconds an entry is kept
+        'TIMEOUT': int(os.environ.get('ANALYTICS_CACHE_TTL', 300)),
+        'OPTIONS': {
+            # Once MAX_ENTRIES is reached, 1/CULL_FREQUENCY of them are evicted
+            'MAX_ENTRIES': int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES', 1000)),
+            'CULL_FREQUENCY': int(os.environ.get('ANALYTICS_CACHE_CULL_FREQUENCY', 3)),
+        },
+    },
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/4.2/topics/http/sessions/
+# SESSION_STORAGE picks one of:
+#   cached_db   written through to the sessions cache and the database, and
+#               read from the cache, falling back to the database
+#   db          the database only
+# cached_db needs a cache shared by every process, set with
+# SESSION_CACHE_BACKEND and SESSION_CACHE_LOCATION, e.g.
+# django.core.cache.backends.redis.RedisCache and redis://localhost:6379:
+# with a cache per process, a session cleared by one worker (logout) would
+# stay valid in the others. It is the default when that cache is set, and
+# db otherwise.
+# Expired sessions are removed by `manage.py prune_sessions`, to be run
+# from cron (e.g. hourly).
+
+SESSION_CACHE_BACKEND = os.environ.get('SESSION_CACHE_BACKEND', '')
+SESSION_STORAGE = os.environ.get('SESSION_STORAGE', 'cached_db' if SESSION_CACHE_BACKEND else 'db')
+SESSION_ENGINES = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'db': 'django.contrib.sessions.backends.db',
+}
+if SESSION_STORAGE not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f'Unknown SESSION_STORAGE "{SESSION_STORAGE}"')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_STORAGE]
+
+if SESSION_STORAGE == 'cached_db':
+    # Local caches are per process
+    if SESSION_CACHE_BACKEND in ('', 'django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache'):
+        raise ImproperlyConfigured('SESSION_STORAGE "cached_db" needs a shared SESSION_CACHE_BACKEND')
+    CACHES['sessions'] = {
+        'BACKEND': SESSION_CACHE_BACKEND,
+        'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', ''),
+    }
+    SESSION_CACHE_ALIAS = 'sessions'
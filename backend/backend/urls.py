@@ -16,7 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from app import views
+from app import views, metrics
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -25,6 +25,7 @@ urlpatterns = [
     path("callback", views.callback, name="callback"),
     path('admin/', admin.site.urls),
     path('api/', include('app.urls')),
+    path('metrics', metrics.metrics_view, name='metrics'),
 ]
 
 urlpatterns += [
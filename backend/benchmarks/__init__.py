@@ -0,0 +1,26 @@
+import os
+import sys
+from contextlib import contextmanager
+
+"""
+Benchmarks, run from the backend directory with
+python -m benchmarks.<name>
+
+They run against a throwaway test database, never the configured one.
+"""
+
+def setup():
+  sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+  os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+  import django
+  django.setup()
+
+@contextmanager
+def test_database():
+  from django.db import connection
+  old_name = connection.settings_dict['NAME']
+  connection.creation.create_test_db(verbosity=0)
+  try:
+    yield connection
+  finally:
+    connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from . import setup, test_database
+
+"""
+Throughput and latency of the analytics endpoints with concurrent
+clients: the sync APIViews through the WSGI handler, one thread per
+client, against the async views through the ASGI handler, one task per
+client. Both run in this process against the same test database, with the
+analytics cache disabled so every request is computed.
+"""
+
+ENDPOINTS = ['netIncome', 'graphData', 'budget']
+
+def urlconf(name, module):
+  from django.urls import path
+  urls = types.ModuleType(name)
+  urls.urlpatterns = [
+    path('users/<int:pk>/netIncome', module.NetIncome.as_view()),
+    path('users/<int:pk>/graphData', module.GraphDataDetail.as_view()),
+    path('users/<int:pk>/budget', module.UserBudgetDetail.as_view()),
+  ]
+  sys.modules[name] = urls
+  return name
+
+def request_paths(user_ids, count, today):
+  from app import analytics
+  paths = []
+  for i in range(count):
+    pk = user_ids[i % len(user_ids)]
+    endpoint = ENDPOINTS[i % len(ENDPOINTS)]
+    if endpoint == 'netIncome':
+      query = f'year={today.year}&month={today.month}&day={today.day}'
+    elif endpoint == 'graphData':
+      query = f'scale={analytics.SCALES[i % len(analytics.SCALES)]}'
+    else:
+      query = 'incomeGoal=true&expenseBudget=true'
+    paths.append(f'/users/{pk}/{endpoint}?{query}')
+  return paths
+
+def fill(users, rows, today):
+  from app.models import User, Income, Expense, MonthlyRollup
+  user_ids = []
+  for u in range(users):
+    user = User.objects.create(username=f'bench{u}', email=f'bench{u}@email.com', income_goal=1000, expense_budget=500)
+    user_ids.append(user.id)
+    for model in (Income, Expense):
+      model.objects.bulk_create([
+        model(user=user, amount=Decimal(10 + i % 90), date=today - datetime.timedelta(days=i % 1100))
+        for i in range(rows)
+      ], batch_size=5000)
+  MonthlyRollup.objects.rebuild()
+  return user_ids
+
+def run_wsgi(paths, concurrency):
+  from django.test import Client
+  local = threading.local()
+
+  def get(path):
+    if not hasattr(local, 'client'):
+      local.client = Client()
+    start = time.perf_counter()
+    response = local.client.get(path)
+    assert response.status_code == 200, path
+    return time.perf_counter() - start
+
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    start = time.perf_counter()
+    latencies = list(executor.map(get, paths))
+    return time.perf_counter() - start, latencies
+
+def run_asgi(paths, concurrency):
+  from django.test import AsyncClient
+
+  async def worker(queue, latencies):
+    client = AsyncClient()
+    while queue:
+      path = queue.pop()
+      start = time.perf_counter()
+      response = await client.get(path)
+      assert response.status_code == 200, path
+      latencies.append(time.perf_counter() - start)
+
+  async def main():
+    queue = list(reversed(paths))
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(queue, latencies) for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+  return asyncio.run(main())
+
+def report(name, elapsed, latencies):
+  latencies = sorted(latencies)
+  p50 = latencies[len(latencies) // 2]
+  p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+  print(f"{name:5} {len(latencies) / elapsed:9.1f} req/s   p50 {p50 * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms")
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--users', type=int, default=20)
+  parser.add_argument('--rows', type=int, default=2000, help="incomes and expenses per user")
+  parser.add_argument('--requests', type=int, default=1500)
+  parser.add_argument('--concurrency', type=int, default=16)
+  args = parser.parse_args()
+
+  setup()
+  from django.test.utils import override_settings
+  from app import views, async_views
+
+  caches = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'analytics': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+  }
+  with test_database():
+    today = datetime.date.today()
+    user_ids = fill(args.users, args.rows, today)
+    paths = request_paths(user_ids, args.requests, today)
+    print(f"{args.users} users x {args.rows} rows, {args.requests} requests, {args.concurrency} concurrent clients")
+
+    served = dict(CACHES=caches, DEBUG=False, ALLOWED_HOSTS=['testserver'])
+    # The sync budget view prints its params
+    with override_settings(ROOT_URLCONF=urlconf('benchmarks.wsgi_urls', views), **served):
+      with contextlib.redirect_stdout(io.StringIO()):
+        result = run_wsgi(paths, args.concurrency)
+      report('WSGI', *result)
+    with override_settings(ROOT_URLCONF=urlconf('benchmarks.asgi_urls', async_views), **served):
+      report('ASGI', *run_asgi(paths, args.concurrency))
+
+if __name__ == '__main__':
+  main()
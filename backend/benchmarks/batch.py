@@ -0,0 +1,89 @@
+import argparse
+import time
+
+from . import setup, test_database
+
+"""
+Write throughput, in items per second, of one request per income against
+the batch endpoint: creates, then patches, then deletes of the same rows.
+"""
+
+def run_single(client, user_id, count):
+  from app.models import Income
+  start = time.perf_counter()
+  for i in range(count):
+    response = client.post(
+      f'/api/users/{user_id}/incomes',
+      {'user': user_id, 'amount': f'{10 + i % 90}.00', 'source': 'SALARY', 'date': f'2023-{1 + i % 12:02}-01'},
+      content_type='application/json',
+    )
+    assert response.status_code == 201, response.content
+  created = time.perf_counter() - start
+
+  ids = list(Income.objects.filter(user=user_id).values_list('id', flat=True))
+  start = time.perf_counter()
+  for id in ids:
+    response = client.put(
+      f'/api/income/{id}',
+      {'user': user_id, 'amount': '5.00', 'source': 'OTHER', 'date': '2023-06-01'},
+      content_type='application/json',
+    )
+    assert response.status_code == 200, response.content
+  patched = time.perf_counter() - start
+
+  start = time.perf_counter()
+  for id in ids:
+    assert client.delete(f'/api/income/{id}').status_code == 204
+  return created, patched, time.perf_counter() - start
+
+def run_batch(client, user_id, count, size):
+  from app.models import Income
+
+  def post(operations):
+    for i in range(0, len(operations), size):
+      response = client.post(
+        f'/api/users/{user_id}/incomes/batch', {'operations': operations[i:i + size]}, content_type='application/json'
+      )
+      assert response.status_code == 200, response.content
+
+  start = time.perf_counter()
+  post([
+    {'op': 'create', 'data': {'amount': f'{10 + i % 90}.00', 'source': 'SALARY', 'date': f'2023-{1 + i % 12:02}-01'}}
+    for i in range(count)
+  ])
+  created = time.perf_counter() - start
+
+  ids = list(Income.objects.filter(user=user_id).values_list('id', flat=True))
+  start = time.perf_counter()
+  post([{'op': 'patch', 'id': id, 'data': {'amount': '5.00', 'source': 'OTHER', 'date': '2023-06-01'}} for id in ids])
+  patched = time.perf_counter() - start
+
+  start = time.perf_counter()
+  post([{'op': 'delete', 'id': id} for id in ids])
+  return created, patched, time.perf_counter() - start
+
+def report(name, count, times):
+  rates = '   '.join(f"{op} {count / elapsed:9.1f}" for op, elapsed in zip(('create', 'patch', 'delete'), times))
+  print(f"{name:14} items/s   {rates}")
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--items', type=int, default=2000)
+  parser.add_argument('--batch-size', type=int, default=500)
+  args = parser.parse_args()
+
+  setup()
+  from django.test import Client
+  from django.test.utils import override_settings
+  from app.models import User
+
+  with test_database(), override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+    client = Client()
+    print(f"{args.items} incomes, batches of {args.batch_size}")
+    user = User.objects.create(username='bench', email='bench@email.com')
+    report('single', args.items, run_single(client, user.id, args.items))
+    user = User.objects.create(username='bench_batch', email='bench_batch@email.com')
+    report('batch', args.items, run_batch(client, user.id, args.items, args.batch_size))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,169 @@
+import argparse
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import setup, test_database
+
+"""
+Concurrent reads and writes against each database profile (see
+DATABASE_PROFILE in settings.py). Worker processes, like gunicorn sync
+workers, send requests through the WSGI handler for a fixed time: writes
+create incomes, reads list them and compute the net income. Connections
+are closed or kept between requests as CONN_MAX_AGE says, and any request
+failing with "database is locked" is counted as a lock error.
+
+Each profile runs in its own process, with its settings read from the
+environment as in production. SQLite profiles use a fresh database file.
+"""
+
+PROFILES = {
+  'sqlite': [
+    ('sqlite-plain', {'DATABASE_PROFILE': 'sqlite-plain', 'DATABASE_CONN_MAX_AGE': '0'}),
+    ('sqlite', {'DATABASE_PROFILE': 'sqlite'}),
+  ],
+  'postgres': [
+    ('postgres, no reuse', {'DATABASE_PROFILE': 'postgres', 'DATABASE_CONN_MAX_AGE': '0'}),
+    ('postgres', {'DATABASE_PROFILE': 'postgres'}),
+  ],
+}
+
+def environ(method, path, body=None):
+  path, _, query = path.partition('?')
+  body = json.dumps(body).encode() if body is not None else b''
+  return {
+    'REQUEST_METHOD': method,
+    'PATH_INFO': path,
+    'QUERY_STRING': query,
+    'SERVER_NAME': 'testserver',
+    'SERVER_PORT': '80',
+    'SERVER_PROTOCOL': 'HTTP/1.1',
+    'CONTENT_TYPE': 'application/json',
+    'CONTENT_LENGTH': str(len(body)),
+    'wsgi.input': io.BytesIO(body),
+    'wsgi.url_scheme': 'http',
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': False,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+  }
+
+def worker(args):
+  seed, user_ids, seconds, write_ratio = args
+  from django.core.handlers.wsgi import WSGIHandler
+  from django.core.signals import got_request_exception
+
+  errors = []
+  got_request_exception.connect(lambda sender, request, **kwargs: errors.append(str(sys.exc_info()[1])), weak=False)
+  handler = WSGIHandler()
+  rng = random.Random(seed)
+  today = datetime.date.today()
+  counts = {'reads': 0, 'writes': 0, 'lock_errors': 0, 'other_errors': 0}
+
+  def start_response(status, headers):
+    pass
+
+  deadline = time.perf_counter() + seconds
+  while time.perf_counter() < deadline:
+    pk = rng.choice(user_ids)
+    if rng.random() < write_ratio:
+      kind = 'writes'
+      date = today - datetime.timedelta(days=rng.randrange(365))
+      env = environ('POST', f'/api/users/{pk}/incomes', {'user': pk, 'amount': '12.50', 'source': 'SALARY', 'date': date.isoformat()})
+    else:
+      kind = 'reads'
+      if rng.random() < 0.5:
+        env = environ('GET', f'/api/users/{pk}/incomes')
+      else:
+        env = environ('GET', f'/api/users/{pk}/netIncome?year={today.year}&month={today.month}&day={today.day}')
+    del errors[:]
+    response = handler(env, start_response)
+    b''.join(response)
+    # Fires request_finished, which closes the connection unless CONN_MAX_AGE keeps it
+    response.close()
+    if response.status_code < 400:
+      counts[kind] += 1
+    elif any('database is locked' in error for error in errors):
+      counts['lock_errors'] += 1
+    else:
+      counts['other_errors'] += 1
+  return counts
+
+def run_profile(args):
+  # In the process of one profile: settings come from its environment
+  setup()
+  from django.conf import settings
+  from django.db import connections
+  from django.test.utils import override_settings
+  from app.models import User
+
+  directory = tempfile.mkdtemp()
+  database = settings.DATABASES['default']
+  if database['ENGINE'].endswith('sqlite3'):
+    database.setdefault('TEST', {})['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+
+  caches = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'analytics': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+  }
+  with test_database(), override_settings(CACHES=caches, DEBUG=False, ALLOWED_HOSTS=['testserver']):
+    user_ids = [
+      User.objects.create(username=f'bench{u}', email=f'bench{u}@email.com').id
+      for u in range(args.users)
+    ]
+    # Forked workers open their own connections
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    with context.Pool(args.workers) as pool:
+      start = time.perf_counter()
+      results = pool.map(worker, [(seed, user_ids, args.seconds, args.write_ratio) for seed in range(args.workers)])
+      elapsed = time.perf_counter() - start
+    connections.close_all()
+
+  total = {name: sum(result[name] for result in results) for name in results[0]}
+  total['seconds'] = elapsed
+  print(json.dumps(total))
+
+def report(name, total):
+  requests = total['reads'] + total['writes'] + total['lock_errors'] + total['other_errors']
+  rate = total['lock_errors'] / requests if requests else 0
+  print(
+    f"{name:20} {(total['reads'] + total['writes']) / total['seconds']:8.1f} req/s"
+    f"   reads {total['reads']:6}   writes {total['writes']:6}"
+    f"   lock errors {total['lock_errors']:5} ({rate:6.2%})   other errors {total['other_errors']}"
+  )
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--engine', choices=PROFILES, default='sqlite')
+  parser.add_argument('--workers', type=int, default=8)
+  parser.add_argument('--seconds', type=float, default=10)
+  parser.add_argument('--write-ratio', type=float, default=0.3)
+  parser.add_argument('--users', type=int, default=20)
+  parser.add_argument('--run-profile', action='store_true', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.run_profile:
+    run_profile(args)
+    return
+
+  print(f"{args.workers} workers for {args.seconds:g} s, {args.write_ratio:.0%} writes")
+  backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  for name, env in PROFILES[args.engine]:
+    process = subprocess.run(
+      [sys.executable, '-m', 'benchmarks.database', '--run-profile', *sys.argv[1:]],
+      cwd=backend, env={**os.environ, **env}, capture_output=True, text=True,
+    )
+    if process.returncode:
+      sys.exit(f"{name} failed:\n{process.stderr}")
+    report(name, json.loads(process.stdout.strip().splitlines()[-1]))
+
+if __name__ == '__main__':
+  main()
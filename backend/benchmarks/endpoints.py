@@ -0,0 +1,206 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+from . import setup, test_database
+
+"""
+Every endpoint of app/urls.py against synthetic ledgers (see
+app/synthetic.py): wall time, SQL queries, and rows scanned per request.
+Results are compared with baseline.json, and the run fails when an
+endpoint makes more queries, or is slower or scans more rows by more than
+the tolerance. Update the baseline with --update-baseline after an
+intended change, and commit it.
+
+Rows scanned are the rows SQLite stepped through in full table scans
+(SQLITE_STMTSTATUS_FULLSCAN_STEP, read from the sqlite_stmt table), so an
+index that is no longer used shows up even when the query count does not
+change. Other databases report no rows scanned.
+
+The analytics cache is disabled and no ETags are sent, so every request is
+computed. Writes run last, on their own rows.
+"""
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+def cases(user_id, income_id, expense_id, today):
+  """
+  (name, route, method, path, request kwargs) for every route, with the
+  route as written in app/urls.py.
+  """
+  from django.core.files.uploadedfile import SimpleUploadedFile
+  csv = b'kind,date,amount,category,description\n' + b''.join(
+    f'expense,{today.isoformat()},{n}.50,FOOD,Lunch\n'.encode() for n in range(50)
+  )
+  batch = {'operations': [
+    {'op': 'create', 'data': {'amount': f'{n}.25', 'category': 'FOOD', 'date': today.isoformat()}} for n in range(50)
+  ]}
+  day = f'year={today.year}&month={today.month}&day={today.day}'
+  json_body = {'content_type': 'application/json'}
+  return [
+    ('users', 'users/', 'get', '/api/users/', {}),
+    ('users-expand', 'users/', 'get', '/api/users/?expand=incomes,expenses', {}),
+    ('user', 'users/<int:pk>/', 'get', f'/api/users/{user_id}/', {}),
+    ('incomes', 'users/<int:pk>/incomes', 'get', f'/api/users/{user_id}/incomes', {}),
+    ('incomes-month', 'users/<int:pk>/incomes', 'get', f'/api/users/{user_id}/incomes?year={today.year}&month={today.month}', {}),
+    ('expenses', 'users/<int:pk>/expenses', 'get', f'/api/users/{user_id}/expenses', {}),
+    ('expenses-category', 'users/<int:pk>/expenses', 'get', f'/api/users/{user_id}/expenses?category=FOOD', {}),
+    ('export', 'users/<int:pk>/export', 'get', f'/api/users/{user_id}/export', {}),
+    ('netIncome', 'users/<int:pk>/netIncome', 'get', f'/api/users/{user_id}/netIncome?{day}', {}),
+    ('graphData-1m', 'users/<int:pk>/graphData', 'get', f'/api/users/{user_id}/graphData?scale=1m', {}),
+    ('graphData-6m', 'users/<int:pk>/graphData', 'get', f'/api/users/{user_id}/graphData?scale=6m', {}),
+    ('graphData-1y', 'users/<int:pk>/graphData', 'get', f'/api/users/{user_id}/graphData?scale=1y', {}),
+    ('upcomingExpenses', 'users/<int:pk>/upcomingExpenses', 'get', f'/api/users/{user_id}/upcomingExpenses', {}),
+    ('budget', 'users/<int:pk>/budget', 'get', f'/api/users/{user_id}/budget?incomeGoal=true&expenseBudget=true', {}),
+    ('forecast', 'users/<int:pk>/forecast', 'get', f'/api/users/{user_id}/forecast', {}),
+    ('dashboard', 'users/<int:pk>/dashboard', 'get', f'/api/users/{user_id}/dashboard', {}),
+    ('income', 'income/<int:pk>', 'get', f'/api/income/{income_id}', {}),
+    ('expense', 'expense/<int:pk>', 'get', f'/api/expense/{expense_id}', {}),
+    ('incomes-batch', 'users/<int:pk>/incomes/batch', 'post', f'/api/users/{user_id}/incomes/batch',
+     {'data': {'operations': [{'op': 'patch', 'id': income_id, 'data': {'description': 'Benchmark'}}]}, **json_body}),
+    ('expenses-batch', 'users/<int:pk>/expenses/batch', 'post', f'/api/users/{user_id}/expenses/batch', {'data': batch, **json_body}),
+    ('import', 'users/<int:pk>/import', 'post', f'/api/users/{user_id}/import',
+     {'data': lambda: {'file': SimpleUploadedFile('ledger.csv', csv)}}),
+  ]
+
+def routes():
+  # The routes of app/urls.py, without the format suffix variants
+  from app import urls
+  return {str(pattern.pattern) for pattern in urls.urlpatterns if 'format' not in pattern.pattern.converters}
+
+@contextlib.contextmanager
+def scanned_rows(connection, result):
+  """
+  Set result['rows_scanned'] to the full scan steps of the statements run
+  inside the block, or to None on other databases.
+  """
+  if connection.vendor != 'sqlite':
+    result['rows_scanned'] = None
+    yield
+    return
+
+  def steps():
+    with connection.cursor() as cursor:
+      return dict(cursor.execute('SELECT sql, nscan FROM sqlite_stmt').fetchall())
+
+  connection.ensure_connection()
+  before = steps()
+  yield
+  after = steps()
+  # Statements are kept prepared (and counting) by sqlite3's statement cache
+  result['rows_scanned'] = sum(count - before.get(sql, 0) for sql, count in after.items())
+
+def measure(client, method, path, kwargs, repeat):
+  """
+  Median wall time in ms, query count and rows scanned of one request,
+  repeated.
+  """
+  from django.db import connection
+  from django.test.utils import CaptureQueriesContext
+  times = []
+  result = {}
+  for _ in range(repeat):
+    kwargs = {name: value() if callable(value) else value for name, value in kwargs.items()}
+    with scanned_rows(connection, result), CaptureQueriesContext(connection) as queries:
+      start = time.perf_counter()
+      response = getattr(client, method)(path, **kwargs)
+      times.append((time.perf_counter() - start) * 1000)
+    assert response.status_code < 400, f"{path}: {response.status_code} {response.content[:200]}"
+  result['queries'] = len(queries)
+  result['ms'] = round(statistics.median(times), 2)
+  return result
+
+def run(users, years, repeat, seed, today=None):
+  """
+  Measure every case against a fresh synthetic dataset. Runs inside a test
+  database.
+  """
+  from django.test import Client
+  from django.test.utils import override_settings
+  from app import synthetic
+  from app.models import Income, Expense
+
+  today = today or datetime.date.today()
+  user_ids = synthetic.generate(users=users, years=years, seed=seed, today=today)
+  user_id = user_ids[len(user_ids) // 2]
+  income_id = Income.objects.filter(user=user_id).values_list('id', flat=True).first()
+  expense_id = Expense.objects.filter(user=user_id).values_list('id', flat=True).first()
+
+  all_cases = cases(user_id, income_id, expense_id, today)
+  missing = routes() - {route for name, route, method, path, kwargs in all_cases}
+  if missing:
+    raise AssertionError(f"No benchmark case for {', '.join(sorted(missing))}")
+
+  caches = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'analytics': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+  }
+  results = {}
+  client = Client()
+  with override_settings(CACHES=caches, DEBUG=False, ALLOWED_HOSTS=['testserver']):
+    # Some views print their params
+    with contextlib.redirect_stdout(io.StringIO()):
+      for name, route, method, path, kwargs in all_cases:
+        results[name] = measure(client, method, path, kwargs, 1 if method != 'get' else repeat)
+  return results
+
+def compare(results, baseline, tolerance):
+  # The regressions of results over baseline, as messages
+  failures = []
+  for name, result in results.items():
+    expected = baseline.get(name)
+    if expected is None:
+      failures.append(f"{name}: not in the baseline")
+      continue
+    if result['queries'] > expected['queries']:
+      failures.append(f"{name}: {result['queries']} queries, baseline {expected['queries']}")
+    # Latency gets an extra millisecond of slack for the fastest endpoints
+    if result['ms'] > expected['ms'] * tolerance + 1:
+      failures.append(f"{name}: {result['ms']} ms, baseline {expected['ms']} ms")
+    if None not in (result['rows_scanned'], expected.get('rows_scanned')):
+      if result['rows_scanned'] > expected['rows_scanned'] * tolerance:
+        failures.append(f"{name}: {result['rows_scanned']} rows scanned, baseline {expected['rows_scanned']}")
+  return failures
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--users', type=int, default=20)
+  parser.add_argument('--years', type=int, default=3)
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--tolerance', type=float, default=1.5,
+                      help="Allowed ratio over the baseline for latency and rows scanned (queries allow none).")
+  parser.add_argument('--baseline', default=BASELINE)
+  parser.add_argument('--update-baseline', action='store_true')
+  args = parser.parse_args()
+
+  setup()
+  with test_database():
+    results = run(args.users, args.years, args.repeat, args.seed)
+
+  print(f"{args.users} users x {args.years} years, median of {args.repeat}")
+  for name, result in results.items():
+    rows = '-' if result['rows_scanned'] is None else result['rows_scanned']
+    print(f"{name:20} {result['ms']:9.2f} ms {result['queries']:5} queries {rows:>9} rows scanned")
+
+  if args.update_baseline:
+    with open(args.baseline, 'w') as file:
+      json.dump(results, file, indent=2)
+      file.write('\n')
+    print(f"Baseline written to {args.baseline}")
+    return
+
+  with open(args.baseline) as file:
+    failures = compare(results, json.load(file), args.tolerance)
+  if failures:
+    sys.exit("Regressions over the baseline:\n" + '\n'.join(failures))
+  print("Within the baseline.")
+
+if __name__ == '__main__':
+  main()
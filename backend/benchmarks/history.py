@@ -0,0 +1,70 @@
+import argparse
+import contextlib
+import datetime
+import io
+import statistics
+import time
+
+from . import setup, test_database
+
+"""
+Latency of the endpoints that add up a user's whole history (netIncome,
+graphData) as the history grows from one year to decades, and of the
+analytics queries behind them alone, which Django's request overhead
+hides. One synthetic user per length; the analytics cache is disabled.
+"""
+
+def paths(user_id, today):
+  return {
+    'netIncome': f'/api/users/{user_id}/netIncome?year={today.year}&month={today.month}&day={today.day}',
+    'graphData-6m': f'/api/users/{user_id}/graphData?scale=6m',
+    'graphData-3y': f'/api/users/{user_id}/graphData?scale=3y',
+  }
+
+def queries(user_id, today):
+  from app import analytics
+  return {
+    'range_totals': lambda: analytics.range_totals(user_id, None, today),
+    'bucket_sums-6m': lambda: analytics.bucket_sums(user_id, analytics.get_buckets('6m', today), today),
+    'bucket_sums-3y': lambda: analytics.bucket_sums(user_id, analytics.get_buckets('3y', today), today),
+  }
+
+def median_ms(function, repeat):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    function()
+    times.append((time.perf_counter() - start) * 1000)
+  return statistics.median(times)
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--years', type=int, nargs='+', default=[1, 5, 10, 20, 40])
+  parser.add_argument('--repeat', type=int, default=50)
+  args = parser.parse_args()
+
+  setup()
+  from django.test import Client
+  from django.test.utils import override_settings
+  from app import synthetic
+
+  caches = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'analytics': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+  }
+  today = datetime.date.today()
+  with test_database():
+    users = {years: synthetic.generate(users=1, years=years, seed=years, today=today)[0] for years in args.years}
+    client = Client()
+    lines = []
+    with override_settings(CACHES=caches, DEBUG=False, ALLOWED_HOSTS=['testserver']), contextlib.redirect_stdout(io.StringIO()):
+      for years, user_id in users.items():
+        cells = [median_ms(lambda: client.get(path), args.repeat) for path in paths(user_id, today).values()]
+        cells += [median_ms(query, args.repeat) for query in queries(user_id, today).values()]
+        lines.append(f"{years:>5}" + ''.join(f"{cell:15.2f}" for cell in cells))
+  print(f"Median ms over {args.repeat} runs")
+  print(f"{'years':>5}" + ''.join(f"{name:>15}" for name in [*paths(0, today), *queries(0, today)]))
+  print('\n'.join(lines))
+
+if __name__ == '__main__':
+  main()
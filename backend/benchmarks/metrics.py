@@ -0,0 +1,102 @@
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+from . import setup, test_database
+
+"""
+Overhead of the request metrics (app/metrics.py). First the cost of the
+middleware around a trivial view and of the query wrapper around a no-op
+query, then the same requests against synthetic ledgers with
+MetricsMiddleware disabled, enabled, and enabled with every request's
+queries captured (the analytics cache is disabled). The second is closer
+to real use, but noisier.
+"""
+
+MODES = [
+  ('off', {'METRICS_ENABLED': False}),
+  ('on', {'METRICS_ENABLED': True}),
+  ('on, all sampled', {'METRICS_ENABLED': True, 'METRICS_QUERY_SAMPLE_RATE': 1}),
+]
+
+def paths(user_id):
+  return [
+    f'/api/users/{user_id}/incomes',
+    f'/api/users/{user_id}/expenses',
+    f'/api/users/{user_id}/graphData?scale=6m',
+    f'/api/users/{user_id}/budget?incomeGoal=true&expenseBudget=true',
+    f'/api/users/{user_id}/',
+  ]
+
+def run(paths, rounds):
+  from django.test import Client
+  # A new client builds its handler, and the middleware, with the current settings
+  client = Client()
+  times = []
+  for _ in range(rounds):
+    start = time.perf_counter()
+    for path in paths:
+      assert client.get(path).status_code == 200, path
+    times.append((time.perf_counter() - start) / len(paths))
+  return statistics.median(times)
+
+def micro(number):
+  import timeit
+  from django.http import HttpResponse
+  from django.test import RequestFactory
+  from django.urls import resolve
+  from app import metrics
+
+  request = RequestFactory().get('/api/users/1/incomes')
+  request.resolver_match = resolve(request.path)
+  middleware = metrics.MetricsMiddleware(lambda request: HttpResponse())
+  print(f"middleware       {timeit.timeit(lambda: middleware(request), number=number) / number * 1e6:8.2f} us per request")
+
+  def execute(sql, params, many, context):
+    pass
+
+  def query():
+    metrics.time_query(execute, 'SELECT 1', (), False, {})
+
+  for name, measure in [('no request', None), ('measured', metrics.RequestMetrics(False)), ('sampled', metrics.RequestMetrics(True))]:
+    token = metrics.current.set(measure)
+    print(f"query, {name:9} {timeit.timeit(query, number=number) / number * 1e6:8.2f} us per query")
+    metrics.current.reset(token)
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--rounds', type=int, default=100)
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+
+  setup()
+  import logging
+  from django.test.utils import override_settings
+  from app import synthetic
+
+  caches = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'analytics': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+  }
+  # The sampled queries are logged: time the capture, not the output
+  logging.getLogger('app.metrics').setLevel(logging.WARNING)
+  micro(20000)
+  with test_database():
+    user_id = synthetic.generate(users=2, years=2)[0]
+    print(f"Median time per request over {args.rounds} rounds of {len(paths(user_id))} endpoints, best of {args.repeat}")
+    # Modes take turns, and each keeps its best run, to even out warm-up and noise
+    results = {}
+    for _ in range(args.repeat):
+      for name, values in MODES:
+        with override_settings(CACHES=caches, DEBUG=False, ALLOWED_HOSTS=['testserver'], **values):
+          with contextlib.redirect_stdout(io.StringIO()):
+            result = run(paths(user_id), args.rounds)
+        results[name] = min(results.get(name, result), result)
+    baseline = results[MODES[0][0]]
+    for name, result in results.items():
+      print(f"{name:16} {result * 1000:8.3f} ms   overhead {(result - baseline) * 1e6:7.1f} us ({result / baseline - 1:+.1%})")
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,70 @@
+import argparse
+import datetime
+import time
+from decimal import Decimal
+
+from . import setup, test_database
+
+"""
+Amounts stored as cents (app/money.py), on the expenses of one user: the
+sums per category and the amounts read, as Decimal through CentsField and
+as the ints of cents the analytics and list code use, then the formatting
+of the amounts for the API.
+"""
+
+def best_of(repeat, function):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = function()
+    times.append(time.perf_counter() - start)
+  return min(times), result
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--rows', type=int, default=200000)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  setup()
+  from django.db.models import Sum
+  from app.models import User, Expense
+  from app.money import cents, sum_cents, from_cents, format_cents
+
+  with test_database():
+    user = User.objects.create(username='bench', email='bench@email.com')
+    start = datetime.date(2015, 1, 1)
+    categories = [choice[0] for choice in Expense.EXPENSE_CATEGORY_CHOICES]
+    Expense.objects.bulk_create([
+      Expense(
+        user=user,
+        amount=Decimal(i % 100000) / 100,
+        category=categories[i % len(categories)],
+        date=start + datetime.timedelta(days=i % 3000),
+      )
+      for i in range(args.rows)
+    ], batch_size=5000)
+    expenses = Expense.objects.filter(user=user)
+
+    results = {}
+    results['sum, Decimal'], decimal_sums = best_of(args.repeat, lambda: dict(
+      expenses.values_list('category').annotate(total=Sum('amount')).order_by()
+    ))
+    results['sum, cents'], cent_sums = best_of(args.repeat, lambda: dict(
+      expenses.values_list('category').annotate(total=sum_cents('amount')).order_by()
+    ))
+    assert {category: from_cents(total) for category, total in cent_sums.items()} == decimal_sums
+
+    results['read, Decimal'], amounts = best_of(args.repeat, lambda: list(expenses.values_list('amount', flat=True)))
+    results['read, cents'], amount_cents = best_of(args.repeat, lambda: list(expenses.values_list(cents('amount'), flat=True)))
+
+    results['format, Decimal'], expected = best_of(args.repeat, lambda: ['{:f}'.format(amount) for amount in amounts])
+    results['format, cents'], formatted = best_of(args.repeat, lambda: [format_cents(amount) for amount in amount_cents])
+    assert formatted == expected
+
+    print(f"{args.rows} rows, best of {args.repeat}")
+    for name, seconds in results.items():
+      print(f"{name:16} {seconds * 1000:9.1f} ms")
+
+if __name__ == '__main__':
+  main()
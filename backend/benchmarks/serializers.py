@@ -0,0 +1,57 @@
+import argparse
+import datetime
+import time
+from decimal import Decimal
+
+from . import setup, test_database
+
+"""
+DRF ModelSerializer against the values_list() read path of the ledger
+lists, on the rows of one user
+"""
+
+def best_of(repeat, function):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = function()
+    times.append(time.perf_counter() - start)
+  return min(times), result
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--rows', type=int, default=100000)
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+
+  setup()
+  from app.models import User, Expense
+  from app.serializers import ExpenseSerializer, expense_values
+
+  with test_database():
+    user = User.objects.create(username='bench', email='bench@email.com')
+    start = datetime.date(2015, 1, 1)
+    categories = [choice[0] for choice in Expense.EXPENSE_CATEGORY_CHOICES]
+    Expense.objects.bulk_create([
+      Expense(
+        user=user,
+        amount=Decimal(i % 10000) / 100,
+        category=categories[i % len(categories)],
+        description=f'Expense {i}',
+        date=start + datetime.timedelta(days=i % 3000),
+      )
+      for i in range(args.rows)
+    ], batch_size=5000)
+    expenses = Expense.objects.filter(user=user).order_by('-date', '-id')
+
+    drf, expected = best_of(args.repeat, lambda: ExpenseSerializer(expenses.all(), many=True).data)
+    fast, data = best_of(args.repeat, lambda: expense_values.data(expense_values.values_list(expenses.all())))
+    assert data == [dict(row) for row in expected]
+
+    print(f"{args.rows} rows, best of {args.repeat}")
+    print(f"ModelSerializer  {drf * 1000:9.1f} ms")
+    print(f"ValuesSerializer {fast * 1000:9.1f} ms")
+    print(f"speedup          {drf / fast:9.1f}x")
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+"""
+Startup time of a management command and of a gunicorn worker, each in a
+fresh interpreter run with python -X importtime: the wall time until the
+process is ready, and the import time of the heaviest packages. The run
+fails when the median wall time of a process is over its budget, or when
+it imports one of the packages that only some views need (DEFERRED).
+
+A worker is measured up to its first request: the WSGI application and
+the URLconf, which Django loads with the first request. The command is
+`manage.py check`, which loads the URLconf as well, like every command
+that runs the system checks. Both use a throwaway SQLite file rather
+than db.sqlite3.
+"""
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROCESSES = {
+  'manage.py': ['manage.py', 'check'],
+  'worker': ['-c', (
+    "import backend.wsgi\n"
+    "from django.urls import get_resolver\n"
+    "get_resolver().url_patterns\n"
+  )],
+}
+
+# Median wall ms
+BUDGETS = {
+  'manage.py': 1000,
+  'worker': 1000,
+}
+
+# Imported by their views on first use
+DEFERRED = ['authlib', 'jwt', 'numpy']
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def run(arguments):
+  # Wall ms, and {top-level package: cumulative import ms}
+  with tempfile.TemporaryDirectory() as directory:
+    environment = dict(
+      os.environ,
+      DJANGO_SETTINGS_MODULE='backend.settings',
+      SQLITE_PATH=os.path.join(directory, 'db.sqlite3'),
+    )
+    start = time.perf_counter()
+    process = subprocess.run(
+      [sys.executable, '-X', 'importtime', *arguments],
+      cwd=BACKEND, env=environment, capture_output=True, text=True,
+    )
+    wall = (time.perf_counter() - start) * 1000
+  if process.returncode:
+    sys.exit(f"{' '.join(arguments)} failed:\n{process.stderr}")
+  packages = {}
+  for line in process.stderr.splitlines():
+    match = LINE.match(line)
+    if match:
+      package = match[4].split('.')[0]
+      packages[package] = max(packages.get(package, 0), int(match[2]) / 1000)
+  return wall, packages
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--repeat', type=int, default=10)
+  parser.add_argument('--top', type=int, default=8, help="heaviest packages to list")
+  args = parser.parse_args()
+
+  failures = []
+  for name, arguments in PROCESSES.items():
+    runs = [run(arguments) for _ in range(args.repeat)]
+    wall = statistics.median(wall for wall, packages in runs)
+    packages = {package: statistics.median(run[1].get(package, 0) for run in runs) for package in runs[0][1]}
+    print(f"{name}: {wall:.0f} ms median of {args.repeat}, budget {BUDGETS[name]} ms")
+    for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+      print(f"  {package:24} {ms:7.1f} ms")
+    if wall > BUDGETS[name]:
+      failures.append(f"{name}: {wall:.0f} ms, budget {BUDGETS[name]} ms")
+    imported = [package for package in DEFERRED if package in packages]
+    if imported:
+      failures.append(f"{name}: imports {', '.join(imported)}")
+  if failures:
+    sys.exit("Over the startup budget:\n" + '\n'.join(failures))
+  print("Within the budget.")
+
+if __name__ == '__main__':
+  main()
@@ -13,9 +13,8 @@ import { ExpenseModel } from "../services/models";
 import { JSONObject, JSONArray, JSONValue } from "../util/json";
 import { ExpenseListDeserializer } from "../services/deserializers";
 import budgetService from "../services/budget.service";
-import netIncomeService from "../services/net-income.service";
-import graphDataService from "../services/graph-data.service";
-import upcomingExpensesService from "../services/upcoming-expenses.service";
+import dashboardService from "../services/dashboard.service";
+import graphDataService, { Data as GraphData } from "../services/graph-data.service";
 
 // Util functions
 import { Map, getKeys, getValues } from "../util/utils";
@@ -44,67 +43,46 @@ function Budget(){
   });
 
   /**
-   * Retrieve user's income goal and total income this month.
+   * Show the money flow and net income history of the graph.
    */
-  const fetchIncomeGoal = async() => {
-    budgetService.get(tmpUserID, "incomeGoal=true")
-    .then(response => {
-      if (response.status === 200) {
-        // success
-        console.log(response.data);
-        setIncomeGoal(response.data.income_goal);
-        setMonthlyTotalIncome(response.data.monthly_total_income);
-      } else {
-        // failure
-        setError({
-          code: 'Unknown Error',
-          message: 'Unable to fetch data.'
-        });
-      }
-    })
-    .catch(error => {
-      // failure
-      console.error('Error:', error);
-      setError(error);
+  const showGraphData = (graphData:GraphData) => {
+    const keys = getKeys(graphData.net_income_flow);
+    const values = getValues(graphData.net_income_flow);
+    const history = getValues(graphData.net_income_list)
+    console.log(keys, values, history);
+    setData({
+      labels: keys,
+      datasets: [{
+        label: 'Money Flow',
+        data: values
+      }, {
+        label: 'Net Income History',
+        data: history
+      }]
     });
   }
 
   /**
-   * Retrieve user's expense budget and total expense this month.
+   * Retrieve the income goal, the expense budget, the net income so far,
+   * the graph and the recurring expenses in next 30 days,
+   * in one request.
    */
-  const fetchExpenseBudget = async() => {
-    budgetService.get(tmpUserID, "expenseBudget=true")
+  const fetchDashboard = async() => {
+    dashboardService.get(tmpUserID, ['netIncome', 'graphData', 'budget', 'upcomingExpenses'], graphScale || '6m')
     .then(response => {
-      if (response.status === 200) {
+      const {netIncome, graphData, budget, upcomingExpenses} = response.data;
+      if (response.status === 200 && netIncome && graphData && budget && upcomingExpenses) {
         // success
         console.log(response.data);
-        setExpenseBudget(response.data.expense_budget);
-        setMonthlyTotalExpense(response.data.monthly_total_expense);
-      } else {
-        // failure
-        setError({
-          code: 'Unknown Error',
-          message: 'Unable to fetch data.'
-        });
-      }
-    })
-    .catch(error => {
-      // failure
-      console.error('Error:', error);
-      setError(error);
-    });
-  }
-
-  /**
-   * Retrieve the amount of net income so far.
-   */
-  const fetchNetIncome = async() => {
-    netIncomeService.get(tmpUserID)
-    .then(response => {
-      if (response.status === 200) {
-        // success
-        console.log(response.data);
-        setNetIncome(parseFloat(response.data['net_income'] as string));
+        setIncomeGoal(budget.income_goal);
+        setMonthlyTotalIncome(budget.monthly_total_income);
+        setExpenseBudget(budget.expense_budget);
+        setMonthlyTotalExpense(budget.monthly_total_expense);
+        setNetIncome(parseFloat(netIncome['net_income'] as string));
+        showGraphData(graphData);
+        const expenseListDeserializer = new ExpenseListDeserializer(upcomingExpenses);
+        setUpcomingExpenses(expenseListDeserializer.data());
+        setLoaded(true);
       } else {
         // failure
         setError({
@@ -122,6 +100,7 @@ function Budget(){
 
   /**
    * Retrieve the net income data of the previous 5 months + current month
+   * when the scale of the graph changes.
    */
   const fetchGraphData = async() => {
     graphDataService.get(tmpUserID, graphScale)
@@ -129,21 +108,7 @@ function Budget(){
       if (response.status === 200) {
         // success
         //console.log(response.data);
-        const keys = getKeys(response.data.net_income_flow);
-        const values = getValues(response.data.net_income_flow);
-        const history = getValues(response.data.net_income_list)
-        console.log(keys, values, history);
-        setData({
-          labels: keys,
-          datasets: [{
-            label: 'Money Flow',
-            data: values
-          }, {
-            label: 'Net Income History',
-            data: history
-          }]
-        });
-        console.log(data);
+        showGraphData(response.data);
       } else {
         // failure
         setError({
@@ -159,49 +124,20 @@ function Budget(){
     });
   }
 
-  /**
-   * Retrieve recurring expenses in next 30 days
-   */
-  const fetchUpcomingExpensesList = async() => {
-    upcomingExpensesService.get(tmpUserID)
-    .then(response => {
-      if (response.status === 200) {
-        // success
-        console.log(response.data);
-        const expenseListDeserializer = new ExpenseListDeserializer(response.data);
-        setUpcomingExpenses(expenseListDeserializer.data());
-      } else {
-        // failure
-        setError({
-          code: 'Unknown Error',
-          message: 'Unable to fetch data.'
-        });
-      }
-    })
-    .catch(error => {
-      // failure
-      console.error('Error:', error);
-      setError(error);
-    });
-  }
-
-  const fetchAPI = async() => {
-    await fetchIncomeGoal();
-    await fetchExpenseBudget();
-    await fetchNetIncome();
-    //await fetchGraphData();
-    await fetchUpcomingExpensesList();
-    await setLoaded(true);
-  }
-  
   // Set title
   useEffect(() => {
     document.title = 'Birdie!';
     if (!loaded) {
-      fetchAPI();
+      fetchDashboard();
+    }
+  }, [loaded]);
+
+  // The graph of the default scale comes with the dashboard
+  useEffect(() => {
+    if (graphScale !== '') {
+      fetchGraphData();
     }
-    fetchGraphData();
-  }, [loaded, graphScale]);
+  }, [graphScale]);
   
   const [incomeToggle, setIncomeToggle] = useState(false);
   // let incomeGoalForm;
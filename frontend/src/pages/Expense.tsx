@@ -29,6 +29,8 @@ function Expense(){
   const [expenseList, setExpenseList] = useState(Array<ExpenseModel>);
   // Stat data
   const [dataset, setDataset] = useState<Map>();
+  // Link to the next page of the list, null on the last page
+  const [next, setNext] = useState<string|null>(null);
 
   // States for conditional query
   const [year, setYear] = useState<number>((new DateField()).year);
@@ -56,6 +58,7 @@ function Expense(){
         const expenseListDeserializer = new ExpenseListDeserializer(response.data.list);
         setExpenseList(expenseListDeserializer.data());
         setDataset(response.data.stat);
+        setNext(response.data.next);
         setLoaded(true);
       } else {
         // failure
@@ -220,6 +223,37 @@ function Expense(){
     setActive(false);
   }
 
+  /**
+   * A callback function activated when the 'Load more' button
+   * under the list is clicked.
+   * Appends the next page of the expense list.
+   */
+  const handleLoadMore = async() => {
+    if (next === null) {
+      return;
+    }
+    ExpenseService.retrieveNext(next)
+    .then(response => {
+      if (response.status === 200) {
+        // success
+        const expenseListDeserializer = new ExpenseListDeserializer(response.data.list);
+        setExpenseList(expenseList.concat(expenseListDeserializer.data()));
+        setNext(response.data.next);
+      } else {
+        // failure
+        setError({
+          code: 'Unknown Error',
+          message: 'Unable to fetch data.'
+        });
+      }
+    })
+    .catch(error => {
+      // failure
+      console.error('Error:', error);
+      setError(error);
+    });
+  }
+
   /**
    * A callback function activated when one of the tags
    * is clicked.
@@ -305,6 +339,15 @@ function Expense(){
                 onEditClick={handleEditClick} 
                 onDeleteClick={handleDeleteClick}
               />
+              { // The rest of the month is loaded on demand
+                next !== null &&
+                <button
+                  className="button is-small is-dark is-outlined is-fullwidth mt-3"
+                  onClick={handleLoadMore}
+                >
+                  Load more
+                </button>
+              }
             </div>
           </div>
         </div>
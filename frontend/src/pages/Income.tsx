@@ -29,6 +29,8 @@ function Income(){
   const [incomeList, setIncomeList] = useState(Array<IncomeModel>);
   // Stat data
   const [dataset, setDataset] = useState<Map>();
+  // Link to the next page of the list, null on the last page
+  const [next, setNext] = useState<string|null>(null);
 
   // States for conditional query
   const [year, setYear] = useState<number>((new DateField()).year);
@@ -57,6 +59,7 @@ function Income(){
         const incomeListDeserializer = new IncomeListDeserializer(response.data.list);
         setIncomeList(incomeListDeserializer.data());
         setDataset(response.data.stat);
+        setNext(response.data.next);
         setLoaded(true);
       } else {
         // failure
@@ -221,6 +224,37 @@ function Income(){
     setActive(false);
   }
 
+  /**
+   * A callback function activated when the 'Load more' button
+   * under the list is clicked.
+   * Appends the next page of the income list.
+   */
+  const handleLoadMore = async() => {
+    if (next === null) {
+      return;
+    }
+    IncomeService.retrieveNext(next)
+    .then(response => {
+      if (response.status === 200) {
+        // success
+        const incomeListDeserializer = new IncomeListDeserializer(response.data.list);
+        setIncomeList(incomeList.concat(incomeListDeserializer.data()));
+        setNext(response.data.next);
+      } else {
+        // failure
+        setError({
+          code: 'Unknown Error',
+          message: 'Unable to fetch data.'
+        });
+      }
+    })
+    .catch(error => {
+      // failure
+      console.error('Error:', error);
+      setError(error);
+    });
+  }
+
   /**
    * A callback function activated when one of the tags
    * is clicked.
@@ -304,6 +338,15 @@ function Income(){
                 onEditClick={handleEditClick} 
                 onDeleteClick={handleDeleteClick}
               />
+              { // The rest of the month is loaded on demand
+                next !== null &&
+                <button
+                  className="button is-small is-dark is-outlined is-fullwidth mt-3"
+                  onClick={handleLoadMore}
+                >
+                  Load more
+                </button>
+              }
             </div>
           </div>
         </div>
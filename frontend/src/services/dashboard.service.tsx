@@ -0,0 +1,30 @@
+import http from "../http-common"
+import { JSONObject, JSONArray } from "../util/json";
+import { Data as GraphData } from "./graph-data.service";
+
+export interface BudgetData {
+  income_goal: number;
+  monthly_total_income: number;
+  expense_budget: number;
+  monthly_total_expense: number;
+}
+
+// Sections: netIncome, graphData, budget, upcomingExpenses, incomes, expenses
+// Each one holds the response of the endpoint of the same name,
+// and only the sections asked for are in the response.
+export interface DashboardData {
+  netIncome?: JSONObject;
+  graphData?: GraphData;
+  budget?: BudgetData;
+  upcomingExpenses?: JSONArray;
+  incomes?: JSONObject;
+  expenses?: JSONObject;
+}
+
+class DashboardService {
+  get(userId: number, sections: string[] = [], scale: string = "6m") {
+    return http.get<DashboardData>(`/users/${userId}/dashboard?sections=${sections.join(",")}&scale=${scale}`);
+  }
+}
+
+export default new DashboardService();
@@ -7,6 +7,8 @@ import { JSONObject, JSONArray } from "../util/json";
 export interface ExpensesResponseData {
   list: JSONArray;
   stat: JSONArray;
+  // Link to the next page of the list, null on the last page
+  next: string | null;
 }
 
 class ExpenseModelService {
@@ -43,6 +45,11 @@ class ExpenseModelService {
       `/users/${userId}/expenses?year=${year}&month=${month}${category !== null ? `&category=${category}` : ''}`
     );
   }
+
+  // The page after a list response, from its `next` link
+  retrieveNext(next: string) {
+    return http.get<ExpensesResponseData>(next);
+  }
 }
 
 export default new ExpenseModelService();
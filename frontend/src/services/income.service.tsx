@@ -7,6 +7,8 @@ import { JSONObject, JSONArray } from "../util/json";
 export interface IncomeResponseData {
   list: JSONArray;
   stat: JSONArray;
+  // Link to the next page of the list, null on the last page
+  next: string | null;
 }
 
 class IncomeModelService {
@@ -41,6 +43,11 @@ class IncomeModelService {
     //  and find expenses by date.
     return http.get<IncomeResponseData>(`/users/${userId}/incomes?year=${year}&month=${month}${source !== null ? `&source=${source}` : ''}`);
   }
+
+  // The page after a list response, from its `next` link
+  retrieveNext(next: string) {
+    return http.get<IncomeResponseData>(next);
+  }
 }
 
 export default new IncomeModelService();